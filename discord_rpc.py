@@ -1,32 +1,44 @@
 import asyncio
+import concurrent.futures
 import enum
+import functools
 import json
 import os
 import pickle
 import re
 import sys
 import tempfile
+import threading
 import time
 import traceback
-from typing import Optional
+from collections import deque
+from typing import Callable, Optional
 
 import aiofiles
 import emoji
 import psutil
 from discoIPC.ipc import DiscordIPC
-from moviepy.video.io.VideoFileClip import VideoFileClip
-from mutagen.easyid3 import EasyID3
-from mutagen.mp3 import MP3
-from mutagen.mp4 import MP4
-from rapidfuzz import fuzz
 
 from lastfm import LastFM
+from utils.library_index import LibraryIndex
+from utils.loop_lag import LoopLagMonitor
+from utils.scrobble_resolve import build_query, load_scrobble_info
+from utils.track_match import best_match
 from utils.spotify import SpotifyClient
+from utils.tags import is_video, media_exts, read_tags
 
 yt_playlist_regex = re.compile(r'(?:list=)?([a-zA-Z0-9_-]+)')
 
 yt_video_regex = re.compile(r'(?:^|(?<=\W))[-a-zA-Z0-9_]{11}(?:$|(?=\W))')
 
+
+def load_json(path: str, default=None):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
 players = {
             "potplayermini64.exe": {
                 "name": "PotPlayer (x64)",
@@ -142,6 +154,128 @@ class IPCError(Exception):
     def __repr__(self):
         return self.error
 
+
+class ActivityPublisher:
+
+    # o discord aceita no máximo 5 atualizações de atividade a cada 20 segundos.
+    rate_limit = 5
+    rate_window = 20
+
+    max_pipes = 10
+    max_backoff = 300
+
+    def __init__(self, client_id: str, on_connect: Optional[Callable[[MyDiscordIPC], None]] = None):
+        self.client_id = client_id
+        self.on_connect = on_connect
+        self.client: Optional[MyDiscordIPC] = None
+        self.last_pipe = 0
+        self.last_payload: Optional[dict] = None
+        self.pending_payload: Optional[dict] = None
+        self.has_pending = False
+        self.sent_at = deque(maxlen=self.rate_limit)
+        self.flush_task: Optional[asyncio.Task] = None
+        self.connect_task: Optional[asyncio.Task] = None
+        self.backoff = 1
+
+    def ensure_connected(self):
+        if not self.client and (not self.connect_task or self.connect_task.done()):
+            self.connect_task = asyncio.get_running_loop().create_task(self.connect_loop())
+
+    async def connect_loop(self):
+
+        loop = asyncio.get_running_loop()
+
+        while not self.client:
+
+            # tenta primeiro o último pipe que funcionou.
+            for pipe in [self.last_pipe] + [i for i in range(self.max_pipes) if i != self.last_pipe]:
+                rpc = MyDiscordIPC(self.client_id, pipe=pipe)
+                try:
+                    await loop.run_in_executor(None, rpc.connect)
+                except Exception:
+                    continue
+
+                try:
+                    if self.on_connect:
+                        self.on_connect(rpc)
+                except Exception:
+                    traceback.print_exc()
+                    continue
+
+                self.client = rpc
+                self.last_pipe = pipe
+                self.backoff = 1
+                # a atividade atual precisa ser reenviada pra nova conexão.
+                if self.last_payload is not None and not self.has_pending:
+                    self.schedule(self.last_payload)
+                elif self.has_pending:
+                    self.start_flush()
+                return
+
+            await asyncio.sleep(self.backoff)
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+
+    def update(self, payload: dict):
+        if self.has_pending:
+            if payload == self.pending_payload:
+                return
+        elif payload == self.last_payload:
+            return
+        self.schedule(payload)
+
+    def clear(self):
+        if not self.client:
+            # uma nova conexão já inicia sem atividade.
+            self.last_payload = None
+            self.pending_payload = None
+            self.has_pending = False
+            return
+        self.update(None)
+
+    def schedule(self, payload: Optional[dict]):
+        self.pending_payload = payload
+        self.has_pending = True
+        self.start_flush()
+
+    def start_flush(self):
+        if not self.client:
+            self.ensure_connected()
+            return
+        if not self.flush_task or self.flush_task.done():
+            self.flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self):
+
+        loop = asyncio.get_running_loop()
+
+        while self.has_pending and self.client:
+
+            # alterações feitas dentro da janela de limite são agrupadas e apenas a última é enviada.
+            if len(self.sent_at) == self.rate_limit and (
+                    delay := self.sent_at[0] + self.rate_window - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            payload = self.pending_payload
+            self.has_pending = False
+
+            try:
+                if payload is None:
+                    await loop.run_in_executor(None, self.client.clear)
+                else:
+                    await loop.run_in_executor(None, self.client.update_activity, payload)
+            except Exception:
+                traceback.print_exc()
+                if not self.has_pending:
+                    self.pending_payload = payload
+                    self.has_pending = True
+                self.client = None
+                self.ensure_connected()
+                return
+
+            self.sent_at.append(time.monotonic())
+            self.last_payload = payload
+
 class RpcRun:
 
     def __init__(self):
@@ -153,7 +287,8 @@ class RpcRun:
         self.track_number: Optional[str] = None
         self.video_id: Optional[str] = None
         self.track_duration: Optional[int] = None
-        self.rpc_client = None
+        self.scrobble_data: Optional[dict] = None
+        self.publisher = ActivityPublisher("1287237467400962109", on_connect=self.on_rpc_connect)
         self.player_name = None
         self.player_icon = None
         self.current_file = ""
@@ -163,6 +298,14 @@ class RpcRun:
         self.activity_type = ActivityType.listening.value
         self.scrobble_task: Optional[asyncio.Task] = None
         self.loop = None
+        self.libraries = {}
+
+        # leitura de arquivos/tags, psutil e sqlite ficam fora do event loop (não atrasam o ipc e os scrobbles).
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=int(os.getenv("RPC_IO_WORKERS") or 2), thread_name_prefix="rpc_io"
+        )
+        self.scrobble_lock = threading.Lock()
+        self.lag_monitor = LoopLagMonitor(warn_ms=float(os.getenv("RPC_LOOP_LAG_WARN_MS") or 20))
 
         self.last_fm = None
 
@@ -185,14 +328,38 @@ class RpcRun:
         self.author = None
         self.track_name = None
         self.video_id = None
+        self.scrobble_data = None
         self.current_file = None
-        try:
-            self.rpc_client.clear()
-        except AttributeError:
-            pass
+        self.publisher.clear()
         await asyncio.sleep(15)
 
-    async def start_scrobble(self, query, duration: int):
+    async def run_io(self, func: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args))
+
+    def record_play(self, path: str):
+
+        # o histórico de reprodução é usado na sincronização pra decidir quais arquivos remover quando a cota é excedida.
+        data_dir = os.path.dirname(os.path.dirname(path))
+
+        if os.path.basename(data_dir) != ".synced_playlist_data":
+            return
+
+        out_dir = os.path.dirname(data_dir)
+
+        if not (library := self.libraries.get(out_dir)):
+            library = self.libraries[out_dir] = LibraryIndex(out_dir)
+
+        try:
+            library.record_play(self.video_id)
+        except Exception:
+            traceback.print_exc()
+
+    def on_rpc_connect(self, rpc: MyDiscordIPC):
+        self.username = rpc.data["data"]["user"]["username"]
+        self.user_id = str(rpc.data["data"]["user"]["id"])
+        print(f'Usuário conectado: {self.username} [{self.user_id}]')
+
+    async def start_scrobble(self, query, duration: int, resolved: Optional[dict] = None):
 
         if not self.last_fm or not self.user_id:
             return
@@ -205,49 +372,28 @@ class RpcRun:
 
         if not (fmdata:=users.get(self.user_id)):
             print("Scrobble ignorado devido ao usuário não ter autenticado uma conta no last.fm (use o start_lastfm_auth pra isso).")
-            self.save_scrobble(query, self.user_id)
+            await self.run_io(self.save_scrobble, query, self.user_id)
             return
 
         print(f"Iniciando scrobble: {query}")
 
         await asyncio.sleep(int(duration/3))
 
-        if (data:=self.last_fm.cache.get(query)) is None:
+        # dados pré-resolvidos durante a sincronização da playlist (ver: scrobble_info.json)
+        if (data:=resolved) is None and (data:=await self.run_io(self.last_fm.cache.get, query)) is None:
 
             try:
                 result = await self.spotify.track_search(query)
             except Exception:
                 traceback.print_exc()
             else:
-
-                tags = ("mix", "remix", "extended")
-
-                if result:
-
-                    for t in result["tracks"]["items"]:
-
-                        if any(t for t in tags if t in query) and not any(g for g in tags if g in t["name"].lower()):
-                            continue
-
-                        string_check = t["name"].lower() + " - " + ", ".join(a["name"].lower() for a in t["artists"] if a["name"].lower() not in t["name"].lower())
-
-                        if fuzz.token_sort_ratio(string_check, query) > 70:
-
-                            data = {
-                                "name": t["name"],
-                                "artist": t["artists"][0]["name"],
-                                "album": t["album"]["name"],
-                                "duration": t["duration_ms"] / 1000
-                            }
-
-                            self.last_fm.cache[query] = data
-
-                            break
+                if result and (data:=best_match(query, result)):
+                    await self.run_io(self.last_fm.cache.set, query, data)
 
         if not data:
-            self.last_fm.cache[query] = {}
+            await self.run_io(self.last_fm.cache.set, query, {})
             print(f"Scrobble ignorado: {query}")
-            self.save_scrobble(query, self.user_id)
+            await self.run_io(self.save_scrobble, query, self.user_id)
             return
 
         await self.last_fm.track_scrobble(
@@ -261,69 +407,56 @@ class RpcRun:
 
         os.makedirs("./scrobbles", exist_ok=True)
 
-        try:
-            with open(f"./scrobbles/{user_id}.pkl", "rb") as f:
-                scrobbles = pickle.load(f)
-        except FileNotFoundError:
-            scrobbles = []
+        # chamado pelas threads do executor (mais de um scrobble pode terminar ao mesmo tempo).
+        with self.scrobble_lock:
+
+            try:
+                with open(f"./scrobbles/{user_id}.pkl", "rb") as f:
+                    scrobbles = pickle.load(f)
+            except FileNotFoundError:
+                scrobbles = []
+
+            scrobbles.append([query, time.time()])
 
-        scrobbles.append([query, time.time()])
+            with open(f"./scrobbles/{user_id}.pkl", "wb") as f:
+                pickle.dump(scrobbles, f)
 
-        with open(f"./scrobbles/{user_id}.pkl", "wb") as f:
-            pickle.dump(scrobbles, f)
+    def detect_file(self) -> Optional[str]:
+        if not self.process or not self.process.is_running():
+            return self.get_process(file_result=True)
+        return self.check_process(self.process)
 
     async def start_loop(self):
 
+        self.lag_monitor.start()
+
+        # a primeira chamada do emoji monta as tabelas de busca (dezenas de ms travando o loop).
+        await self.run_io(emoji.emoji_count, "")
+
         while True:
 
             try:
-                if not self.process or not self.process.is_running():
-                    if (p:=self.get_process(file_result=True)) is None:
-                        await self.clear_info()
-                        continue
-
-                elif (p:=self.check_process(self.process)) is None:
+                if (p:=await self.run_io(self.detect_file)) is None:
                     await self.clear_info()
                     continue
 
                 if not self.loop:
                     self.loop = asyncio.get_event_loop()
 
-                if not self.rpc_client:
-                    for i in range(10):
-                        try:
-                            rpc = MyDiscordIPC("1287237467400962109", pipe=i)
-                            await self.loop.run_in_executor(None, lambda: rpc.connect())
-                            self.rpc_client = rpc
-                            break
-                        except Exception:
-                            continue
-
-                    if not self.rpc_client:
-                        await asyncio.sleep(15)
-                        continue
-
-                    try:
-                        self.username = self.rpc_client.data["data"]["user"]["username"]
-                        self.user_id = str(self.rpc_client.data["data"]["user"]["id"])
-                        print(f'Usuário conectado: {self.username} [{self.user_id}]')
-                    except KeyError:
-                        self.rpc_client = None
-                        continue
+                # a conexão com o discord é feita em segundo plano sem travar a detecção das músicas.
+                self.publisher.ensure_connected()
 
                 if p == self.current_file:
                     await asyncio.sleep(15)
                     continue
 
+                await self.run_io(self.record_play, p)
+
                 # Contagem de caracteres do botão consomem o dobro do limite de um caracter normal
                 playlist_limit = 25 if emoji.emoji_count(self.playlist_name) < 1 else 18
 
                 # testes
-                try:
-                    with open("playlist_info.json") as f:
-                        playlist_data = json.load(f)
-                except FileNotFoundError:
-                    playlist_data = {}
+                playlist_data = await self.run_io(load_json, "playlist_info.json", {})
 
                 payload = {
                     "details": self.track_name,
@@ -356,7 +489,7 @@ class RpcRun:
                     payload["buttons"][0]["label"] += f" ({self.track_number})"
 
                 try:
-                    self.rpc_client.update_activity(payload)
+                    self.publisher.update(payload)
                     self.current_file = p
 
                     if self.playlist_id in self.ignore_playlists:
@@ -366,19 +499,13 @@ class RpcRun:
                             self.scrobble_task.cancel()
                         except:
                             pass
-                        if self.author.endswith(" - topic") and not self.author.endswith(
-                                "Release - topic") and not self.track_name.startswith(self.author[:-8]):
-                            query = f"{self.author} - {self.track_name}"
-                        else:
-                            query = self.track_name.lower() if len(self.track_name) > 12 else (
-                                f"{self.author} - {self.track_name}".lower())
+                        query = build_query(self.author, self.track_name)
 
                         self.scrobble_task = self.loop.create_task(
-                            self.start_scrobble(query=query, duration=self.track_duration)
+                            self.start_scrobble(query=query, duration=self.track_duration, resolved=self.scrobble_data)
                         )
                 except Exception:
                     traceback.print_exc()
-                    self.rpc_client = None
                     await asyncio.sleep(30)
 
             except Exception:
@@ -394,35 +521,25 @@ class RpcRun:
             if self.current_file == o.path:
                 return o.path
 
-            if o.path.endswith((".mp3", ".mp4")) and (yt_id := yt_video_regex.search(o.path)):
-                try:
-                    with open(f"{os.path.dirname(o.path)}/playlist_info.json") as f:
-                        playlist_info = json.load(f)
-                except FileNotFoundError:
+            if o.path.lower().endswith(tuple(f".{e}" for e in media_exts)) and (yt_id := yt_video_regex.search(o.path)):
+                if (playlist_info := load_json(f"{os.path.dirname(o.path)}/playlist_info.json")) is None:
                     continue
 
                 self.playlist_name = playlist_info["title"]
                 self.playlist_id = playlist_info["id"]
 
-                if o.path.endswith(".mp3"):
-                    tags = MP3(o.path, ID3=EasyID3)
-                    self.track_name = tags["title"][0]
-                    self.author = tags["artist"][0]
-                    self.track_duration = tags.info.length
-                    self.activity_type = ActivityType.listening.value
-                    try:
-                        self.track_number = tags.get("tracknumber")[0]
-                    except:
-                        self.track_number = None
-                else:
-                    tags = MP4(o.path)
-                    self.track_name = tags.get("\xa9nam")[0]
-                    self.author = tags.get("\xa9ART")[0]
-                    self.track_number = tags.get('trac')[0]
-                    self.track_duration = VideoFileClip(o.path).duration
-                    self.activity_type = ActivityType.watching.value
+                tags = read_tags(o.path)
+                self.track_name = tags["title"]
+                self.author = tags["artist"]
+                self.track_number = tags["track_number"]
+
+                # a duração dos vídeos também vem do mutagen (apenas o cabeçalho do arquivo é lido).
+                self.track_duration = tags["duration"]
+                self.activity_type = ActivityType.watching.value if is_video(o.path) else ActivityType.listening.value
 
                 self.video_id = yt_id.group()
+                # arquivos antigos também tinham as músicas não encontradas ({}), essas são consultadas novamente.
+                self.scrobble_data = load_scrobble_info(os.path.dirname(o.path)).get(self.video_id) or None
                 self.process = proc
 
                 player_info = players.get(proc.name().lower())
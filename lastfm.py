@@ -2,14 +2,17 @@ import asyncio
 import hashlib
 import json
 import os
-import pickle
 import time
 import webbrowser
 
 from aiohttp import ClientSession
-from cachetools import TTLCache
 
-cache_file = "./.lastfm_cache"
+from utils.track_cache import TrackCache
+
+cache_file = "./.lastfm_cache.db"
+
+# cache das versões anteriores (pickle com validade de 10 minutos, substituído pelo .lastfm_cache.db).
+legacy_cache_file = "./.lastfm_cache"
 
 
 class LastFmException(Exception):
@@ -20,24 +23,20 @@ class LastFmException(Exception):
 
 class LastFM:
 
+    api_url = "http://ws.audioscrobbler.com/2.0/"
+
     def __init__(self, api_key: str, api_secret: str):
         self.api_key = api_key
         self.api_secret = api_secret
-        self.cache: TTLCache = self.scrobble_load_cache()
-
-    def scrobble_load_cache(self):
+        self.cache = TrackCache(cache_file)
+        # os resultados vencidos não são usados (são buscados novamente): removidos a cada início do rpc.
+        self.cache.purge_expired()
 
-        cache = TTLCache(maxsize=10000, ttl=600)
-
-        if os.path.exists(cache_file):
-            with open(cache_file, 'rb') as f:
-                cache.update(pickle.load(f))
-
-        return cache
-
-    def scrobble_save_cache(self):
-        with open(cache_file, 'wb') as f:
-            pickle.dump(self.cache, f)
+        # os dados do cache antigo já estariam vencidos, por isso o arquivo é apenas removido.
+        try:
+            os.remove(legacy_cache_file)
+        except FileNotFoundError:
+            pass
 
     def generate_api_sig(self, params: dict):
         sig = ''.join(f"{key}{params[key]}" for key in sorted(params))
@@ -47,7 +46,7 @@ class LastFM:
     async def request_lastfm(self, params: dict):
         params["format"] = "json"
         async with ClientSession() as session:
-            async with session.get("http://ws.audioscrobbler.com/2.0/", params=params) as response:
+            async with session.get(self.api_url, params=params) as response:
                 if (data := await response.json()).get('error'):
                     raise LastFmException(data)
                 return data
@@ -55,7 +54,7 @@ class LastFM:
     async def post_lastfm(self, params: dict):
         params["format"] = "json"
         async with ClientSession() as session:
-            async with session.post("http://ws.audioscrobbler.com/2.0/", params=params) as response:
+            async with session.post(self.api_url, params=params) as response:
                 if (data := await response.json()).get('error'):
                     raise LastFmException(data)
                 return data
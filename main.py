@@ -6,23 +6,44 @@ import shutil
 import time
 import traceback
 import concurrent.futures
+import hashlib
+import itertools
 from copy import deepcopy
-from tempfile import gettempdir
+from typing import NamedTuple, Optional
 
-import mutagen.mp3
-from mutagen.easyid3 import EasyID3
-from mutagen.mp3 import MP3
-from mutagen.mp4 import MP4
+import mutagen
 from platformdirs import user_music_dir, user_videos_dir
 from send2trash import send2trash
 import yt_dlp
 
+from lastfm import cache_file as scrobble_cache_file
+from utils.egress import EgressMonitor, EgressPool
+from utils.failures import format_retry, is_due, record_failure, write_report
 from utils.ffmpeg_check import check_ffmpeg_command, check_ffmpeg
+from utils.library_gc import clean_staging, collect_garbage, staging_dir
+from utils.library_index import LibraryIndex
+from utils.m3u import regenerate_m3u, sanitize_filename
+from utils.metadata_refresh import refresh_metadata, tag_changes, TagRefresh
+from utils.quota import QuotaManager, estimate_size, load_playlist_quotas, parse_size
+from utils.relocate import relocate_library
+from utils.replaygain import apply_replaygain
+from utils.search import format_result, search_library
+from utils.scrobble_resolve import close_resolver, preresolve_playlist_background
+from utils.storage import load_storage, publish_library
+from utils.tags import audio_exts, find_media, media_exts, open_tags, read_tags, set_track_number, video_exts
+from utils.track_cache import TrackCache
+from utils.tracing import tracer, YtdlStageHooks
+from utils.verify import verify_library
+from utils.watchdog import DownloadStalled, DownloadWatchdog
+from utils.ytdl_archive import export_archive, YtdlImport
+from utils.ytdl_workers import YtdlWorkerPool
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
 yt_playlist_regex = re.compile(r'(?<=list=)[a-zA-Z0-9_-]+')
 
+yt_playlist_id_regex = re.compile(r'(?:list=)?([a-zA-Z0-9_-]+)')
+
 yt_video_regex = re.compile(r'(?:^|(?<=\W))[-a-zA-Z0-9_]{11}(?:$|(?=\W))')
 
 ytdl_download_args = {
@@ -32,7 +53,6 @@ ytdl_download_args = {
     'quiet': True,
     'retries': 30,
     'extract_flat': False,
-    'outtmpl': f'{gettempdir()}/%(id)s.%(ext)s',
     'extractor_args': {
         'youtube': {
             'skip': [
@@ -51,16 +71,34 @@ error_messages = {
     "[Private video]": "Vídeo privado"
 }
 
+# informações compactas das playlists já listadas (reaproveitadas entre a sincronização de áudio e vídeo).
 playlist_data = {}
 
+# quantidade de músicas da primeira página da playlist (já vem junto com os dados da playlist, sem requisição extra).
+probe_entries = 100
+
 track_ids = set()
 
 m3u_data = {}
 
+background_tasks = []
+
+
+def env_flag(name: str) -> bool:
+    return os.getenv(name, "").lower() in ("1", "true", "yes", "sim")
+
+
+def load_playlist_ids(file: str, regex: re.Pattern = yt_playlist_regex) -> set:
+    try:
+        with open(file) as f:
+            return set(regex.findall(f.read()))
+    except FileNotFoundError:
+        return set()
+
 
 def save_m3u(out_dir: str):
     with open(out_dir, 'w', encoding="utf-8") as f:
-        f.write("\n\n".join(m3u_data.values()))
+        f.write("\n\n".join(v for _, v in sorted(m3u_data.items())))
 
 
 def make_dirs(dst: str):
@@ -73,24 +111,117 @@ def make_dirs(dst: str):
         pass
 
 
-def move_dir(src: str, dst: str):
-    make_dirs(dst)
+class PlaylistTrack(NamedTuple):
+    id: str
+    name: str
+    duration: Optional[int]
+    uploader: Optional[str]
+
+
+def playlist_signature(info: dict, first_page: list) -> str:
+    # quantidade de vídeos, data da última alteração e a primeira página (onde entram os vídeos adicionados).
+    data = [info.get("playlist_count"), info.get("modified_date"), [t.get("id") for t in first_page]]
+    return hashlib.blake2b(json.dumps(data).encode(), digest_size=16).hexdigest()
+
+
+def extract_playlist(yt_pl_id: str, cookie_file: Optional[str] = None, library: Optional[LibraryIndex] = None):
+
+    if cached := playlist_data.get(yt_pl_id):
+        return cached["info"], iter(cached["tracks"])
+
+    print(f"\n\nObtendo informações da playlist: https://www.youtube.com/playlist?list={yt_pl_id}")
+
+    ydl = yt_dlp.YoutubeDL(
+        {
+            'extract_flat': True,
+            'quiet': True,
+            'no_warnings': True,
+            'lazy_playlist': True,
+            'simulate': True,
+            'skip_download': True,
+            'cookiefile': cookie_file,
+            'allowed_extractors': [
+                r'.*youtube.*',
+            ],
+        }
+    )
+
+    # com process=False as músicas são retornadas num gerador que busca as páginas da playlist sob demanda.
+    try:
+        with tracer.span("enumerate", playlist_id=yt_pl_id):
+            data = ydl.extract_info(f"https://www.youtube.com/playlist?list={yt_pl_id}", download=False, process=False)
+            while data.get("_type") in ("url", "url_transparent"):
+                data = ydl.extract_info(data["url"], download=False, process=False, ie_key=data.get("ie_key"))
+            entries = iter(data.get("entries") or [])
+            first_page = list(itertools.islice(entries, probe_entries))
+    except Exception:
+        ydl.close()
+        raise
+
+    info = {k: v for k, v in data.items() if k != "entries"}
+
+    signature = playlist_signature(info, first_page)
+
+    max_age = float(os.getenv("PLAYLIST_SNAPSHOT_MAX_AGE") or 24) * 3600
+
+    # sem alterações desde a última listagem completa: as demais páginas não são obtidas.
+    if library and max_age and (snapshot := library.get_snapshot(yt_pl_id)) and snapshot["signature"] == signature \
+            and time.time() - snapshot["enumerated_at"] < max_age:
+        ydl.close()
+        tracks = [PlaylistTrack(*t) for t in snapshot["tracks"]]
+        print(f"Playlist sem alterações ({len(tracks)} vídeo{'s'[:len(tracks) ^ 1]}), usando a última listagem.")
+        playlist_data[yt_pl_id] = {"info": info, "tracks": tracks}
+        return info, iter(tracks)
+
+    def iter_tracks():
+
+        tracks = []
+
+        page_entries = itertools.chain(first_page, entries)
 
-    for i in os.listdir(src):
         try:
-            shutil.move(f"{src}/{i}", dst)
-        except Exception as e:
-            if not str(e).endswith('already exists'):
-                raise e
-    shutil.rmtree(src)
+            while True:
+                # apenas a obtenção de uma nova página da playlist fica registrada no trace.
+                with tracer.span("enumerate", min_duration=0.01, playlist_id=yt_pl_id):
+                    if (t := next(page_entries, None)) is None:
+                        break
+                if t.get("live_status"):
+                    continue
+                track = PlaylistTrack(t["id"], t.get("title"), t.get("duration"), t.get("uploader"))
+                tracks.append(track)
+                yield track
+        finally:
+            ydl.close()
+
+        playlist_data[yt_pl_id] = {"info": info, "tracks": tracks}
+
+        # salvo apenas quando a playlist é listada por completo.
+        if library:
+            library.set_snapshot(yt_pl_id, signature, tracks)
+
+    return info, iter_tracks()
 
 
-def sanitize_filename(filename: str) -> str:
-    return re.sub(r'[<>:"/\\|?*]', '-', filename).rstrip('. ')
+def run(trace: Optional[str] = None, trace_profile: Optional[str] = None, **kwargs):
 
+    if trace:
+        tracer.enable(trace, {s.strip() for s in (trace_profile or "").split(",") if s.strip()})
 
-def run():
-    if not check_ffmpeg_command():
+    try:
+        sync(**kwargs)
+    finally:
+        tracer.save()
+
+
+def sync(verify: Optional[str] = None, relocate: Optional[list] = None, retry_failed: bool = False,
+         fetch_evicted: bool = False, playlist_ids: Optional[list] = None, media_type: Optional[str] = None,
+         only: Optional[str] = None, search: Optional[str] = None, import_ytdl: Optional[list] = None,
+         import_mode: str = "link", export_archive_file: Optional[str] = None):
+
+    # a regeneração das m3u, a limpeza, o envio pro armazenamento, a busca e a exportação usam apenas o índice.
+    offline = only in ("m3u", "gc", "publish") or bool(search) or bool(export_archive_file)
+
+    if not offline and not check_ffmpeg_command():
         ytdl_download_args["ffmpeg_location"] = check_ffmpeg()
         check_ffmpeg_command(ytdl_download_args["ffmpeg_location"], raise_exception=True)
 
@@ -149,6 +280,15 @@ def run():
         with open("./playists_video_directory.txt", "w") as f:
             f.write(playist_video_directory)
 
+    if relocate:
+        media_type, new_directory = relocate
+        directory_file = "./playlists_audio_directory.txt" if media_type == "audio" else "./playists_video_directory.txt"
+        relocate_library(playlists_audio_directory if media_type == "audio" else playist_video_directory, new_directory)
+        with open(directory_file, "w") as f:
+            f.write(new_directory)
+        print(f"\n\nBiblioteca de {media_type} movida para: {os.path.abspath(new_directory)}")
+        return
+
     if not playlists_audio and not playlists_video:
         print("\n\nAbra o arquivo playlists_links_audio.txt e cole os links das suas playlists do youtube (pra download de "
               "vídeos cole os links de playlists no playlists_links_video.txt).")
@@ -156,32 +296,154 @@ def run():
 
     if os.path.isdir("./playlists"):
         print(f"\n\nMovendo músicas da pasta playlists para a pasta {playlists_audio_directory}")
-        move_dir("./playlists", playlists_audio_directory)
+        relocate_library("./playlists", playlists_audio_directory, whole_dir=True)
+
+    # sincronização seletiva: as playlists e bibliotecas não escolhidas são totalmente ignoradas.
+    libraries = []
+
+    for lib_type, lib_playlists, lib_dir in (
+        ("audio", playlists_audio, playlists_audio_directory),
+        ("video", playlists_video, playist_video_directory),
+    ):
+        if media_type and media_type != lib_type:
+            continue
+        selected = [p for p in lib_playlists if p in playlist_ids] if playlist_ids else lib_playlists
+        if selected or (only == "gc" and not playlist_ids):
+            libraries.append((lib_type, lib_playlists, selected, lib_dir))
+
+    if playlist_ids and (unknown := set(playlist_ids) - {p for _, _, selected, _ in libraries for p in selected}):
+        print(f"\n\nPlaylists não encontradas nos arquivos de links{' de ' + media_type if media_type else ''}: "
+              f"{', '.join(sorted(unknown))}")
+
+    if not libraries:
+        return
 
-    download_playlist(file_list=playlists_audio, out_dir=playlists_audio_directory, only_audio=True,
-                      cookie_file=cookie_file)
+    if search:
+        results = []
+        for lib_type, _, selected, lib_dir in libraries:
+            results.extend(search_library(lib_dir, search, playlist_ids=selected if playlist_ids else None))
+        print(f"\n\n{len(results)} resultado{'s'[:len(results) ^ 1]} para: {search}\n")
+        for result in results:
+            print(format_result(result))
+        return
 
-    download_playlist(file_list=playlists_video, out_dir=playist_video_directory, only_audio=False,
-                      cookie_file=cookie_file)
+    if export_archive_file:
+        count = export_archive(export_archive_file, [lib_dir for _, _, _, lib_dir in libraries])
+        print(f"\n\n{count} vídeo{'s'[:count ^ 1]} adicionado{'s'[:count ^ 1]} ao archive: "
+              f"{os.path.abspath(export_archive_file)}")
+        return
 
+    if only == "gc":
+        for _, lib_playlists, selected, lib_dir in libraries:
+            collect_garbage(lib_dir, lib_playlists, selected if playlist_ids else None)
+        return
 
-def download_playlist(file_list: list, out_dir: str, only_audio=True, **kwargs):
-    make_dirs(out_dir)
+    if only == "m3u":
+        for _, _, selected, lib_dir in libraries:
+            count = regenerate_m3u(lib_dir, selected)
+            print(f"\n\n{count} playlist{'s'[:count ^ 1]} m3u gerada{'s'[:count ^ 1]} em: {os.path.abspath(lib_dir)}")
+        return
+
+    if only == "publish":
+        if not os.getenv("STORAGE_URL"):
+            print("\n\nConfigure o armazenamento de destino (STORAGE_URL) no arquivo .env")
+        publish_libraries(libraries)
+        return
 
-    ytdl_download_args_final = deepcopy(ytdl_download_args)
+    # os arquivos com problema são removidos da biblioteca e baixados novamente logo abaixo.
+    if verify:
+        for _, _, selected, lib_dir in libraries:
+            verify_library(lib_dir, deep=verify == "deep", ffmpeg=ytdl_download_args.get("ffmpeg_location"),
+                           playlist_ids=selected if playlist_ids else None)
 
-    old_dir = os.path.join(out_dir, f"./.synced_playlist_data/deleted")
+    # saídas de rede (ips locais ou proxies) usadas pelos downloads, configuradas no egress.txt
+    if egress_pool := EgressPool.load():
+        print(f"\n\nUsando {len(egress_pool.egresses)} saída{'s'[:len(egress_pool.egresses) ^ 1]} de rede "
+              f"({egress_pool.workers} downloads simultâneos).")
 
-    if not os.path.isdir(old_dir):
-        os.makedirs(old_dir)
+    # arquivos baixados anteriormente com o yt-dlp (--download-archive) em outras pastas.
+    if ytdl_import := (YtdlImport(import_mode).load(import_ytdl) if import_ytdl else None):
+        n = len(ytdl_import.files)
+        print(f"\n\n{n} arquivo{'s'[:n ^ 1]} do yt-dlp encontrado{'s'[:n ^ 1]} para importação "
+              f"({len(ytdl_import.archive_ids)} no archive).")
+
+    # extração e download em processos separados (cada um com seu próprio YoutubeDL), sem disputar o GIL.
+    if worker_pool := (YtdlWorkerPool.load() if only != "metadata" else None):
+        print(f"\n\nUsando {worker_pool.size} processo{'s'[:worker_pool.size ^ 1]} para os downloads.")
+
+    try:
+        for lib_type, _, selected, lib_dir in libraries:
+            download_playlist(file_list=selected, out_dir=lib_dir, only_audio=lib_type == "audio",
+                              cookie_file=cookie_file, retry_failed=retry_failed, fetch_evicted=fetch_evicted,
+                              egress_pool=egress_pool, download=only != "metadata", ytdl_import=ytdl_import,
+                              worker_pool=worker_pool)
+    finally:
+        if worker_pool:
+            worker_pool.close()
+
+    if ytdl_import:
+        n = ytdl_import.imported
+        print(f"\n\n{n} arquivo{'s'[:n ^ 1]} importado{'s'[:n ^ 1]} do yt-dlp "
+              f"({'movidos' if import_mode == 'move' else 'hardlink/cópia'}).")
+
+    # archive atualizado a cada sincronização (pra outras ferramentas ignorarem o que já foi baixado).
+    if archive_file := os.getenv("YTDL_ARCHIVE_EXPORT"):
+        export_archive(archive_file, [lib_dir for _, _, _, lib_dir in libraries])
+
+    if egress_pool:
+        print(f"\n\nSaídas de rede:\n{egress_pool.status()}")
+
+    if env_flag("REPLAYGAIN") and only != "metadata":
+        for lib_type, _, selected, lib_dir in libraries:
+            if lib_type == "audio":
+                apply_replaygain(lib_dir, ffmpeg=ytdl_download_args.get("ffmpeg_location"),
+                                 workers=int(os.getenv("REPLAYGAIN_WORKERS") or 0) or None,
+                                 playlist_ids=selected if playlist_ids else None)
+
+    # cópia da biblioteca (arquivos e m3u) no armazenamento configurado, ex: bucket s3 usado por outros players.
+    publish_libraries(libraries)
+
+    if background_tasks:
+        print("\n\nAguardando a pré-resolução dos dados de scrobble...")
+        concurrent.futures.wait(background_tasks)
+        background_tasks.clear()
+        close_resolver()
+
+
+def publish_libraries(libraries: list):
 
+    for lib_type, _, _, lib_dir in libraries:
+
+        try:
+            if not (storage := load_storage(lib_type)):
+                continue
+            print(f"\n\nPublicando a biblioteca de {lib_type} em: {storage}")
+            stats = publish_library(lib_dir, storage)
+        except Exception:
+            traceback.print_exc()
+            continue
+
+        if stats:
+            print(f"{stats['uploaded']} arquivo{'s'[:stats['uploaded'] ^ 1]} enviado{'s'[:stats['uploaded'] ^ 1]} "
+                  f"({stats['bytes'] / 1024 / 1024:.1f} MB), {stats['unchanged']} sem alteração, "
+                  f"{stats['playlists']} playlist{'s'[:stats['playlists'] ^ 1]} atualizada{'s'[:stats['playlists'] ^ 1]} "
+                  f"e {stats['deleted']} removido{'s'[:stats['deleted'] ^ 1]}.")
+
+
+def build_download_args(only_audio: bool, staging: str, native: bool = False) -> dict:
+
+    args = deepcopy(ytdl_download_args)
+
+    # os arquivos são baixados e convertidos na área temporária da própria biblioteca (mesmo disco).
+    args["outtmpl"] = f"{staging}/%(id)s.%(ext)s"
+
+    # perfil nativo: mantém o codec original (opus/aac) ou apenas remuxa o vídeo sem recodificar.
     if only_audio:
-        ext = "mp3"
-        media_txt = "áudio"
-        ytdl_download_args_final.update(
+        args.update(
             {
                 'format': 'bestaudio',
                 'postprocessors': [
+                    {'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'} if native else
                     {'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'},
                     {'key': 'FFmpegMetadata', 'add_metadata': 'True'},
                     {'key': 'EmbedThumbnail', 'already_have_thumbnail': False}
@@ -190,12 +452,11 @@ def download_playlist(file_list: list, out_dir: str, only_audio=True, **kwargs):
             }
         )
     else:
-        ext = "mp4"
-        media_txt = "vídeo"
-        ytdl_download_args_final.update(
+        args.update(
             {
                 'format': 'bestvideo[ext=mp4][height<=1080]+bestaudio[ext=m4a]/best[ext=mp4]',
                 'postprocessors': [
+                    {'key': 'FFmpegVideoRemuxer', 'preferedformat': 'mp4'} if native else
                     {'key': 'FFmpegVideoConvertor', 'preferedformat': 'mp4'},
                     {'key': 'EmbedThumbnail'},
                     {'key': 'FFmpegMetadata'},
@@ -203,40 +464,101 @@ def download_playlist(file_list: list, out_dir: str, only_audio=True, **kwargs):
             }
         )
 
+    return args
+
+
+def listed_tracks(tracks, errors: list):
+
+    # as páginas seguintes da playlist são obtidas durante a sincronização: uma falha encerra apenas a listagem dessa
+    # playlist (os downloads já iniciados continuam e as próximas playlists são sincronizadas normalmente).
+    try:
+        yield from tracks
+    except Exception as e:
+        traceback.print_exc()
+        errors.append(e)
+
+
+def download_playlist(file_list: list, out_dir: str, only_audio=True, **kwargs):
+    make_dirs(out_dir)
+
+    old_dir = os.path.join(out_dir, f"./.synced_playlist_data/deleted")
+
+    if not os.path.isdir(old_dir):
+        os.makedirs(old_dir)
+
+    if only_audio:
+        exts = audio_exts
+        media_txt = "áudio"
+    else:
+        exts = video_exts
+        media_txt = "vídeo"
+
+    # downloads interrompidos numa execução anterior.
+    if leftovers := clean_staging(out_dir):
+        print(f"{leftovers} arquivo{'s'[:leftovers ^ 1]} temporário{'s'[:leftovers ^ 1]} de downloads interrompidos "
+              f"removido{'s'[:leftovers ^ 1]}.")
+
+    make_dirs(staging := staging_dir(out_dir))
+
+    profiles = {native: build_download_args(only_audio, staging, native) for native in (False, True)}
+
+    native_playlists = load_playlist_ids("./playlists_native.txt", yt_playlist_id_regex)
+    native_default = env_flag("NATIVE_PROFILE")
+
     make_dirs(old_dir)
 
     make_dirs(f"{out_dir}/.synced_playlist_data/")
 
-    for yt_pl_id in file_list:
+    library = LibraryIndex(out_dir)
 
-        data = playlist_data.get(yt_pl_id)
+    if kwargs.get("retry_failed"):
+        library.clear_failures()
 
-        if not data:
+    # vídeos que falharam anteriormente (erros permanentes ou ainda aguardando o intervalo para nova tentativa).
+    failures = library.failures()
 
-            print(f"\n\nObtendo informações da playlist: https://www.youtube.com/playlist?list={yt_pl_id}")
+    if kwargs.get("fetch_evicted"):
+        library.clear_evicted()
 
-            with yt_dlp.YoutubeDL(
-                    {
-                        'extract_flat': True,
-                        'quiet': True,
-                        'no_warnings': True,
-                        'lazy_playlist': True,
-                        'simulate': True,
-                        'skip_download': True,
-                        'cookiefile': kwargs.get('cookie_file'),
-                        'allowed_extractors': [
-                            r'.*youtube.*',
-                        ],
-                    }
-            ) as ydl:
+    # limite de espaço da biblioteca (calculado pelo índice) e de cada playlist (playlists_quota.txt).
+    quota = QuotaManager(
+        library, parse_size(os.getenv("LIBRARY_QUOTA_AUDIO" if only_audio else "LIBRARY_QUOTA_VIDEO")),
+        load_playlist_quotas(), min_age=float(os.getenv("QUOTA_MIN_AGE_DAYS") or 7) * 86400
+    )
 
-                try:
-                    data = ydl.extract_info(f"https://www.youtube.com/playlist?list={yt_pl_id}", download=False)
-                except Exception:
-                    traceback.print_exc()
-                    continue
+    # o mesmo conjunto é atualizado pela cota: um vídeo removido pra liberar espaço numa playlist não é baixado
+    # novamente (removendo outros arquivos) ao aparecer em outra playlist na mesma sincronização.
+    evicted = quota.evicted
+
+    egress_pool: Optional[EgressPool] = kwargs.get("egress_pool")
 
-                playlist_data[yt_pl_id] = data
+    # cancela os downloads/conversões travados (sem progresso ou acima do tempo máximo). sem os processos separados
+    # (YTDL_PROCESS_WORKERS) apenas o ffmpeg é finalizado na hora: uma conexão travada só é cancelada quando o yt-dlp
+    # desistir dela (socket_timeout e novas tentativas) ou chamar os hooks novamente.
+    watchdog = DownloadWatchdog.load()
+
+    worker_pool: Optional[YtdlWorkerPool] = kwargs.get("worker_pool")
+
+    if worker_pool:
+        workers = worker_pool.size
+    else:
+        workers = egress_pool.workers if egress_pool else 2
+
+    ytdl_import: Optional[YtdlImport] = kwargs.get("ytdl_import")
+
+    # pré-resolução opcional dos dados de scrobble (evita consultas ao spotify durante a reprodução no rpc).
+    if scrobble_cache := (TrackCache(scrobble_cache_file) if env_flag("SCROBBLE_PRERESOLVE") else None):
+        scrobble_ignore_playlists = load_playlist_ids("./lastfm_ignore_playlists.txt", yt_playlist_id_regex)
+    else:
+        scrobble_ignore_playlists = set()
+
+    for yt_pl_id in file_list:
+
+        try:
+            data, tracks = extract_playlist(yt_pl_id, cookie_file=kwargs.get('cookie_file'), library=library)
+        except Exception:
+            traceback.print_exc()
+            continue
 
         playlist_name = sanitize_filename(data["title"])
         playlist_id = data["id"]
@@ -251,14 +573,6 @@ def download_playlist(file_list: list, out_dir: str, only_audio=True, **kwargs):
                 if playlist_id in dir_ and os.path.isfile(f"{out_dir}/{dir_}"):
                     os.remove(f"{out_dir}/{dir_}")
 
-        new_tracks = {
-            t["id"]: {
-                "name": t['title'],
-                "duration": t["duration"],
-                "uploader": t["uploader"],
-            } for c, t in enumerate(data["entries"]) if not t["live_status"] and not t["live_status"]
-        }
-
         synced_dir = f"{out_dir}/.synced_playlist_data/{playlist_id}"
 
         make_dirs(f"{synced_dir}/")
@@ -267,7 +581,7 @@ def download_playlist(file_list: list, out_dir: str, only_audio=True, **kwargs):
 
         for f in os.listdir(synced_dir):
 
-            if not f.endswith(f".{ext}") or not os.path.isfile(f"{synced_dir}/{f}"):
+            if not f.endswith(tuple(f".{e}" for e in exts)) or not os.path.isfile(f"{synced_dir}/{f}"):
                 continue
 
             try:
@@ -285,94 +599,259 @@ def download_playlist(file_list: list, out_dir: str, only_audio=True, **kwargs):
             print(f"\n\n{unkown_files} arquivo{(s := 's'[:unkown_files ^ 1])} fo{'ram'[:unkown_files ^ 1] or 'i'} "
                   f"movido{s} pra pasta {out_dir}/.arquivos_desconhecidos")
 
-        ytdl_args_list = []
-
         index = 0
         download_counter = 0
         track_counter = 0
         existing = 0
 
-        total_entries_original = len(new_tracks)
+        # a quantidade total é informada pelo youtube antes da listagem completa (usado no número da faixa).
+        total_entries_original = data.get("playlist_count")
 
-        total_entries = int(total_entries_original)
+        with open(f"{synced_dir}/playlist_info.json", "w", encoding="utf-8") as f:
+            f.write(json.dumps(data, indent=4, default=str))
 
-        save_data = deepcopy(data)
+        scrobble_tracks = {}
 
-        del save_data["entries"]
+        library.upsert_playlist(playlist_id, data["title"])
 
-        with open(f"{synced_dir}/playlist_info.json", "w", encoding="utf-8") as f:
-            f.write(json.dumps(save_data, indent=4))
+        # dados da sincronização anterior (usados pra detectar vídeos renomeados ou com outro canal).
+        previous = {r["video_id"]: r for r in library.tracks(playlist_id)}
+        tag_refresh = []
 
-        for yt_id, track in new_tracks.items():
+        playlist_track_ids = set()
 
-            track_ids.add(yt_id)
+        listing_errors = []
 
-            track_counter += 1
+        futures = {}
 
-            if e_message := error_messages.get(track['name']):
-                total_entries -= 1
-                try:
-                    deleted_file = [p for p in [f"{old_dir}/{yt_id}.{ext}", f"{synced_dir}/{yt_id}.{ext}"] if os.path.isfile(p)][0]
-                except IndexError:
-                    print(f"{e_message}: https://www.youtube.com/watch?v={yt_id}")
-                else:
-                    existing += 1
-                    audio_tag = MP3(deleted_file, ID3=EasyID3)
-                    m3u_data[index] = (f"#EXTINF:{int(audio_tag.info.length)},[{e_message}]: {audio_tag['title'][0]} - "
-                                       f"Por: {audio_tag['artist'][0]}\n"
-                                       f"{old_dir}/{yt_id}.{ext}")
-                    audio_tag["tracknumber"] = f"{track_counter}/{total_entries_original}"
-                    audio_tag.save()
-                    print(f"{e_message} (reaproveitado): https://www.youtube.com/watch?v={yt_id}")
-                continue
+        skipped_failures = 0
+        new_failures = 0
+        quota_skipped = 0
+        not_downloaded = 0
 
-            index += 1
+        # os downloads são iniciados conforme as páginas da playlist são obtidas.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
 
-            if (move:=os.path.isfile(f"{out_dir}/.synced_playlist_data/{yt_id}.{ext}")) or os.path.isfile(f"{synced_dir}/{yt_id}.{ext}"):
-                total_entries -= 1
-                existing += 1
-                m3u_data[index] = (f"#EXTINF:{track['duration']},{track['name']} - Por: {track['uploader']}\n"
-                                   f"./.synced_playlist_data/{playlist_id}/{yt_id}.{ext}")
+            def submit(track: PlaylistTrack, track_index: int, native: bool, counter: int, track_number: str):
+                future = executor.submit(
+                    download_video, track.name, counter, track.id, deepcopy(profiles[native]), synced_dir, out_dir,
+                    track_index, playlist_name, playlist_id, track_number, egress_pool, watchdog, track.duration,
+                    worker_pool
+                )
+                futures[future] = (track.id, track_index, track, native, counter, track_number)
+                return future
 
-                if move:
-                    shutil.move(f"{out_dir}/.synced_playlist_data/{yt_id}.{ext}", f"{synced_dir}/{yt_id}.{ext}")
+            for track in listed_tracks(tracks, listing_errors):
 
-                try:
-                    if only_audio:
-                        func = MP3
-                        tag_kw = {"ID3": EasyID3}
+                yt_id = track.id
+
+                # vídeo repetido na playlist (baixado/listado apenas uma vez).
+                if yt_id in playlist_track_ids:
+                    continue
+
+                track_ids.add(yt_id)
+                playlist_track_ids.add(yt_id)
+
+                track_counter += 1
+
+                track_number = f"{track_counter}/{total_entries_original}" if total_entries_original else f"{track_counter}"
+
+                # vídeos deletados/privados ficam marcados no índice: o arquivo (quando existe) é a única cópia e nunca é
+                # removido pela cota nem pela verificação.
+                if e_message := error_messages.get(track.name):
+                    if not (deleted_file := find_media(old_dir, yt_id, exts) or find_media(synced_dir, yt_id, exts)):
+                        library.upsert_track(playlist_id, yt_id, track_counter, track.name, None, None, unavailable=True)
+                        print(f"{e_message}: https://www.youtube.com/watch?v={yt_id}")
                     else:
-                        func = MP4
-                        tag_kw = {}
-                    audio_tag = func(f"{synced_dir}/{yt_id}.{ext}", **tag_kw)
-                    audio_tag["tracknumber"] = f"{track_counter}/{total_entries_original}"
-                    audio_tag.save()
-                except mutagen.mp3.HeaderNotFoundError:
-                    print(f"Erro ao salvar tag: {track['name']} - {ext}")
-                continue
+                        existing += 1
+                        file_tags = read_tags(deleted_file)
+                        library.upsert_track(playlist_id, yt_id, track_counter, file_tags['title'], file_tags['artist'],
+                                             file_tags['duration'], deleted_file, unavailable=True)
+                        m3u_data[index] = (f"#EXTINF:{int(file_tags['duration'])},[{e_message}]: {file_tags['title']} - "
+                                           f"Por: {file_tags['artist']}\n"
+                                           f"./.synced_playlist_data/{library.rel_path(deleted_file)}")
+                        set_track_number(deleted_file, track_number)
+                        print(f"{e_message} (reaproveitado): https://www.youtube.com/watch?v={yt_id}")
+                    continue
+
+                scrobble_tracks[yt_id] = {"name": track.name, "uploader": track.uploader}
+
+                index += 1
+
+                if ytdl_import and not find_media(f"{out_dir}/.synced_playlist_data", yt_id, exts) \
+                        and not find_media(synced_dir, yt_id, exts):
+                    ytdl_import.take(yt_id, exts, synced_dir)
+
+                # arquivos já existentes são aceitos em qualquer formato suportado (ex: mp3 de antes da troca de perfil).
+                if (file := (old_file := find_media(f"{out_dir}/.synced_playlist_data", yt_id, exts)) or find_media(synced_dir, yt_id, exts)):
+                    existing += 1
+                    file_name = os.path.basename(file)
+                    m3u_data[index] = (f"#EXTINF:{track.duration},{track.name} - Por: {track.uploader}\n"
+                                       f"./.synced_playlist_data/{playlist_id}/{file_name}")
+
+                    if old_file:
+                        shutil.move(old_file, f"{synced_dir}/{file_name}")
+
+                    library.upsert_track(playlist_id, yt_id, track_counter, track.name, track.uploader, track.duration,
+                                         f"{synced_dir}/{file_name}")
+
+                    if yt_id in failures:
+                        library.clear_failure(yt_id)
+
+                    path = f"{synced_dir}/{file_name}"
+
+                    try:
+                        file_tags = read_tags(path, tags := open_tags(path))
+                        set_track_number(path, track_number, tags)
+                    except mutagen.MutagenError:
+                        print(f"Erro ao salvar tag: {track.name} - {file_name}")
+                        continue
+
+                    # título/artista comparados com as tags do arquivo (inclui vídeos renomeados antes do índice existir
+                    # e atualizações que falharam anteriormente). o canal anterior vem do índice.
+                    refresh = TagRefresh(path, yt_id, track.name, track.uploader, file_tags["title"], file_tags["artist"],
+                                         prev["uploader"] if (prev := previous.get(yt_id)) else None)
+                    if any(tag_changes(refresh)):
+                        tag_refresh.append(refresh)
+                    continue
 
-            new_args = deepcopy(ytdl_download_args_final)
+                library.upsert_track(playlist_id, yt_id, track_counter, track.name, track.uploader, track.duration)
 
-            download_counter += 1
+                # atualização apenas dos dados/tags (os arquivos ausentes não são baixados).
+                if not kwargs.get("download", True):
+                    not_downloaded += 1
+                    continue
 
-            ytdl_args_list.append(
-                [new_tracks[yt_id]["name"], download_counter, yt_id, new_args, synced_dir, out_dir, index, ext, playlist_name,
-                 playlist_id, total_entries_original, track_counter])
+                if (failure := failures.get(yt_id)) and not is_due(failure):
+                    skipped_failures += 1
+                    m3u_data[index] = (f"#[Falha: {failure['reason']}] {track.name} - Por: {track.uploader} | "
+                                       f"https://www.youtube.com/watch?v={yt_id} ({format_retry(failure['next_retry_at'])})")
+                    continue
 
-        if existing > 0:
-            save_m3u(f"{out_dir}/{sanitize_filename(playlist_name)} - {playlist_id}.m3u")
-            print(f"{existing} download{'s'[:existing ^ 1]} de {media_txt}{'s'[:existing ^ 1]} "
-                  f"existente{'s'[:existing ^ 1]} ignorado{'s'[:existing ^ 1]}.")
+                native = native_default or playlist_id in native_playlists
+
+                if quota.enabled:
+                    if not quota.admit(playlist_id, yt_id, estimate_size(track.duration, only_audio, native),
+                                       allow_evict=yt_id not in evicted):
+                        quota_skipped += 1
+                        if yt_id not in evicted:
+                            library.set_evicted(yt_id, None)
+                            evicted.add(yt_id)
+                        m3u_data[index] = (f"#[Fora da cota] {track.name} - Por: {track.uploader} | "
+                                           f"https://www.youtube.com/watch?v={yt_id}")
+                        continue
+                    if yt_id in evicted:
+                        library.clear_evicted(yt_id)
+                        evicted.discard(yt_id)
+
+                download_counter += 1
+
+                submit(track, index, native, download_counter, track_number)
+
+            # músicas removidas da playlist também são removidas do índice (apenas com a listagem completa).
+            if listing_errors:
+                print(f"Listagem da playlist incompleta ({len(playlist_track_ids)} vídeo"
+                      f"{'s'[:len(playlist_track_ids) ^ 1]} obtidos), os demais foram mantidos no índice.")
+            else:
+                library.prune_playlist(playlist_id, playlist_track_ids)
+
+            # título/artista (e thumbnail) atualizados direto nas tags, sem baixar os arquivos novamente.
+            if tag_refresh:
+                stats = refresh_metadata(out_dir, tag_refresh, workers=int(os.getenv("METADATA_REFRESH_WORKERS") or 4),
+                                         thumbnails=env_flag("METADATA_REFRESH_THUMBNAILS"))
+                print(f"{stats['tags']} arquivo{'s'[:stats['tags'] ^ 1]} com título/artista atualizado"
+                      f"{'s'[:stats['tags'] ^ 1]} ({stats['covers']} thumbnail{'s'[:stats['covers'] ^ 1]}"
+                      + (f", {stats['seeded']} salva{'s'[:stats['seeded'] ^ 1]} no cache" if stats['seeded'] else "")
+                      + ").")
+                # o canal anterior volta pro índice: o artista ainda é reconhecido como o nome do canal na próxima
+                # sincronização (o título é sempre comparado com as tags do arquivo).
+                for refresh in stats["failed"]:
+                    if refresh.old_uploader and refresh.old_uploader != refresh.uploader:
+                        library.set_uploader(playlist_id, refresh.video_id, refresh.old_uploader)
+
+            if existing > 0:
+                save_m3u(f"{out_dir}/{sanitize_filename(playlist_name)} - {playlist_id}.m3u")
+                print(f"{existing} download{'s'[:existing ^ 1]} de {media_txt}{'s'[:existing ^ 1]} "
+                      f"existente{'s'[:existing ^ 1]} ignorado{'s'[:existing ^ 1]}.")
+
+            if scrobble_cache and playlist_id not in scrobble_ignore_playlists:
+                background_tasks.append(
+                    preresolve_playlist_background(
+                        scrobble_tracks, synced_dir, scrobble_cache,
+                        concurrency=int(os.getenv("SCROBBLE_PRERESOLVE_CONCURRENCY") or 4)
+                    )
+                )
+
+            if not_downloaded:
+                print(f"{not_downloaded} {media_txt}{'s'[:not_downloaded ^ 1]} ainda não baixado{'s'[:not_downloaded ^ 1]}.")
+
+            if quota_skipped:
+                print(f"{quota_skipped} {media_txt}{'s'[:quota_skipped ^ 1]} não baixado{'s'[:quota_skipped ^ 1]} "
+                      f"por falta de espaço na cota.")
+
+            if skipped_failures:
+                print(f"{skipped_failures} {media_txt}{'s'[:skipped_failures ^ 1]} com falha anterior "
+                      f"ignorado{'s'[:skipped_failures ^ 1]} (use --retry-failed pra tentar novamente).")
+
+            # os downloads cancelados pelo watchdog voltam pra fila após um intervalo (1 tentativa por vez).
+            stalls = {}
+            requeue = []
+            pending = set(futures)
+
+            while pending or requeue:
+
+                now = time.time()
+
+                for item in [r for r in requeue if r[0] <= now]:
+                    requeue.remove(item)
+                    pending.add(submit(*item[1:]))
+
+                if not pending:
+                    time.sleep(max(0.0, min(r[0] for r in requeue) - now))
+                    continue
 
-        if not ytdl_args_list:
+                done, pending = concurrent.futures.wait(
+                    pending, timeout=max(0.1, min(r[0] for r in requeue) - now) if requeue else None,
+                    return_when=concurrent.futures.FIRST_COMPLETED
+                )
+
+                for future in done:
+
+                    yt_id, track_index, track, native, counter, track_number = futures[future]
+
+                    try:
+                        filepath = future.result()
+                    except Exception as e:
+                        if isinstance(e, DownloadStalled) and (n := stalls.get(yt_id, 0)) < watchdog.max_retries:
+                            stalls[yt_id] = n + 1
+                            delay = watchdog.retry_delay(n + 1)
+                            print(f"Tentando novamente em {int(delay)}s: [{yt_id}] -> {track.name}")
+                            requeue.append((time.time() + delay, track, track_index, native, counter, track_number))
+                            continue
+                        quota.release(yt_id)
+                        kind, reason, next_retry_at = record_failure(library, yt_id, e, failures.get(yt_id))
+                        m3u_data[track_index] = (f"#[Falha: {reason}] {track.name} - Por: {track.uploader} | "
+                                                 f"https://www.youtube.com/watch?v={yt_id} ({format_retry(next_retry_at)})")
+                        new_failures += 1
+                        continue
+
+                    quota.release(yt_id)
+
+                    if filepath:
+                        library.set_file(playlist_id, yt_id, filepath)
+                        if yt_id in failures:
+                            library.clear_failure(yt_id)
+
+            # as falhas também ficam visíveis na playlist (como comentário no arquivo m3u).
+            if new_failures or ((skipped_failures or quota_skipped) and not existing):
+                save_m3u(f"{out_dir}/{sanitize_filename(playlist_name)} - {playlist_id}.m3u")
+
+        # a m3u parcial (apenas com os vídeos listados) é substituída pela gerada com os dados do índice.
+        if listing_errors:
+            regenerate_m3u(out_dir, [playlist_id])
+
+        if not futures and kwargs.get("download", True):
             time.sleep(10)
-        else:
-            total_entries = len(ytdl_args_list)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                futures = [executor.submit(download_video, total_entries=total_entries, *args) for n, args in
-                           enumerate(ytdl_args_list)]
-                for future in concurrent.futures.as_completed(futures):
-                    future.result()
 
         m3u_data.clear()
 
@@ -381,9 +860,9 @@ def download_playlist(file_list: list, out_dir: str, only_audio=True, **kwargs):
             removed_files = 0
 
             for f in os.listdir(f"{synced_dir}/{playlist_id}/.synced_playlist_data/"):
-                if not f.endswith((".mp3", ".mp4")):
+                if not f.endswith(tuple(f".{e}" for e in media_exts)):
                     continue
-                if f[:-4] not in track_ids:
+                if os.path.splitext(f)[0] not in track_ids:
                     send2trash(os.path.abspath(f"{synced_dir}/{playlist_id}/.synced_playlist_data/{f}"))
                     removed_files += 1
 
@@ -393,46 +872,175 @@ def download_playlist(file_list: list, out_dir: str, only_audio=True, **kwargs):
 
         print(f"\n\nA playlist \"{playlist_name} - {playlist_id}.m3u\" foi salva no diretório: {os.path.abspath(out_dir)}")
 
+    write_report(library)
+
+    if quota.enabled and kwargs.get("download", True):
+        quota.enforce()
+        quota.rewrite_m3u_files(out_dir)
+        quota.report()
+
     try:
         os.remove("cookies.temp")
     except FileNotFoundError:
         pass
 
 
-def download_video(name: str, counter: int, yt_id: str, args, playlist_dir: str, out_dir: str, index: int, ext: str,
-                   playlist_name: str, playlist_id: str, total_entries_original, track_counter, total_entries: int):
-    logging.info(f"\n[{counter}/{total_entries}] Baixando: [{yt_id}] -> {name}")
+def download_video(name: str, counter: int, yt_id: str, args, playlist_dir: str, out_dir: str, index: int,
+                   playlist_name: str, playlist_id: str, track_number: str, egress_pool: Optional[EgressPool] = None,
+                   watchdog: Optional[DownloadWatchdog] = None, duration: Optional[float] = None,
+                   worker_pool: Optional[YtdlWorkerPool] = None):
+    with tracer.span("track", cat="track", yt_id=yt_id, title=name, playlist_id=playlist_id):
+
+        job = watchdog.watch(yt_id, duration) if watchdog else None
+
+        # os hooks são adicionados uma única vez: os mesmos args são reaproveitados nas tentativas em outras saídas.
+        if job:
+            job.add_to(args)
+
+        if tracer.enabled:
+            YtdlStageHooks(tracer).add_to(args)
+
+        try:
+            if not egress_pool:
+                return _download_video(name, counter, yt_id, args, playlist_dir, out_dir, index, playlist_name,
+                                       playlist_id, track_number, worker_pool=worker_pool, job=job)
+
+            monitor = EgressMonitor()
+            args.setdefault("progress_hooks", []).append(monitor.progress_hook)
+
+            attempts = 0
+
+            while True:
+
+                egress = egress_pool.acquire()
+                egress.apply(args)
+                monitor.reset()
+
+                if job:
+                    job.restart()
+
+                try:
+                    result = _download_video(name, counter, yt_id, args, playlist_dir, out_dir, index, playlist_name,
+                                             playlist_id, track_number, egress, worker_pool, job)
+                except Exception as e:
+                    attempts += 1
+                    # quando a saída é bloqueada o download é tentado novamente em outra saída disponível.
+                    if egress_pool.release(egress, error=e) and attempts < len(egress_pool.egresses) \
+                            and egress_pool.has_available() and not (job and job.cancelled):
+                        continue
+                    raise
+
+                egress_pool.release(egress, downloaded_bytes=monitor.downloaded_bytes, elapsed=monitor.elapsed)
+
+                return result
+
+        except Exception as e:
+            # o erro causado pelo cancelamento (ex: ffmpeg finalizado) é substituído pelo motivo do cancelamento.
+            if job and job.cancelled and not isinstance(e, DownloadStalled):
+                raise DownloadStalled(job.cancelled) from e
+            raise
+
+        finally:
+            if job:
+                watchdog.done(job)
+
+
+def _download_video(name: str, counter: int, yt_id: str, args, playlist_dir: str, out_dir: str, index: int,
+                    playlist_name: str, playlist_id: str, track_number: str, egress=None,
+                    worker_pool: Optional[YtdlWorkerPool] = None, job=None):
+    logging.info(f"\n[{counter}] Baixando: [{yt_id}] -> {name}" + (f" (via {egress})" if egress else ""))
 
     filepath = None
 
     try:
-        with yt_dlp.YoutubeDL(args) as ytdl:
-            r = ytdl.extract_info(url=f"https://www.youtube.com/watch?v={yt_id}")
-            filepath = r['requested_downloads'][0]['filepath']
-            m3u_data[index] = (f"#EXTINF:{r['duration']},{r['title']} - Por: {r['uploader']}\n"
-                               f"./.synced_playlist_data/{playlist_id}/{yt_id}.{ext}")
+        tracer.begin("extract")
+        if worker_pool:
+            r = worker_pool.run(yt_id, args, job)
+        else:
+            with yt_dlp.YoutubeDL(args) as ytdl:
+                r = ytdl.extract_info(url=f"https://www.youtube.com/watch?v={yt_id}")
+        tracer.end("extract")
+        filepath = r['requested_downloads'][0]['filepath']
+        m3u_data[index] = (f"#EXTINF:{r['duration']},{r['title']} - Por: {r['uploader']}\n"
+                           f"./.synced_playlist_data/{playlist_id}/{os.path.basename(filepath)}")
     except Exception as e:
+        tracer.instant("error", error=repr(e))
         logging.info(f"Erro ao baixar: [{yt_id}] -> {name} | {repr(e)}")
+        with tracer.span("sleep"):
+            time.sleep(3)
+        raise
 
-    time.sleep(3)
+    with tracer.span("sleep"):
+        time.sleep(3)
 
     if filepath:
         try:
-            if ext == "mp3":
-                tag = MP3(filepath, ID3=EasyID3)
-                tag["tracknumber"] = f"{track_counter}/{total_entries_original}"
-            else:
-                tag = MP4(filepath)
-                try:
-                    tag['trac'][0] = f"{track_counter}/{total_entries_original}"
-                except KeyError:
-                    tag['trac'] = [f"{track_counter}/{total_entries_original}"]
-            tag.save()
-            shutil.move(filepath, f"{playlist_dir}/{os.path.basename(filepath)}")
-            save_m3u(f"{out_dir}/{sanitize_filename(playlist_name)} - {playlist_id}.m3u")
+            with tracer.span("tag"):
+                set_track_number(filepath, track_number)
+            with tracer.span("move"):
+                # a área temporária fica no mesmo disco: a música aparece na playlist já completa (rename atômico).
+                os.replace(filepath, final_path := f"{playlist_dir}/{os.path.basename(filepath)}")
+            with tracer.span("m3u"):
+                save_m3u(f"{out_dir}/{sanitize_filename(playlist_name)} - {playlist_id}.m3u")
+            return final_path
         except FileNotFoundError:
             pass
 
 
 if __name__ == '__main__':
-    run()
+    import argparse
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Sincroniza músicas e vídeos de playlists do youtube.")
+    parser.add_argument("--verify", nargs="?", const="fast", choices=("fast", "deep"),
+                        help="Verifica a integridade dos arquivos antes de sincronizar (fast: cabeçalho e duração, "
+                             "deep: decodificação completa via ffmpeg). Arquivos com problema são baixados novamente.")
+    parser.add_argument("--relocate", nargs=2, metavar=("{audio,video}", "DIRETÓRIO"),
+                        help="Move a biblioteca de áudio ou vídeo para outro diretório (pode ser continuado caso seja "
+                             "interrompido) e atualiza os arquivos m3u.")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Tenta baixar novamente todos os vídeos que falharam anteriormente (inclusive erros "
+                             "permanentes, ex: após adicionar o cookies.txt em vídeos com restrição de idade).")
+    parser.add_argument("--trace", nargs="?", const="sync_trace.json", metavar="ARQUIVO",
+                        help="Salva a linha do tempo da sincronização (por música e etapa) no formato chrome trace "
+                             "(pode ser aberto no chrome://tracing ou ui.perfetto.dev).")
+    parser.add_argument("--trace-profile", metavar="ETAPAS",
+                        help="Etapas (separadas por vírgula) que terão amostras do profiler salvas junto do trace, ex: "
+                             "track,extract,download,postprocess:FFmpegExtractAudio,tag,move,m3u,enumerate")
+    parser.add_argument("--fetch-evicted", action="store_true",
+                        help="Baixa novamente as músicas/vídeos removidos pela cota de espaço (removendo outros arquivos "
+                             "menos reproduzidos caso necessário).")
+    parser.add_argument("--playlist", nargs="+", metavar="ID", dest="playlist_ids",
+                        type=lambda p: (m.group() if (m := yt_playlist_regex.search(p)) else p.strip()),
+                        help="Sincroniza apenas as playlists informadas (id ou link, precisam estar nos arquivos de links).")
+    parser.add_argument("--type", choices=("audio", "video"), dest="media_type",
+                        help="Sincroniza apenas as playlists de áudio ou de vídeo.")
+    parser.add_argument("--only", choices=("metadata", "m3u", "gc", "publish"),
+                        help="metadata: atualiza apenas os dados, tags e m3u (sem baixar arquivos novos). "
+                             "m3u: gera novamente as playlists m3u usando o índice local (sem acessar o youtube). "
+                             "gc: remove arquivos que não estão mais nas playlists, temporários e playlists removidas "
+                             "dos arquivos de links (movidos para a lixeira). publish: envia a biblioteca para o "
+                             "armazenamento configurado no STORAGE_URL (ex: bucket s3).")
+    parser.add_argument("--search", nargs="+", metavar="TEXTO",
+                        help="Busca músicas/vídeos na biblioteca local pelo título, canal, nome da playlist ou id do "
+                             "vídeo (sem acessar o youtube) e mostra o caminho do arquivo e a posição na playlist.")
+    parser.add_argument("--import-ytdl", nargs="+", metavar="CAMINHO",
+                        help="Importa arquivos baixados com o yt-dlp (pastas com os arquivos e/ou arquivos do "
+                             "--download-archive) em vez de baixá-los novamente.")
+    parser.add_argument("--import-mode", choices=("link", "move"), default="link",
+                        help="link: cria um hardlink (sem ocupar espaço, as tags ficam compartilhadas com o arquivo "
+                             "original; em outro disco é feita uma cópia). move: move os arquivos para a biblioteca.")
+    parser.add_argument("--export-archive", metavar="ARQUIVO",
+                        help="Grava (ou atualiza) um arquivo no formato do --download-archive do yt-dlp com os vídeos "
+                             "já baixados na biblioteca.")
+    cli_args = parser.parse_args()
+
+    if cli_args.relocate and cli_args.relocate[0] not in ("audio", "video"):
+        parser.error("--relocate: o tipo deve ser audio ou video")
+
+    load_dotenv()
+    run(verify=cli_args.verify, relocate=cli_args.relocate, retry_failed=cli_args.retry_failed, trace=cli_args.trace,
+        trace_profile=cli_args.trace_profile, fetch_evicted=cli_args.fetch_evicted, playlist_ids=cli_args.playlist_ids,
+        media_type=cli_args.media_type, only=cli_args.only,
+        search=" ".join(cli_args.search) if cli_args.search else None, import_ytdl=cli_args.import_ytdl,
+        import_mode=cli_args.import_mode, export_archive_file=cli_args.export_archive)
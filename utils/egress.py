@@ -0,0 +1,202 @@
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+import yt_dlp
+
+egress_file = "./egress.txt"
+
+# erros que indicam que o endereço está sendo limitado pelo youtube.
+throttle_regex = re.compile(r"HTTP Error (429|403)|not a bot|rate.?limit", re.IGNORECASE)
+
+# downloads menores que isso não são usados pra medir a velocidade.
+min_speed_sample = 1024 * 1024
+
+
+class Egress:
+
+    def __init__(self, kind: str, value: str):
+        self.kind = kind
+        self.value = value
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.strikes = 0
+        self.throttled_until = 0.0
+        self.last_speed: Optional[float] = None
+
+    def __repr__(self):
+        return f"{self.kind}:{self.value}"
+
+    def apply(self, args: dict):
+        # os args são reaproveitados entre as tentativas: a opção da saída anterior (de outro tipo) é removida.
+        if self.kind == "proxy":
+            args["proxy"] = self.value
+            args.pop("source_address", None)
+        else:
+            args["source_address"] = self.value
+            args.pop("proxy", None)
+
+    def available(self, now: float) -> bool:
+        return self.throttled_until <= now
+
+
+def parse_egress(line: str) -> Optional[Egress]:
+
+    if not (line := line.split("#", 1)[0].strip()):
+        return None
+
+    if line.startswith(("source:", "proxy:")):
+        kind, value = line.split(":", 1)
+        return Egress(kind, value.strip())
+
+    # linhas com esquema (ex: socks5://, http://) são proxies, as demais são endereços ip locais.
+    return Egress("proxy" if "://" in line else "source", line)
+
+
+class EgressPool:
+
+    def __init__(self, egresses: list, min_speed: float = 100 * 1024, cooldown: float = 600,
+                 max_cooldown: float = 60 * 60 * 6):
+        self.egresses = egresses
+        self.min_speed = min_speed
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, file: str = egress_file) -> Optional["EgressPool"]:
+
+        try:
+            with open(file) as f:
+                egresses = [e for line in f.read().split("\n") if (e := parse_egress(line))]
+        except FileNotFoundError:
+            return None
+
+        if not egresses:
+            return None
+
+        return cls(
+            egresses,
+            min_speed=float(os.getenv("EGRESS_MIN_SPEED") or 100) * 1024,
+            cooldown=float(os.getenv("EGRESS_COOLDOWN") or 600),
+        )
+
+    @property
+    def workers(self) -> int:
+        return int(os.getenv("EGRESS_WORKERS") or 0) or len(self.egresses)
+
+    def acquire(self) -> Egress:
+
+        with self.lock:
+
+            now = time.time()
+
+            # a saída menos ocupada entre as que não estão limitadas (ou a que for liberada primeiro).
+            if available := [e for e in self.egresses if e.available(now)]:
+                egress = min(available, key=lambda e: (e.in_flight, e.strikes, -e.successes))
+            else:
+                egress = min(self.egresses, key=lambda e: e.throttled_until)
+
+            egress.in_flight += 1
+
+            return egress
+
+    def throttle(self, egress: Egress, reason: str):
+        egress.strikes += 1
+        delay = min(self.max_cooldown, self.cooldown * 2 ** (egress.strikes - 1))
+        egress.throttled_until = time.time() + delay
+        print(f"Saída de rede limitada ({reason}): {egress} | pausada por {int(delay / 60)} minuto"
+              f"{'s'[:int(delay / 60) ^ 1]}")
+
+    def release(self, egress: Egress, error: Optional[Exception] = None, downloaded_bytes: int = 0,
+                elapsed: float = 0):
+
+        with self.lock:
+
+            egress.in_flight -= 1
+
+            if error:
+                egress.failures += 1
+                if throttle_regex.search(str(error)):
+                    self.throttle(egress, "bloqueio")
+                    return True
+                return False
+
+            egress.successes += 1
+
+            if downloaded_bytes >= min_speed_sample and elapsed > 0:
+
+                egress.last_speed = downloaded_bytes / elapsed
+
+                if egress.last_speed < self.min_speed:
+                    self.throttle(egress, f"{int(egress.last_speed / 1024)}KB/s")
+                    return True
+
+            egress.strikes = 0
+
+            return False
+
+    def has_available(self) -> bool:
+        now = time.time()
+        return any(e.available(now) for e in self.egresses)
+
+    def status(self) -> str:
+        now = time.time()
+        return "\n".join(
+            f"{e}: {e.successes} ok, {e.failures} erro{'s'[:e.failures ^ 1]}"
+            + (f", {int(e.last_speed / 1024)}KB/s" if e.last_speed else "")
+            + ("" if e.available(now) else f", pausada até {time.strftime('%H:%M', time.localtime(e.throttled_until))}")
+            for e in self.egresses
+        )
+
+
+class EgressMonitor:
+
+    # mede a velocidade do download (usando os dados do progress_hook do yt-dlp).
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.downloaded_bytes = 0
+        self.elapsed = 0.0
+
+    def progress_hook(self, d: dict):
+        if d["status"] == "finished":
+            self.downloaded_bytes += d.get("downloaded_bytes") or d.get("total_bytes") or 0
+            self.elapsed += d.get("elapsed") or 0
+
+
+def probe(egress: Egress, url: str, timeout: float = 10):
+
+    args = {"quiet": True, "no_warnings": True, "socket_timeout": timeout}
+    egress.apply(args)
+
+    start = time.perf_counter()
+
+    with yt_dlp.YoutubeDL(args) as ydl:
+        with ydl.urlopen(url) as r:
+            size = len(r.read())
+
+    return size, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    import sys
+
+    # teste das saídas configuradas no egress.txt (pode ser usado com um servidor local, ex: python -m http.server).
+    check_url = sys.argv[1] if len(sys.argv) > 1 else "https://www.youtube.com/generate_204"
+
+    if not (pool := EgressPool.load()):
+        print(f"Nenhuma saída de rede configurada no arquivo: {egress_file}")
+        sys.exit(1)
+
+    for e in pool.egresses:
+        try:
+            size, elapsed = probe(e, check_url)
+        except Exception as ex:
+            print(f"{e}: erro -> {repr(ex)}")
+        else:
+            print(f"{e}: ok ({size} bytes em {elapsed * 1000:.0f}ms)")
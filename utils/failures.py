@@ -0,0 +1,114 @@
+import os
+import time
+from typing import Optional
+
+from utils.library_index import LibraryIndex
+
+report_filename = "falhas.txt"
+
+# erros que não vão mudar numa nova tentativa (o vídeo só é baixado novamente usando a opção --retry-failed).
+permanent_errors = {
+    "private video": "vídeo privado",
+    "video unavailable": "vídeo indisponível",
+    "this video has been removed": "vídeo removido",
+    "no longer available": "vídeo indisponível",
+    "does not exist": "vídeo inexistente",
+    "account associated with this video has been terminated": "canal encerrado",
+    "copyright": "removido por direitos autorais",
+    "not available in your country": "bloqueio regional",
+    "blocked it in your country": "bloqueio regional",
+    "confirm your age": "restrição de idade",
+    "age-restricted": "restrição de idade",
+    "inappropriate for some users": "restrição de idade",
+    "members-only": "exclusivo para membros",
+    "join this channel": "exclusivo para membros",
+    "requires payment": "conteúdo pago",
+}
+
+transient_errors = {
+    "premieres in": "estreia agendada",
+    "live event will begin": "estreia agendada",
+    "http error 429": "limite de requisições",
+    "not a bot": "limite de requisições",
+    # "video unavailable. this content isn't available, try again later" (limite de requisições do youtube).
+    "try again later": "limite de requisições",
+    "content isn't available": "limite de requisições",
+    "download travado": "download travado",
+}
+
+# intervalo entre novas tentativas de erros temporários: 1h, 2h, 4h... até 7 dias.
+retry_base_delay = 60 * 60
+retry_max_delay = 60 * 60 * 24 * 7
+
+
+def classify_error(message: str):
+
+    message = message.lower()
+
+    # os erros temporários são verificados antes (ex: "sign in to confirm you're not a bot" x "confirm your age").
+    for pattern, reason in transient_errors.items():
+        if pattern in message:
+            return "transient", reason
+
+    for pattern, reason in permanent_errors.items():
+        if pattern in message:
+            return "permanent", reason
+
+    return "transient", "erro temporário"
+
+
+def retry_delay(attempts: int) -> float:
+    return min(retry_max_delay, retry_base_delay * 2 ** (max(attempts, 1) - 1))
+
+
+def is_due(failure, now: Optional[float] = None) -> bool:
+    if failure["kind"] == "permanent":
+        return False
+    return (failure["next_retry_at"] or 0) <= (now or time.time())
+
+
+def record_failure(library: LibraryIndex, video_id: str, error: Exception, previous=None):
+
+    message = str(error)
+    kind, reason = classify_error(message)
+    attempts = (previous["attempts"] if previous else 0) + 1
+    next_retry_at = None if kind == "permanent" else time.time() + retry_delay(attempts)
+
+    library.record_failure(video_id, kind, reason, message[:500], attempts, next_retry_at)
+
+    return kind, reason, next_retry_at
+
+
+def format_retry(next_retry_at: Optional[float]) -> str:
+    if not next_retry_at:
+        return "não será baixado novamente"
+    return f"nova tentativa após {time.strftime('%d/%m/%Y %H:%M', time.localtime(next_retry_at))}"
+
+
+def write_report(library: LibraryIndex):
+
+    rows = library.execute(
+        "SELECT f.*, t.playlist_id, t.title FROM failures f LEFT JOIN tracks t ON t.video_id = f.video_id "
+        "ORDER BY f.kind, f.reason, t.playlist_id, t.position"
+    )
+
+    path = f"{library.data_dir}/{report_filename}"
+
+    if not rows:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return
+
+    with open(path, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(f"[{r['reason']}] {r['title'] or ''} | https://www.youtube.com/watch?v={r['video_id']} | "
+                    f"playlist: {r['playlist_id'] or '-'} | tentativas: {r['attempts']} | "
+                    f"{format_retry(r['next_retry_at'])}\n    {r['message']}\n")
+
+    permanent = len({r["video_id"] for r in rows if r["kind"] == "permanent"})
+    transient = len({r["video_id"] for r in rows if r["kind"] != "permanent"})
+
+    print(f"\n\nFalhas de download: {permanent} permanente{'s'[:permanent ^ 1]}, {transient} temporária"
+          f"{'s'[:transient ^ 1]}. Relatório salvo em: {path}")
@@ -0,0 +1,147 @@
+import os
+import shutil
+
+from send2trash import send2trash
+
+from utils.library_index import LibraryIndex
+from utils.tags import media_exts
+
+# arquivos temporários deixados por downloads interrompidos.
+temp_exts = (".part", ".ytdl", ".temp", ".tmp")
+
+
+def staging_dir(out_dir: str) -> str:
+    # downloads em andamento: no mesmo disco da biblioteca pra música ser finalizada com um único rename.
+    return f"{out_dir}/.synced_playlist_data/.staging"
+
+
+def clean_staging(out_dir: str) -> int:
+
+    if not os.path.isdir(path := staging_dir(out_dir)):
+        return 0
+
+    removed = 0
+
+    # restos de downloads/conversões interrompidos (.part, thumbnails, arquivos ainda não movidos pra playlist).
+    for f in os.listdir(path):
+        try:
+            if os.path.isdir(f"{path}/{f}"):
+                shutil.rmtree(f"{path}/{f}")
+            else:
+                os.remove(f"{path}/{f}")
+        except OSError:
+            continue
+        removed += 1
+
+    return removed
+
+
+def prune_deleted(library: LibraryIndex) -> int:
+
+    deleted_dir = f"{library.data_dir}/deleted"
+
+    if not os.path.isdir(deleted_dir):
+        return 0
+
+    referenced = {r["file"] for r in library.execute("SELECT DISTINCT file FROM tracks WHERE file LIKE 'deleted/%'")}
+
+    removed = 0
+
+    # músicas de vídeos deletados que não estão mais em nenhuma playlist (não podem ser baixadas novamente, por isso vão
+    # para a lixeira, ex: índice incompleto ou playlist que não foi listada).
+    for f in os.listdir(deleted_dir):
+        if f"deleted/{f}" not in referenced and os.path.isfile(path := f"{deleted_dir}/{f}"):
+            send2trash(os.path.abspath(path))
+            removed += 1
+
+    return removed
+
+
+def remove_playlist(library: LibraryIndex, out_dir: str, playlist_id: str):
+
+    if os.path.isdir(playlist_dir := f"{library.data_dir}/{playlist_id}"):
+        send2trash(os.path.abspath(playlist_dir))
+
+    for f in os.listdir(out_dir):
+        if f.endswith(f" - {playlist_id}.m3u"):
+            os.remove(f"{out_dir}/{f}")
+
+    library.execute("DELETE FROM tracks WHERE playlist_id = ?", (playlist_id,))
+    library.execute("DELETE FROM playlists WHERE playlist_id = ?", (playlist_id,))
+    library.execute("DELETE FROM playlist_snapshots WHERE playlist_id = ?", (playlist_id,))
+
+
+def collect_garbage(out_dir: str, active_playlists: list, only_playlists: list = None):
+
+    library = LibraryIndex(out_dir)
+
+    if not os.path.isdir(library.data_dir):
+        return
+
+    # apenas playlists já registradas no índice (evita remover arquivos de bibliotecas ainda não indexadas).
+    indexed = {r["playlist_id"] for r in library.execute("SELECT playlist_id FROM playlists")}
+
+    targets = indexed & set(only_playlists) if only_playlists else indexed
+
+    removed_playlists = 0
+    removed_files = 0
+    temp_files = 0
+    missing_files = 0
+
+    for playlist_id in sorted(targets):
+
+        # playlists removidas dos arquivos de links.
+        if playlist_id not in active_playlists:
+            remove_playlist(library, out_dir, playlist_id)
+            removed_playlists += 1
+            continue
+
+        if not os.path.isdir(playlist_dir := f"{library.data_dir}/{playlist_id}"):
+            continue
+
+        video_ids = {r["video_id"] for r in library.tracks(playlist_id)}
+
+        for f in os.listdir(playlist_dir):
+
+            if not os.path.isfile(path := f"{playlist_dir}/{f}"):
+                continue
+
+            if f.endswith(temp_exts):
+                os.remove(path)
+                temp_files += 1
+
+            elif f.endswith(tuple(f".{e}" for e in media_exts)) and os.path.splitext(f)[0] not in video_ids:
+                send2trash(os.path.abspath(path))
+                removed_files += 1
+
+    # arquivos registrados no índice que não existem mais no disco.
+    for row in library.tracks(with_file=True):
+        if (not only_playlists or row["playlist_id"] in targets) and library.file_stat(row["file"])[0] is None:
+            library.set_file(row["playlist_id"], row["video_id"], None)
+            missing_files += 1
+
+    # a pasta deleted é compartilhada por todas as playlists: só é limpa quando todas as playlists dos arquivos de links
+    # já foram listadas por completo (senão arquivos ainda usados não estariam no índice).
+    listed = {r["playlist_id"] for r in library.execute("SELECT playlist_id FROM playlist_snapshots")}
+
+    if not only_playlists and set(active_playlists) <= indexed & listed:
+        deleted_files = prune_deleted(library)
+    else:
+        deleted_files = 0
+        if not only_playlists:
+            print("A pasta deleted não foi limpa: há playlists que ainda não foram sincronizadas por completo.")
+
+    temp_files += clean_staging(out_dir)
+
+    # thumbnails em cache de vídeos que não estão mais em nenhuma playlist.
+    if not only_playlists and os.path.isdir(thumbnails := f"{library.data_dir}/.thumbnails"):
+        video_ids = {r["video_id"] for r in library.execute("SELECT DISTINCT video_id FROM tracks")}
+        for f in os.listdir(thumbnails):
+            if os.path.splitext(f)[0] not in video_ids:
+                os.remove(f"{thumbnails}/{f}")
+                temp_files += 1
+
+    print(f"\n\nLimpeza de: {out_dir}\n"
+          f"Playlists removidas: {removed_playlists} | arquivos fora das playlists (lixeira): {removed_files} | "
+          f"temporários: {temp_files} | arquivos ausentes no índice: {missing_files} | "
+          f"vídeos deletados sem playlist: {deleted_files}")
@@ -0,0 +1,407 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+index_filename = "library.db"
+
+search_term_regex = re.compile(r"\w+")
+
+# títulos dos vídeos deletados/privados na listagem da playlist (usados nos índices criados antes da coluna unavailable).
+unavailable_titles = ("[Deleted video]", "[Private video]")
+
+
+class LibraryIndex:
+
+    def __init__(self, out_dir: str):
+        self.data_dir = f"{out_dir}/.synced_playlist_data"
+        self.path = f"{self.data_dir}/{index_filename}"
+        self.conn: Optional[sqlite3.Connection] = None
+        self.lock = threading.RLock()
+        self.fts = False
+
+    def connect(self):
+
+        if self.conn:
+            return self.conn
+
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        # o índice é compartilhado entre as threads de download (e o rpc), por isso o uso do WAL + lock.
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS playlists (
+                playlist_id TEXT PRIMARY KEY,
+                title TEXT,
+                updated_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS tracks (
+                playlist_id TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                position INTEGER,
+                title TEXT,
+                uploader TEXT,
+                duration REAL,
+                file TEXT,
+                size INTEGER,
+                mtime REAL,
+                updated_at REAL,
+                unavailable INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (playlist_id, video_id)
+            );
+            CREATE INDEX IF NOT EXISTS tracks_video_id ON tracks (video_id);
+            CREATE TABLE IF NOT EXISTS verify_cache (
+                file TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime REAL,
+                level TEXT,
+                ok INTEGER,
+                error TEXT,
+                checked_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS failures (
+                video_id TEXT PRIMARY KEY,
+                kind TEXT,
+                reason TEXT,
+                message TEXT,
+                attempts INTEGER,
+                first_failed_at REAL,
+                last_failed_at REAL,
+                next_retry_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS plays (
+                video_id TEXT PRIMARY KEY,
+                play_count INTEGER,
+                last_played_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS evicted (
+                video_id TEXT PRIMARY KEY,
+                size INTEGER,
+                evicted_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS playlist_snapshots (
+                playlist_id TEXT PRIMARY KEY,
+                signature TEXT,
+                tracks TEXT,
+                enumerated_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS storage_etags (
+                file TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime REAL,
+                scheme TEXT,
+                etag TEXT
+            );
+            """
+        )
+        self.migrate(conn)
+        self.fts = self.create_search_index(conn)
+        self.conn = conn
+        return conn
+
+    @staticmethod
+    def migrate(conn: sqlite3.Connection):
+
+        if "unavailable" in {r["name"] for r in conn.execute("PRAGMA table_info(tracks)")}:
+            return
+
+        conn.execute("ALTER TABLE tracks ADD COLUMN unavailable INTEGER NOT NULL DEFAULT 0")
+
+        # vídeos deletados/privados da última listagem completa (marcados novamente a cada sincronização).
+        rows = [
+            (playlist_id, t[0])
+            for playlist_id, tracks in conn.execute("SELECT playlist_id, tracks FROM playlist_snapshots")
+            for t in json.loads(tracks) if t[1] in unavailable_titles
+        ]
+
+        if rows:
+            conn.executemany("UPDATE tracks SET unavailable = 1 WHERE playlist_id = ? AND video_id = ?", rows)
+
+    @staticmethod
+    def create_search_index(conn: sqlite3.Connection) -> bool:
+
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'tracks_fts'").fetchone()
+
+        # o índice de busca é atualizado pelos triggers a cada música adicionada, alterada ou removida.
+        try:
+            conn.executescript(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5 (
+                    title, uploader, playlist, video_id, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+                );
+                CREATE TRIGGER IF NOT EXISTS tracks_fts_insert AFTER INSERT ON tracks BEGIN
+                    INSERT INTO tracks_fts (rowid, title, uploader, playlist, video_id) VALUES (
+                        new.rowid, new.title, new.uploader,
+                        (SELECT title FROM playlists WHERE playlist_id = new.playlist_id), new.video_id
+                    );
+                END;
+                CREATE TRIGGER IF NOT EXISTS tracks_fts_delete AFTER DELETE ON tracks BEGIN
+                    DELETE FROM tracks_fts WHERE rowid = old.rowid;
+                END;
+                CREATE TRIGGER IF NOT EXISTS tracks_fts_update AFTER UPDATE OF title, uploader ON tracks
+                WHEN old.title IS NOT new.title OR old.uploader IS NOT new.uploader BEGIN
+                    UPDATE tracks_fts SET title = new.title, uploader = new.uploader WHERE rowid = new.rowid;
+                END;
+                CREATE TRIGGER IF NOT EXISTS playlists_fts_update AFTER UPDATE OF title ON playlists
+                WHEN old.title IS NOT new.title BEGIN
+                    UPDATE tracks_fts SET playlist = new.title
+                    WHERE rowid IN (SELECT rowid FROM tracks WHERE playlist_id = new.playlist_id);
+                END;
+                """
+            )
+        except sqlite3.OperationalError:
+            # sqlite sem suporte ao fts5: a busca é feita com LIKE (mais lenta em bibliotecas grandes).
+            return False
+
+        # bibliotecas criadas antes do índice de busca.
+        if not exists:
+            conn.execute(
+                "INSERT INTO tracks_fts (rowid, title, uploader, playlist, video_id) "
+                "SELECT t.rowid, t.title, t.uploader, p.title, t.video_id FROM tracks t "
+                "LEFT JOIN playlists p ON p.playlist_id = t.playlist_id"
+            )
+
+        return True
+
+    def execute(self, query: str, params: Iterable = ()):
+        with self.lock:
+            return self.connect().execute(query, tuple(params)).fetchall()
+
+    def executemany(self, query: str, rows: list):
+        with self.lock:
+            conn = self.connect()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(query, rows)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
+    def rel_path(self, path: str) -> str:
+        return os.path.relpath(path, self.data_dir).replace("\\", "/")
+
+    def abs_path(self, file: str) -> str:
+        return f"{self.data_dir}/{file}"
+
+    def file_stat(self, file: Optional[str]):
+        if not file:
+            return None, None
+        try:
+            st = os.stat(self.abs_path(file))
+        except FileNotFoundError:
+            return None, None
+        return st.st_size, st.st_mtime
+
+    def upsert_playlist(self, playlist_id: str, title: str):
+        self.execute(
+            "INSERT INTO playlists (playlist_id, title, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (playlist_id) DO UPDATE SET title = excluded.title, updated_at = excluded.updated_at",
+            (playlist_id, title, time.time())
+        )
+
+    def upsert_track(self, playlist_id: str, video_id: str, position: int, title: Optional[str],
+                     uploader: Optional[str], duration: Optional[float], path: Optional[str] = None,
+                     unavailable: bool = False):
+
+        file = self.rel_path(path) if path else None
+        size, mtime = self.file_stat(file)
+
+        self.execute(
+            "INSERT INTO tracks (playlist_id, video_id, position, title, uploader, duration, file, size, mtime, updated_at, "
+            "unavailable) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (playlist_id, video_id) DO UPDATE SET position = excluded.position, title = excluded.title, "
+            "uploader = excluded.uploader, duration = COALESCE(excluded.duration, duration), file = excluded.file, "
+            "size = excluded.size, mtime = excluded.mtime, updated_at = excluded.updated_at, "
+            "unavailable = excluded.unavailable",
+            (playlist_id, video_id, position, title, uploader, duration, file, size, mtime, time.time(), int(unavailable))
+        )
+
+    def set_file(self, playlist_id: str, video_id: str, path: Optional[str]):
+        file = self.rel_path(path) if path else None
+        size, mtime = self.file_stat(file)
+        self.execute(
+            "UPDATE tracks SET file = ?, size = ?, mtime = ?, updated_at = ? WHERE playlist_id = ? AND video_id = ?",
+            (file, size, mtime, time.time(), playlist_id, video_id)
+        )
+
+    def set_uploader(self, playlist_id: str, video_id: str, uploader: Optional[str]):
+        self.execute("UPDATE tracks SET uploader = ? WHERE playlist_id = ? AND video_id = ?",
+                     (uploader, playlist_id, video_id))
+
+    def prune_playlist(self, playlist_id: str, video_ids: set):
+        rows = self.execute("SELECT video_id FROM tracks WHERE playlist_id = ?", (playlist_id,))
+        if removed := [(playlist_id, r["video_id"]) for r in rows if r["video_id"] not in video_ids]:
+            self.executemany("DELETE FROM tracks WHERE playlist_id = ? AND video_id = ?", removed)
+
+    def tracks(self, playlist_id: Optional[str] = None, with_file: bool = False) -> list:
+        query = "SELECT * FROM tracks"
+        where, params = [], []
+        if playlist_id:
+            where.append("playlist_id = ?")
+            params.append(playlist_id)
+        if with_file:
+            where.append("file IS NOT NULL")
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        return self.execute(query + " ORDER BY playlist_id, position", params)
+
+    def search(self, text: str, limit: int = 50, playlist_ids: Optional[list] = None) -> list:
+
+        if not (terms := search_term_regex.findall(text)):
+            return []
+
+        self.connect()
+
+        playlist_filter = f"playlist_id IN ({', '.join('?' * len(playlist_ids))})" if playlist_ids else None
+
+        if self.fts:
+            # todos os termos precisam estar presentes (também como prefixo, ex: "beeth" encontra "Beethoven").
+            # a ordenação/limite é feita apenas no índice de busca, antes de consultar a tabela de músicas.
+            query = "SELECT rowid FROM tracks_fts WHERE tracks_fts MATCH ?"
+            params = [" ".join(f'"{t}"*' for t in terms)]
+            if playlist_filter:
+                query += f" AND rowid IN (SELECT rowid FROM tracks WHERE {playlist_filter})"
+                params.extend(playlist_ids)
+            return self.execute(
+                "SELECT t.*, p.title AS playlist_title FROM "
+                f"({query} ORDER BY bm25(tracks_fts, 10.0, 5.0, 2.0, 1.0) LIMIT ?) f "
+                "JOIN tracks t ON t.rowid = f.rowid LEFT JOIN playlists p ON p.playlist_id = t.playlist_id", params + [limit]
+            )
+
+        where, params = [], []
+
+        for t in terms:
+            where.append("(t.title LIKE ? OR t.uploader LIKE ? OR p.title LIKE ? OR t.video_id LIKE ?)")
+            params.extend([f"%{t}%"] * 4)
+
+        if playlist_filter:
+            where.append(f"t.{playlist_filter}")
+            params.extend(playlist_ids)
+
+        return self.execute(
+            "SELECT t.*, p.title AS playlist_title FROM tracks t LEFT JOIN playlists p ON p.playlist_id = t.playlist_id "
+            f"WHERE {' AND '.join(where)} ORDER BY t.playlist_id, t.position LIMIT ?", params + [limit]
+        )
+
+    def get_verify(self, file: str, size: int, mtime: float, level: str):
+        rows = self.execute(
+            "SELECT ok, level FROM verify_cache WHERE file = ? AND size = ? AND mtime = ?", (file, size, mtime)
+        )
+        # uma verificação completa (deep) também vale para a rápida (fast).
+        if rows and (rows[0]["level"] == level or rows[0]["level"] == "deep"):
+            return rows[0]["ok"]
+
+    def set_verify(self, rows: list):
+        self.executemany(
+            "INSERT OR REPLACE INTO verify_cache (file, size, mtime, level, ok, error, checked_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+
+    def failures(self) -> dict:
+        return {r["video_id"]: r for r in self.execute("SELECT * FROM failures")}
+
+    def record_failure(self, video_id: str, kind: str, reason: str, message: str, attempts: int,
+                       next_retry_at: Optional[float]):
+        now = time.time()
+        self.execute(
+            "INSERT INTO failures (video_id, kind, reason, message, attempts, first_failed_at, last_failed_at, "
+            "next_retry_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (video_id) DO UPDATE SET kind = excluded.kind, reason = excluded.reason, "
+            "message = excluded.message, attempts = excluded.attempts, last_failed_at = excluded.last_failed_at, "
+            "next_retry_at = excluded.next_retry_at",
+            (video_id, kind, reason, message, attempts, now, now, next_retry_at)
+        )
+
+    def clear_failure(self, video_id: str):
+        self.execute("DELETE FROM failures WHERE video_id = ?", (video_id,))
+
+    def clear_failures(self):
+        self.execute("DELETE FROM failures")
+
+    def record_play(self, video_id: str):
+        self.execute(
+            "INSERT INTO plays (video_id, play_count, last_played_at) VALUES (?, 1, ?) "
+            "ON CONFLICT (video_id) DO UPDATE SET play_count = play_count + 1, last_played_at = excluded.last_played_at",
+            (video_id, time.time())
+        )
+
+    def usage(self, playlist_id: Optional[str] = None) -> int:
+        # o mesmo arquivo pode estar em mais de uma playlist (ex: músicas de vídeos deletados).
+        query = "SELECT file, MAX(size) AS size FROM tracks WHERE file IS NOT NULL"
+        params = []
+        if playlist_id:
+            query += " AND file IN (SELECT file FROM tracks WHERE playlist_id = ?)"
+            params.append(playlist_id)
+        return self.execute(f"SELECT COALESCE(SUM(size), 0) FROM ({query} GROUP BY file)", params)[0][0]
+
+    def unavailable_files(self) -> set:
+        # arquivos de vídeos deletados/privados (a única cópia, não podem ser baixados novamente).
+        return {r["file"] for r in self.execute(
+            "SELECT DISTINCT file FROM tracks WHERE file IS NOT NULL AND (unavailable = 1 OR file LIKE 'deleted/%')"
+        )}
+
+    def eviction_candidates(self, playlist_id: Optional[str] = None) -> list:
+        # as músicas de vídeos deletados/privados (em qualquer playlist) não podem ser baixadas novamente, por isso nunca
+        # são removidas.
+        query = (
+            "SELECT t.file, MIN(t.video_id) AS video_id, MAX(t.size) AS size, "
+            "COALESCE(MAX(p.last_played_at), MAX(t.mtime)) AS last_used FROM tracks t "
+            "LEFT JOIN plays p ON p.video_id = t.video_id WHERE t.file IS NOT NULL AND t.file NOT LIKE 'deleted/%' "
+            "AND t.file NOT IN (SELECT file FROM tracks WHERE unavailable = 1 AND file IS NOT NULL)"
+        )
+        params = []
+        if playlist_id:
+            query += " AND t.file IN (SELECT file FROM tracks WHERE playlist_id = ?)"
+            params.append(playlist_id)
+        return self.execute(query + " GROUP BY t.file ORDER BY last_used", params)
+
+    def evicted(self) -> set:
+        return {r["video_id"] for r in self.execute("SELECT video_id FROM evicted")}
+
+    def set_evicted(self, video_id: str, size: Optional[int]):
+        self.execute(
+            "INSERT OR REPLACE INTO evicted (video_id, size, evicted_at) VALUES (?, ?, ?)", (video_id, size, time.time())
+        )
+
+    def clear_evicted(self, video_id: Optional[str] = None):
+        if video_id:
+            self.execute("DELETE FROM evicted WHERE video_id = ?", (video_id,))
+        else:
+            self.execute("DELETE FROM evicted")
+
+    def remove_file(self, file: str):
+        self.execute("UPDATE tracks SET file = NULL, size = NULL, mtime = NULL, updated_at = ? WHERE file = ?",
+                     (time.time(), file))
+
+    def get_snapshot(self, playlist_id: str) -> Optional[dict]:
+        if rows := self.execute("SELECT * FROM playlist_snapshots WHERE playlist_id = ?", (playlist_id,)):
+            return {"signature": rows[0]["signature"], "tracks": json.loads(rows[0]["tracks"]),
+                    "enumerated_at": rows[0]["enumerated_at"]}
+
+    def set_snapshot(self, playlist_id: str, signature: str, tracks: list):
+        self.execute(
+            "INSERT OR REPLACE INTO playlist_snapshots (playlist_id, signature, tracks, enumerated_at) VALUES (?, ?, ?, ?)",
+            (playlist_id, signature, json.dumps(tracks, separators=(",", ":")), time.time())
+        )
+
+    def storage_etags(self, scheme: str) -> dict:
+        return {r["file"]: r for r in self.execute("SELECT * FROM storage_etags WHERE scheme = ?", (scheme,))}
+
+    def set_storage_etags(self, rows: list):
+        self.executemany(
+            "INSERT OR REPLACE INTO storage_etags (file, size, mtime, scheme, etag) VALUES (?, ?, ?, ?, ?)", rows
+        )
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+
+class LoopLagMonitor:
+
+    # mede o atraso do event loop: quanto uma pausa curta demora além do esperado (tempo em que o loop ficou travado).
+    def __init__(self, interval: float = 0.05, warn_ms: Optional[float] = None, window: int = 72000):
+        self.interval = interval
+        self.warn = warn_ms / 1000 if warn_ms else None
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+        self.slow = 0
+        self.last_warning = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if not self.task or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return self
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+
+        while True:
+
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+            if self.warn and lag > self.warn:
+                self.slow += 1
+                # no máximo um aviso por minuto.
+                if (now := time.monotonic()) - self.last_warning > 60:
+                    self.last_warning = now
+                    print(f"Event loop travado por {lag * 1000:.1f}ms ({self.slow} vez{'es' if self.slow > 1 else ''} "
+                          f"acima de {self.warn * 1000:.0f}ms).")
+
+    def stats(self) -> dict:
+
+        if not self.samples:
+            return {}
+
+        samples = sorted(self.samples)
+
+        def pick(p: float):
+            return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+        return {"p50": pick(0.5), "p99": pick(0.99), "max": self.max_lag * 1000, "samples": len(samples)}
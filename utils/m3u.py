@@ -0,0 +1,73 @@
+import os
+import re
+from typing import Callable, Optional
+
+from utils.failures import format_retry
+from utils.library_index import LibraryIndex
+
+
+def sanitize_filename(filename: str) -> str:
+    return re.sub(r'[<>:"/\\|?*]', '-', filename).rstrip('. ')
+
+
+def m3u_name(playlist_name: str, playlist_id: str) -> str:
+    return f"{sanitize_filename(playlist_name)} - {playlist_id}.m3u"
+
+
+def m3u_filename(out_dir: str, playlist_name: str, playlist_id: str) -> str:
+    return f"{out_dir}/{m3u_name(playlist_name, playlist_id)}"
+
+
+def index_entries(library: LibraryIndex, playlist_id: str, media_url: Optional[Callable[[str], str]] = None) -> list:
+
+    failures = library.failures()
+    evicted = library.evicted()
+
+    entries = []
+
+    for row in library.tracks(playlist_id):
+
+        title = f"{row['title']} - Por: {row['uploader']}"
+        url = f"https://www.youtube.com/watch?v={row['video_id']}"
+
+        if row["file"]:
+            duration = int(row["duration"]) if row["duration"] else ""
+            # caminho relativo ao arquivo m3u ou url completa (ex: biblioteca publicada num servidor/bucket).
+            key = f".synced_playlist_data/{row['file']}"
+            entries.append(f"#EXTINF:{duration},{title}\n{media_url(key) if media_url else f'./{key}'}")
+        elif failure := failures.get(row["video_id"]):
+            entries.append(f"#[Falha: {failure['reason']}] {title} | {url} ({format_retry(failure['next_retry_at'])})")
+        elif row["video_id"] in evicted:
+            entries.append(f"#[Fora da cota] {title} | {url}")
+
+    return entries
+
+
+def regenerate_m3u(out_dir: str, playlist_ids: list) -> int:
+
+    # gera as playlists apenas com os dados do índice (sem acessar o youtube).
+    library = LibraryIndex(out_dir)
+
+    titles = {r["playlist_id"]: r["title"] for r in library.execute("SELECT playlist_id, title FROM playlists")}
+
+    count = 0
+
+    for playlist_id in playlist_ids:
+
+        if not (title := titles.get(playlist_id)):
+            print(f"Playlist ainda não sincronizada (ignorada): {playlist_id}")
+            continue
+
+        for f in os.listdir(out_dir):
+            if f.endswith(f" - {playlist_id}.m3u"):
+                os.remove(f"{out_dir}/{f}")
+
+        if not (entries := index_entries(library, playlist_id)):
+            continue
+
+        with open(m3u_filename(out_dir, title, playlist_id), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(entries))
+
+        count += 1
+
+    return count
@@ -0,0 +1,129 @@
+import concurrent.futures
+import os
+import urllib.error
+import urllib.request
+from typing import NamedTuple, Optional
+
+from utils.tags import set_cover, update_tags
+
+# a thumbnail maxres não existe em todos os vídeos (a hqdefault é 4:3, com faixas pretas nos vídeos 16:9).
+thumbnail_urls = ("https://i.ytimg.com/vi/{}/maxresdefault.jpg", "https://i.ytimg.com/vi/{}/hqdefault.jpg")
+
+
+class TagRefresh(NamedTuple):
+    path: str
+    video_id: str
+    title: Optional[str]
+    uploader: Optional[str]
+    file_title: Optional[str]
+    file_artist: Optional[str]
+    old_uploader: Optional[str]
+
+
+def tag_changes(item: TagRefresh) -> tuple:
+
+    # o título das tags pode ser o nome da música informado pelo youtube music (ex: "Música" no vídeo "Artista - Música
+    # (Clipe Oficial)"), que não é trocado pelo título do vídeo.
+    title = item.title if item.title and item.file_title != item.title and \
+        (not item.file_title or item.file_title.lower() not in item.title.lower()) else None
+
+    # o artista só é trocado quando veio do nome do canal (ex: não substitui o artista informado pelo youtube music).
+    artist = item.uploader if item.uploader and item.file_artist != item.uploader and \
+        item.file_artist in (None, item.old_uploader) else None
+
+    return title, artist
+
+
+def thumbnail_dir(out_dir: str) -> str:
+    return f"{out_dir}/.synced_playlist_data/.thumbnails"
+
+
+def fetch_thumbnail(video_id: str) -> Optional[bytes]:
+
+    for url in thumbnail_urls:
+        try:
+            with urllib.request.urlopen(url.format(video_id), timeout=15) as r:
+                return r.read()
+        except urllib.error.HTTPError as e:
+            if e.code != 404:
+                return None
+        except (urllib.error.URLError, OSError):
+            return None
+
+
+def cached_thumbnail(cache_dir: str, video_id: str) -> Optional[bytes]:
+    try:
+        with open(f"{cache_dir}/{video_id}.jpg", "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def save_thumbnail(cache_dir: str, video_id: str, data: bytes):
+    with open(f"{cache_dir}/{video_id}.jpg.tmp", "wb") as f:
+        f.write(data)
+    os.replace(f"{cache_dir}/{video_id}.jpg.tmp", f"{cache_dir}/{video_id}.jpg")
+
+
+def refresh_file(item: TagRefresh, cache_dir: Optional[str]) -> dict:
+
+    result = {"tags": False, "cover": False, "seeded": False, "errors": []}
+
+    # as tags e a capa são independentes: uma falha na capa não desfaz (nem invalida) o título/artista já gravados.
+    try:
+        result["tags"] = bool(update_tags(item.path, *tag_changes(item)))
+    except Exception as e:
+        result["errors"].append(f"tags: {repr(e)}")
+
+    if not cache_dir or not (data := fetch_thumbnail(item.video_id)):
+        return result
+
+    # sem cópia anterior no cache (ex: primeira atualização) não há como saber se a thumbnail mudou: a capa embutida no
+    # download (melhor qualidade disponível no yt-dlp) é mantida e a thumbnail atual fica salva pra próxima comparação.
+    if (cached := cached_thumbnail(cache_dir, item.video_id)) is None:
+        save_thumbnail(cache_dir, item.video_id, data)
+        result["seeded"] = True
+
+    elif cached != data:
+        try:
+            set_cover(item.path, data)
+        except Exception as e:
+            result["errors"].append(f"capa: {repr(e)}")
+        else:
+            # salva no cache apenas depois de aplicada (uma falha é tentada novamente na próxima alteração).
+            save_thumbnail(cache_dir, item.video_id, data)
+            result["cover"] = True
+
+    return result
+
+
+def refresh_metadata(out_dir: str, items: list, workers: int = 4, thumbnails: bool = False) -> dict:
+
+    stats = {"checked": len(items), "tags": 0, "covers": 0, "seeded": 0, "errors": 0, "failed": []}
+
+    if not items:
+        return stats
+
+    if cache_dir := (thumbnail_dir(out_dir) if thumbnails else None):
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # apenas as tags são regravadas (os arquivos não são baixados nem convertidos novamente).
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(refresh_file, item, cache_dir): item for item in items}
+        for future in concurrent.futures.as_completed(futures):
+            item = futures[future]
+            # uma atualização de tags com problema nunca interrompe a sincronização.
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"tags": False, "cover": False, "seeded": False, "errors": [repr(e)]}
+            for error in result["errors"]:
+                print(f"Erro ao atualizar as tags: {item.path} | {error}")
+            stats["tags"] += result["tags"]
+            stats["covers"] += result["cover"]
+            stats["seeded"] += result["seeded"]
+            if result["errors"]:
+                stats["errors"] += 1
+                stats["failed"].append(item)
+
+    return stats
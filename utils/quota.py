@@ -0,0 +1,198 @@
+import os
+import re
+import time
+from typing import Optional
+
+from utils.library_index import LibraryIndex
+
+playlist_quota_file = "./playlists_quota.txt"
+
+size_regex = re.compile(r"^([\d.,]+)\s*([kmgt]?)i?b?$", re.IGNORECASE)
+
+size_units = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+playlist_quota_regex = re.compile(r"(?:list=)?([a-zA-Z0-9_-]{10,})\S*\s+(\S+)")
+
+m3u_track_regex = re.compile(r"^\./\.synced_playlist_data/(.+)$")
+
+# estimativa de bytes por segundo usada antes do download (a listagem da playlist informa apenas a duração).
+estimate_rates = {
+    (True, False): 192_000 // 8,  # mp3 192kbps
+    (True, True): 160_000 // 8,  # opus/m4a original
+    (False, False): 3_500_000 // 8,  # mp4 até 1080p
+    (False, True): 3_500_000 // 8,
+}
+
+default_duration = 240
+
+
+def parse_size(txt: Optional[str]) -> Optional[int]:
+    if not txt or not (m := size_regex.match(txt.strip())):
+        return None
+    return int(float(m.group(1).replace(",", ".")) * size_units[m.group(2).lower()])
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def load_playlist_quotas(file: str = playlist_quota_file) -> dict:
+    # formato: link (ou id) da playlist e o limite separados por espaço em cada linha, ex: ...list=PLxxxx 5GB
+    try:
+        with open(file) as f:
+            lines = f.read().split("\n")
+    except FileNotFoundError:
+        return {}
+
+    quotas = {}
+
+    for line in lines:
+        if (m := playlist_quota_regex.search(line.strip())) and (size := parse_size(m.group(2))):
+            quotas[m.group(1)] = size
+
+    return quotas
+
+
+def estimate_size(duration: Optional[float], only_audio: bool, native: bool) -> int:
+    return int((duration or default_duration) * estimate_rates[(only_audio, native)])
+
+
+class QuotaManager:
+
+    def __init__(self, library: LibraryIndex, quota: Optional[int], playlist_quotas: dict, min_age: float):
+        self.library = library
+        self.quota = quota
+        self.playlist_quotas = playlist_quotas
+        self.min_age = min_age
+        # estimativa dos downloads em andamento (ainda não registrados no índice).
+        self.pending = {}
+        self.protected = set()
+        self.evicted_files = {}
+        # vídeos removidos pela cota (inclusive os removidos durante essa sincronização, em qualquer playlist).
+        self.evicted = library.evicted() if self.enabled else set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.quota or self.playlist_quotas)
+
+    def pending_size(self, playlist_id: Optional[str] = None) -> int:
+        return sum(size for pid, size in self.pending.values() if not playlist_id or pid == playlist_id)
+
+    def fits(self, playlist_id: str, size: int) -> bool:
+        if self.quota and self.library.usage() + self.pending_size() + size > self.quota:
+            return False
+        if (limit := self.playlist_quotas.get(playlist_id)) and \
+                self.library.usage(playlist_id) + self.pending_size(playlist_id) + size > limit:
+            return False
+        return True
+
+    def admit(self, playlist_id: str, video_id: str, size: int, allow_evict: bool = True) -> bool:
+
+        # músicas já removidas anteriormente só voltam quando houver espaço (evita remover/baixar a cada sincronização).
+        if not self.fits(playlist_id, size) and (not allow_evict or not self.make_room(playlist_id, size)):
+            return False
+
+        self.pending[video_id] = (playlist_id, size)
+        self.protected.add(video_id)
+        return True
+
+    def release(self, video_id: str):
+        self.pending.pop(video_id, None)
+
+    def make_room(self, playlist_id: Optional[str], size: int = 0) -> bool:
+
+        targets = [(None, self.quota)] if self.quota else []
+
+        if playlist_id and (limit := self.playlist_quotas.get(playlist_id)):
+            targets.append((playlist_id, limit))
+
+        for target_playlist, limit in targets:
+
+            excess = self.library.usage(target_playlist) + self.pending_size(target_playlist) + size - limit
+
+            if excess <= 0:
+                continue
+
+            # arquivos reproduzidos (ou baixados) recentemente não são removidos.
+            max_last_used = time.time() - self.min_age
+
+            for row in self.library.eviction_candidates(target_playlist):
+
+                if excess <= 0:
+                    break
+
+                if row["video_id"] in self.protected or (row["last_used"] or 0) > max_last_used:
+                    continue
+
+                self.evict(row["file"], row["video_id"], row["size"] or 0)
+                excess -= row["size"] or 0
+
+            if excess > 0:
+                return False
+
+        return True
+
+    def evict(self, file: str, video_id: str, size: int):
+
+        try:
+            os.remove(self.library.abs_path(file))
+        except FileNotFoundError:
+            pass
+
+        self.library.remove_file(file)
+        self.library.set_evicted(video_id, size)
+        self.evicted_files[file] = video_id
+        self.evicted.add(video_id)
+
+    def enforce(self):
+
+        # também usado quando o limite é reduzido (sem novos downloads). a pasta deleted não é limpa aqui: com o índice
+        # incompleto (ex: --playlist) arquivos ainda usados seriam removidos (veja o --only gc).
+        self.make_room(None)
+
+        for playlist_id in self.playlist_quotas:
+            self.make_room(playlist_id)
+
+    def rewrite_m3u_files(self, out_dir: str):
+
+        if not self.evicted_files:
+            return
+
+        # as músicas removidas continuam na playlist como entradas sem arquivo (podem ser baixadas novamente).
+        for f in os.listdir(out_dir):
+
+            if not f.endswith(".m3u"):
+                continue
+
+            with open(f"{out_dir}/{f}", encoding="utf-8") as fp:
+                entries = fp.read().split("\n\n")
+
+            changed = False
+
+            for i, entry in enumerate(entries):
+
+                lines = entry.split("\n")
+
+                if len(lines) != 2 or not (m := m3u_track_regex.match(lines[1])):
+                    continue
+
+                if video_id := self.evicted_files.get(m.group(1)):
+                    entries[i] = (f"#[Fora da cota] {lines[0].split(',', 1)[-1]} | "
+                                  f"https://www.youtube.com/watch?v={video_id}")
+                    changed = True
+
+            if changed:
+                with open(f"{out_dir}/{f}", "w", encoding="utf-8") as fp:
+                    fp.write("\n\n".join(entries))
+
+    def report(self):
+        if self.evicted_files:
+            print(f"\n\n{len(self.evicted_files)} arquivo{'s'[:len(self.evicted_files) ^ 1]} menos "
+                  f"reproduzido{'s'[:len(self.evicted_files) ^ 1]} removido{'s'[:len(self.evicted_files) ^ 1]} "
+                  f"pra liberar espaço (use --fetch-evicted pra baixar novamente).")
+        if self.quota:
+            print(f"Espaço usado: {format_size(self.library.usage())} de {format_size(self.quota)}")
@@ -0,0 +1,247 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from typing import Optional
+
+journal_filename = ".relocation.json"
+
+m3u_library_path_regex = re.compile(r"^.*?[\\/]\.synced_playlist_data[\\/](.+)$")
+
+
+def existing_parent(path: str) -> str:
+    while not os.path.exists(path):
+        if (parent := os.path.dirname(path)) == path:
+            break
+        path = parent
+    return path
+
+
+def same_filesystem(src: str, dst: str) -> bool:
+    return os.stat(src).st_dev == os.stat(existing_parent(dst)).st_dev
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def same_content(src_path: str, dst_path: str) -> bool:
+    return os.path.getsize(src_path) == os.path.getsize(dst_path) and file_hash(src_path) == file_hash(dst_path)
+
+
+def library_entries(path: str) -> list:
+    # apenas os arquivos gerenciados pela sincronização (a pasta pode ser compartilhada, ex: pasta de músicas do usuário).
+    return [
+        e for e in os.listdir(path)
+        if e in (".synced_playlist_data", ".arquivos_desconhecidos") or e.endswith(".m3u")
+    ]
+
+
+def rename_tree(src: str, dst: str, conflicts: list, entries: Optional[list] = None):
+
+    os.makedirs(dst, exist_ok=True)
+
+    for entry in (entries if entries is not None else os.listdir(src)):
+
+        src_path = f"{src}/{entry}"
+        dst_path = f"{dst}/{entry}"
+
+        if not os.path.exists(dst_path):
+            os.rename(src_path, dst_path)
+
+        elif os.path.isdir(src_path) and os.path.isdir(dst_path):
+            rename_tree(src_path, dst_path, conflicts)
+
+        # já movido numa execução anterior que foi interrompida (m3u e arquivos com tags alteradas podem ter o mesmo
+        # tamanho com outro conteúdo, por isso o conteúdo também é comparado).
+        elif same_content(src_path, dst_path):
+            os.remove(src_path)
+
+        else:
+            conflicts.append(src_path)
+
+
+class CopyJournal:
+
+    def __init__(self, src: str, dst: str):
+        self.path = f"{dst}/{journal_filename}"
+        self.lock = threading.Lock()
+        self.data = {"src": src, "dst": dst, "done": []}
+
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("src") == src:
+                self.data = data
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+        self.done = set(self.data["done"])
+
+    def add(self, rel_path: str):
+        with self.lock:
+            self.done.add(rel_path)
+            if len(self.done) % 50 == 0:
+                self.save()
+
+    def save(self):
+        self.data["done"] = sorted(self.done)
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def copy_verified(src_path: str, dst_path: str):
+
+    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+
+    tmp_path = f"{dst_path}.part"
+
+    shutil.copy2(src_path, tmp_path)
+
+    if os.path.getsize(src_path) != os.path.getsize(tmp_path) or file_hash(src_path) != file_hash(tmp_path):
+        os.remove(tmp_path)
+        raise IOError(f"A cópia do arquivo não confere com o original: {src_path}")
+
+    os.replace(tmp_path, dst_path)
+
+
+def iter_files(src: str, entries: Optional[list] = None):
+    for entry in (entries if entries is not None else os.listdir(src)):
+        if os.path.isfile(f"{src}/{entry}"):
+            yield entry
+            continue
+        for root, _, files in os.walk(f"{src}/{entry}"):
+            for f in files:
+                yield os.path.relpath(f"{root}/{f}", src).replace("\\", "/")
+
+
+def copy_tree(src: str, dst: str, workers: int, conflicts: list, entries: Optional[list] = None):
+
+    os.makedirs(dst, exist_ok=True)
+
+    journal = CopyJournal(src, dst)
+
+    pending = []
+
+    for rel_path in iter_files(src, entries):
+        if rel_path in journal.done or rel_path == journal_filename:
+            continue
+        if os.path.exists(dst_path := f"{dst}/{rel_path}"):
+            # cópia concluída numa execução interrompida antes do journal ser salvo.
+            if same_content(f"{src}/{rel_path}", dst_path):
+                journal.done.add(rel_path)
+            else:
+                conflicts.append(f"{src}/{rel_path}")
+            continue
+        pending.append(rel_path)
+
+    print(f"Copiando {len(pending)} arquivo{'s'[:len(pending) ^ 1]} ({len(journal.done)} já copiados anteriormente)...")
+
+    errors = []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+
+        futures = {executor.submit(copy_verified, f"{src}/{p}", f"{dst}/{p}"): p for p in pending}
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(repr(e))
+                continue
+            journal.add(futures[future])
+
+    journal.save()
+
+    if errors:
+        raise IOError(f"{len(errors)} arquivo(s) não foram copiados (execute novamente para continuar): {errors[:5]}")
+
+    # a pasta original só é removida após todos os arquivos terem sido copiados e conferidos.
+    for rel_path in journal.done:
+        try:
+            os.remove(f"{src}/{rel_path}")
+        except FileNotFoundError:
+            pass
+
+    journal.remove()
+
+
+def remove_empty_dirs(path: str):
+    if not os.path.isdir(path):
+        return
+    for root, _, _ in os.walk(path, topdown=False):
+        if not os.listdir(root):
+            os.rmdir(root)
+
+
+def rewrite_m3u_files(out_dir: str):
+
+    # os caminhos passam a ser relativos à pasta da biblioteca (ex: músicas de vídeos deletados na pasta deleted).
+    for f in os.listdir(out_dir):
+
+        if not f.endswith(".m3u"):
+            continue
+
+        with open(f"{out_dir}/{f}", encoding="utf-8") as fp:
+            lines = fp.read().split("\n")
+
+        new_lines = [
+            line if line.startswith("#") or not (m := m3u_library_path_regex.match(line))
+            else f"./.synced_playlist_data/{m.group(1).replace(chr(92), '/')}"
+            for line in lines
+        ]
+
+        if new_lines != lines:
+            with open(f"{out_dir}/{f}", "w", encoding="utf-8") as fp:
+                fp.write("\n".join(new_lines))
+
+
+def relocate_library(src: str, dst: str, workers: Optional[int] = None, whole_dir: bool = False):
+
+    src = os.path.abspath(src)
+    dst = os.path.abspath(dst)
+
+    if src == dst:
+        return []
+
+    entries = None if whole_dir or not os.path.isdir(src) else library_entries(src)
+
+    for entry in (entries if entries is not None else [""]):
+        if os.path.commonpath([os.path.join(src, entry), dst]) == os.path.normpath(os.path.join(src, entry)):
+            raise Exception(f"O novo diretório não pode ficar dentro da biblioteca atual: {dst}")
+
+    conflicts = []
+
+    if os.path.isdir(src):
+
+        if same_filesystem(src, dst):
+            print(f"\n\nMovendo biblioteca (mesmo disco): {src} -> {dst}")
+            rename_tree(src, dst, conflicts, entries)
+        else:
+            print(f"\n\nCopiando biblioteca (outro disco): {src} -> {dst}")
+            copy_tree(src, dst, workers or min(8, (os.cpu_count() or 1) * 2), conflicts, entries)
+
+        if conflicts:
+            print(f"{len(conflicts)} arquivo{'s'[:len(conflicts) ^ 1]} já existente{'s'[:len(conflicts) ^ 1]} no destino "
+                  f"e diferente{'s'[:len(conflicts) ^ 1]} foram mantidos em: {src}")
+
+        for entry in (entries if entries is not None else [""]):
+            remove_empty_dirs(os.path.join(src, entry))
+
+    rewrite_m3u_files(dst)
+
+    return conflicts
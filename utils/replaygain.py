@@ -0,0 +1,183 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import subprocess
+import traceback
+from typing import Optional
+
+import mutagen
+from mutagen.id3 import ID3, ID3NoHeaderError, TXXX
+from mutagen.mp4 import MP4, MP4FreeForm
+
+from utils.verify import quarantine_dirname
+
+# referência do replaygain 2.0 (em LUFS).
+reference_loudness = -18.0
+
+supported_exts = (".mp3", ".mp4", ".m4a", ".opus", ".ogg")
+
+cache_filename = "replaygain.json"
+
+integrated_regex = re.compile(r"I:\s+(-?[\d.]+|-inf) LUFS")
+peak_regex = re.compile(r"Peak:\s+(-?[\d.]+|-inf) dBFS")
+
+
+def file_digest(path: str) -> str:
+
+    # apenas um trecho do meio do arquivo é usado (as tags ficam no início/fim e mudam a cada sincronização).
+    size = os.path.getsize(path)
+    chunk_size = 1024 * 1024
+
+    with open(path, "rb") as f:
+        f.seek(max(0, size // 2 - chunk_size // 2))
+        chunk = f.read(chunk_size)
+
+    return hashlib.blake2b(str(size).encode() + chunk, digest_size=16).hexdigest()
+
+
+def analyze(path: str, ffmpeg: str = "ffmpeg"):
+
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-nostats", "-i", path, "-map", "0:a:0", "-af", "ebur128=peak=true", "-f", "null", "-"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True
+    )
+
+    output = result.stderr.decode(errors="replace")
+    summary = output[output.rfind("Summary:"):]
+
+    integrated = float(integrated_regex.search(summary).group(1))
+    peak_db = float(peak_regex.search(summary).group(1))
+
+    return round(reference_loudness - integrated, 2), round(10 ** (peak_db / 20), 6)
+
+
+def write_tags(path: str, gain: float, peak: float):
+
+    gain_txt = f"{gain:+.2f} dB"
+    peak_txt = f"{peak:.6f}"
+
+    if path.endswith(".mp3"):
+        try:
+            tags = ID3(path)
+        except ID3NoHeaderError:
+            tags = ID3()
+        tags.setall("TXXX:REPLAYGAIN_TRACK_GAIN", [TXXX(encoding=3, desc="REPLAYGAIN_TRACK_GAIN", text=[gain_txt])])
+        tags.setall("TXXX:REPLAYGAIN_TRACK_PEAK", [TXXX(encoding=3, desc="REPLAYGAIN_TRACK_PEAK", text=[peak_txt])])
+        tags.save(path)
+
+    elif path.endswith((".mp4", ".m4a")):
+        tags = MP4(path)
+        tags["----:com.apple.iTunes:replaygain_track_gain"] = [MP4FreeForm(gain_txt.encode())]
+        tags["----:com.apple.iTunes:replaygain_track_peak"] = [MP4FreeForm(peak_txt.encode())]
+        tags.save()
+
+    else:
+        tags = mutagen.File(path)
+        tags["REPLAYGAIN_TRACK_GAIN"] = gain_txt
+        tags["REPLAYGAIN_TRACK_PEAK"] = peak_txt
+        if path.endswith(".opus"):
+            # rfc 7845: ganho em Q7.8 relativo a -23 LUFS.
+            tags["R128_TRACK_GAIN"] = str(round((gain - reference_loudness - 23) * 256))
+        tags.save()
+
+
+def process_file(path: str, ffmpeg: str = "ffmpeg", result: Optional[dict] = None):
+
+    # quando o resultado já é conhecido (mesmo vídeo em outra playlist) apenas as tags são gravadas.
+    if result:
+        gain, peak = result["gain"], result["peak"]
+    else:
+        gain, peak = analyze(path, ffmpeg)
+
+    write_tags(path, gain, peak)
+
+    return {"gain": gain, "peak": peak, "hash": file_digest(path)}
+
+
+def load_cache(cache_file: str) -> dict:
+    try:
+        with open(cache_file, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_cache(cache_file: str, cache: dict):
+    with open(f"{cache_file}.tmp", "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(f"{cache_file}.tmp", cache_file)
+
+
+def apply_replaygain(out_dir: str, ffmpeg: Optional[str] = None, workers: Optional[int] = None,
+                     playlist_ids: Optional[list] = None):
+
+    data_dir = f"{out_dir}/.synced_playlist_data"
+    cache_file = f"{data_dir}/{cache_filename}"
+    cache = load_cache(cache_file)
+
+    pending = []
+
+    for playlist_dir in playlist_ids or os.listdir(data_dir):
+
+        # pastas internas (área temporária dos downloads, thumbnails e arquivos separados pela verificação).
+        if playlist_dir.startswith(".") or playlist_dir == quarantine_dirname \
+                or not os.path.isdir(f"{data_dir}/{playlist_dir}"):
+            continue
+
+        for f in os.listdir(f"{data_dir}/{playlist_dir}"):
+
+            if not f.endswith(supported_exts):
+                continue
+
+            video_id, _ = os.path.splitext(f)
+            path = f"{data_dir}/{playlist_dir}/{f}"
+            rel_path = f"{playlist_dir}/{f}"
+
+            if (cached := cache.get(video_id)) and rel_path in cached["files"]:
+                if cached["files"][rel_path] == file_digest(path):
+                    continue
+
+            pending.append((video_id, rel_path, path))
+
+    if not pending:
+        return
+
+    print(f"\n\nAnalisando volume (EBU R128) de {len(pending)} arquivo{'s'[:len(pending) ^ 1]}...")
+
+    done = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+
+        futures = {}
+
+        for video_id, rel_path, path in pending:
+            cached = cache.get(video_id)
+            # o resultado é reaproveitado apenas se o conteúdo do áudio for o mesmo.
+            known_result = cached if cached and cached["hash"] == file_digest(path) else None
+            futures[executor.submit(process_file, path, ffmpeg or "ffmpeg", known_result)] = (video_id, rel_path)
+
+        for future in concurrent.futures.as_completed(futures):
+
+            video_id, rel_path = futures[future]
+
+            try:
+                result = future.result()
+            except Exception:
+                print(f"Erro ao analisar o volume de: {rel_path}")
+                traceback.print_exc()
+                continue
+
+            files = cache[video_id]["files"] if video_id in cache and cache[video_id]["hash"] == result["hash"] else {}
+            files[rel_path] = result["hash"]
+            cache[video_id] = dict(result, files=files)
+
+            done += 1
+
+            if done % 50 == 0:
+                save_cache(cache_file, cache)
+
+    save_cache(cache_file, cache)
+
+    print(f"ReplayGain aplicado em {done} arquivo{'s'[:done ^ 1]}.")
@@ -0,0 +1,510 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from types import SimpleNamespace
+from typing import Optional
+
+import psutil
+from aiohttp import web
+from mutagen.easyid3 import EasyID3
+from mutagen.mp4 import MP4
+
+# mpeg1 layer 3, 128kbps, 44.1khz (arquivo válido pro mutagen sem precisar do ffmpeg).
+mp3_frame = b"\xff\xfb\x90\x64" + b"\x00" * 413
+mp3_frames_per_second = 38.28
+
+playlist_id = "PLbench"
+
+bench_user = {"id": "1", "username": "bench", "discriminator": "0", "avatar": None}
+
+
+class ModuleProxy:
+
+    # substitui apenas algumas funções de um módulo (ex: time/asyncio/psutil) dentro do discord_rpc.
+    def __init__(self, module, **overrides):
+        self._module = module
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+
+class VirtualClock:
+
+    # o tempo simulado passa mais rápido que o real (ex: scale=0.001 -> 1 segundo simulado = 1ms real).
+    def __init__(self, scale: float):
+        self.scale = scale
+        self.real_start = time.monotonic()
+        self.time_start = time.time()
+        self.on_sleep = None
+
+    def elapsed(self) -> float:
+        return (time.monotonic() - self.real_start) / self.scale
+
+    def monotonic(self) -> float:
+        return self.elapsed()
+
+    def time(self) -> float:
+        return self.time_start + self.elapsed()
+
+    async def sleep(self, delay: float, result=None):
+        if self.on_sleep:
+            self.on_sleep(sys._getframe(1).f_code.co_name)
+        return await asyncio.sleep(max(0, delay) * self.scale, result)
+
+
+class FakeProcess:
+
+    def __init__(self, pid: int, name: str, files: list):
+        self.pid = pid
+        self._name = name
+        self.files = files
+        self.running = True
+
+    def name(self):
+        return self._name
+
+    def open_files(self):
+        return [SimpleNamespace(path=p, fd=i) for i, p in enumerate(self.files)]
+
+    def is_running(self):
+        return self.running
+
+
+class ProcessTable:
+
+    def __init__(self, noise: int):
+        self.processes = [
+            FakeProcess(1000 + i, f"service{i}.exe", [f"C:\\Windows\\System32\\lib{i}_{n}.dll" for n in range(5)])
+            for i in range(noise)
+        ]
+        self.next_pid = 50000
+
+    def start_player(self, name: str) -> FakeProcess:
+        self.next_pid += 1
+        player = FakeProcess(self.next_pid, name, [f"C:\\Program Files\\player\\plugin{n}.dll" for n in range(40)])
+        self.processes.append(player)
+        return player
+
+    def stop_player(self, player: FakeProcess):
+        player.running = False
+        self.processes.remove(player)
+
+    def process_iter(self, attrs=None):
+        return iter(list(self.processes))
+
+
+def make_mp3(path: str, seconds: float):
+    with open(path, "wb") as f:
+        f.write(mp3_frame * int(seconds * mp3_frames_per_second))
+
+
+def make_fixtures(root: str, tracks: int, videos: int, seconds: float, ffmpeg: Optional[str]) -> list:
+
+    synced_dir = f"{root}/lib/.synced_playlist_data/{playlist_id}"
+    os.makedirs(synced_dir)
+
+    with open(f"{synced_dir}/playlist_info.json", "w", encoding="utf-8") as f:
+        json.dump({"id": playlist_id, "title": "Bench Playlist"}, f)
+
+    fixtures = []
+
+    for i in range(tracks + (videos if ffmpeg else 0)):
+
+        video_id = f"bench{i:06d}"
+        title = f"Bench Track Number {i}"
+        artist = f"Bench Artist {i % 20}"
+
+        if i < tracks:
+            make_mp3(path := f"{synced_dir}/{video_id}.mp3", seconds)
+            tags = EasyID3()
+            tags.update({"title": title, "artist": artist, "tracknumber": f"{i + 1}/{tracks}"})
+            tags.save(path)
+        else:
+            subprocess.run(
+                [ffmpeg, "-y", "-v", "error", "-f", "lavfi", "-i", f"color=c=black:s=64x64:d={seconds}", "-f", "lavfi",
+                 "-i", "anullsrc=r=44100:cl=mono", "-t", str(seconds), "-shortest", "-c:v", "libx264", "-c:a", "aac",
+                 path := f"{synced_dir}/{video_id}.mp4"],
+                check=True
+            )
+            tags = MP4(path)
+            tags.update({"\xa9nam": [title], "\xa9ART": [artist]})
+            tags.save()
+
+        fixtures.append({"path": path, "video_id": video_id, "title": title, "artist": artist})
+
+    return fixtures
+
+
+class StandIns:
+
+    # servidores locais no lugar do spotify, last.fm e do ipc do discord (rodam numa thread separada).
+    def __init__(self, root: str, clock: VirtualClock):
+        self.root = root
+        self.clock = clock
+        self.counters = Counter()
+        self.on_activity = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.runner: Optional[web.AppRunner] = None
+        self.ipc_server = None
+        self.ipc_writers = set()
+        self.port = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True, name="bench-stand-ins")
+
+    async def spotify_token(self, request: web.Request):
+        self.counters["spotify_token"] += 1
+        return web.json_response(
+            {"accessToken": "bench", "accessTokenExpirationTimestampMs": int((self.clock.time() + 3600) * 1000)}
+        )
+
+    async def spotify_search(self, request: web.Request):
+        self.counters["spotify_search"] += 1
+        query = request.query.get("q", "")
+        return web.json_response({"tracks": {"items": [
+            {"id": f"sp{abs(hash(query))}", "name": query, "artists": [{"name": "Bench"}],
+             "album": {"name": "Bench Album"}, "duration_ms": 180000}
+        ]}})
+
+    async def lastfm(self, request: web.Request):
+        self.counters[f"lastfm_{request.query.get('method')}"] += 1
+        return web.json_response({"scrobbles": {"@attr": {"accepted": 1, "ignored": 0}}})
+
+    async def ipc_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+
+        def send(opcode: int, payload: dict):
+            # clientes que não leem as respostas não fazem o buffer do servidor crescer.
+            if writer.transport.get_write_buffer_size() < 65536:
+                data = json.dumps(payload).encode()
+                writer.write(struct.pack("<ii", opcode, len(data)) + data)
+
+        self.ipc_writers.add(writer)
+
+        try:
+            while True:
+                opcode, length = struct.unpack("<ii", await reader.readexactly(8))
+                payload = json.loads(await reader.readexactly(length))
+
+                if opcode == 0:
+                    self.counters["ipc_handshake"] += 1
+                    send(1, {"cmd": "DISPATCH", "evt": "READY", "nonce": None,
+                             "data": {"v": 1, "config": {}, "user": bench_user}})
+                elif opcode == 1:
+                    cmd = payload.get("cmd")
+                    self.counters[f"ipc_{cmd}"] += 1
+                    activity = (payload.get("args") or {}).get("activity")
+                    if cmd == "SET_ACTIVITY" and self.on_activity:
+                        self.on_activity(activity)
+                    send(1, {"cmd": cmd, "evt": None, "nonce": payload.get("nonce"), "data": activity})
+                elif opcode == 2:
+                    break
+                elif opcode == 3:
+                    send(4, payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.ipc_writers.discard(writer)
+            writer.close()
+
+    async def start(self):
+
+        app = web.Application()
+        app.router.add_get("/get_access_token", self.spotify_token)
+        app.router.add_get("/v1/search", self.spotify_search)
+        app.router.add_route("*", "/2.0/", self.lastfm)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+        self.ipc_server = await asyncio.start_unix_server(self.ipc_client, path=f"{self.root}/discord-ipc-0")
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.start())
+        self.ready.set()
+        self.loop.run_forever()
+
+    def stop(self):
+
+        async def close():
+            self.ipc_server.close()
+            await self.runner.cleanup()
+            for writer in list(self.ipc_writers):
+                writer.close()
+            await asyncio.sleep(0.1)
+
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(10)
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+    return {
+        "p50": values[len(values) // 2],
+        "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+        "max": values[-1],
+        "mean": statistics.fmean(values),
+    }
+
+
+class Bench:
+
+    def __init__(self, args):
+        self.args = args
+        self.clock = VirtualClock(args.scale)
+        self.table = ProcessTable(args.processes)
+        self.cycle_cpu = []
+        self.cycle_mark = None
+        self.changes = []
+        self.memory = []
+
+    def on_sleep(self, caller: str):
+
+        # cada pausa do start_loop (ou clear_info) marca o fim de um ciclo de verificação.
+        if caller not in ("start_loop", "clear_info"):
+            return
+
+        now = time.thread_time()
+
+        if self.cycle_mark is not None:
+            self.cycle_cpu.append(now - self.cycle_mark)
+
+        self.cycle_mark = now
+
+    def on_update(self, payload: Optional[dict]):
+        if payload and self.changes and (change := self.changes[-1])["detected"] is None \
+                and payload.get("details") == change["title"]:
+            change["detected"] = time.monotonic()
+
+    def on_activity(self, activity: Optional[dict]):
+        if activity and self.changes and (change := self.changes[-1])["ipc"] is None \
+                and activity.get("details") == change["title"]:
+            change["ipc"] = time.monotonic()
+
+    def sample_memory(self):
+        self.memory.append({
+            "hour": round(self.clock.elapsed() / 3600, 2),
+            "rss": psutil.Process().memory_info().rss,
+            "traced": tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+        })
+
+    async def play(self, fixtures: list):
+
+        total = self.args.hours * 3600
+        session_length = self.args.session_minutes * 60
+        next_memory_sample = 0
+        track = 0
+
+        while self.clock.elapsed() < total:
+
+            player = self.table.start_player(self.args.player)
+            session_end = self.clock.elapsed() + session_length
+
+            while self.clock.elapsed() < min(session_end, total):
+
+                fixture = fixtures[track % len(fixtures)]
+                track += 1
+
+                player.files = player.files[:40] + [fixture["path"]]
+                self.changes.append({"title": fixture["title"], "at": time.monotonic(), "detected": None, "ipc": None})
+
+                if self.clock.elapsed() >= next_memory_sample:
+                    self.sample_memory()
+                    next_memory_sample += 3600
+                    print(f"[{self.clock.elapsed() / 3600:5.1f}h simuladas] {len(self.cycle_cpu)} ciclos, "
+                          f"{track} faixas, rss: {self.memory[-1]['rss'] / 1024 ** 2:.1f}MB", flush=True)
+
+                await asyncio.sleep(self.args.track_seconds * self.clock.scale)
+
+            # player fechado entre as sessões (o rpc limpa a atividade).
+            self.table.stop_player(player)
+            await asyncio.sleep(self.args.gap_minutes * 60 * self.clock.scale)
+
+        self.sample_memory()
+
+    async def run(self):
+
+        import discord_rpc
+        from utils import spotify
+
+        root = tempfile.mkdtemp(prefix="rpc_bench_")
+        cwd = os.getcwd()
+
+        try:
+            fixtures = make_fixtures(root, self.args.tracks, self.args.videos, self.args.seconds,
+                                     shutil.which("ffmpeg") if self.args.videos else None)
+
+            stand_ins = StandIns(root, self.clock)
+            stand_ins.on_activity = self.on_activity
+            stand_ins.thread.start()
+            stand_ins.ready.wait(10)
+
+            base_url = f"http://127.0.0.1:{stand_ins.port}"
+
+            # o rpc lê e grava arquivos relativos à pasta atual (.lastfm_keys.json, cache etc).
+            os.chdir(root)
+
+            with open(".lastfm_keys.json", "w", encoding="utf-8") as f:
+                json.dump({bench_user["id"]: {"username": bench_user["username"], "key": "bench"}}, f)
+
+            open("lastfm_ignore_playlists.txt", "w").close()
+
+            os.environ.update({"LASTFM_KEY": "bench", "LASTFM_SECRET": "bench", "XDG_RUNTIME_DIR": root})
+
+            discord_rpc.psutil = ModuleProxy(psutil, process_iter=self.table.process_iter)
+            discord_rpc.time = ModuleProxy(time, monotonic=self.clock.monotonic, time=self.clock.time)
+            discord_rpc.asyncio = ModuleProxy(asyncio, sleep=self.clock.sleep)
+            # o limite de requisições e a validade do token do spotify também seguem o tempo simulado.
+            spotify.time = discord_rpc.time
+            spotify.asyncio = discord_rpc.asyncio
+
+            rpc = discord_rpc.RpcRun()
+            rpc.spotify.base_url = f"{base_url}/v1"
+            rpc.spotify.visitor_token_url = f"{base_url}/get_access_token"
+            rpc.spotify.spotify_cache_file = f"{root}/.spotify_cache.json"
+            rpc.spotify.spotify_cache = {}
+            rpc.last_fm.api_url = f"{base_url}/2.0/"
+
+            publisher_update = rpc.publisher.update
+
+            def update(payload):
+                self.on_update(payload)
+                return publisher_update(payload)
+
+            rpc.publisher.update = update
+
+            if self.args.tracemalloc:
+                tracemalloc.start()
+
+            self.clock.on_sleep = self.on_sleep
+            self.clock.real_start = time.monotonic()
+
+            start_cpu = time.process_time()
+            start = time.monotonic()
+
+            rpc_task = asyncio.get_running_loop().create_task(rpc.start_loop())
+
+            try:
+                await self.play(fixtures)
+            finally:
+                rpc_task.cancel()
+                if rpc.scrobble_task:
+                    rpc.scrobble_task.cancel()
+                await asyncio.gather(rpc_task, return_exceptions=True)
+                rpc.lag_monitor.stop()
+                rpc.executor.shutdown(wait=True)
+                await rpc.spotify.close()
+
+            elapsed = time.monotonic() - start
+            cpu = time.process_time() - start_cpu
+
+            stand_ins.stop()
+
+            return self.report(stand_ins.counters, elapsed, cpu, rpc.lag_monitor.stats())
+
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(root, ignore_errors=True)
+
+    def report(self, counters: Counter, elapsed: float, cpu: float, loop_lag: dict) -> dict:
+
+        scale = self.clock.scale
+        detected = [(c["detected"] - c["at"]) / scale for c in self.changes if c["detected"]]
+        detected_real = [(c["detected"] - c["at"]) * 1000 for c in self.changes if c["detected"]]
+        ipc = [(c["ipc"] - c["at"]) / scale for c in self.changes if c["ipc"]]
+        scrobbles = counters["lastfm_track.scrobble"]
+
+        hours = self.memory[-1]["hour"] - self.memory[min(1, len(self.memory) - 1)]["hour"]
+
+        # a primeira hora é ignorada no crescimento de memória (caches, imports e conexões iniciais).
+        growth = {
+            key: (self.memory[-1][key] - self.memory[min(1, len(self.memory) - 1)][key]) / hours if hours else 0
+            for key in ("rss", "traced") if self.memory[-1][key] is not None
+        }
+
+        result = {
+            "simulated_hours": self.args.hours,
+            "real_seconds": elapsed,
+            "process_cpu_seconds": cpu,
+            "cycles": len(self.cycle_cpu),
+            "cycle_cpu_ms": {k: v * 1000 for k, v in percentiles(self.cycle_cpu).items()},
+            "track_changes": len(self.changes),
+            "detection_latency_s": percentiles(detected),
+            "detection_latency_real_ms": percentiles(detected_real),
+            "ipc_latency_s": percentiles(ipc),
+            "missed_changes": len(self.changes) - len(detected),
+            "memory": self.memory,
+            "memory_growth_per_hour": growth,
+            "requests": dict(counters),
+            "scrobbles": scrobbles,
+            "requests_per_scrobble": {
+                k: v / scrobbles for k, v in counters.items() if scrobbles and not k.startswith("ipc_")
+            },
+            "activity_updates_per_change": counters["ipc_SET_ACTIVITY"] / len(self.changes) if self.changes else 0,
+            "loop_lag_ms": loop_lag,
+        }
+
+        print(f"\n{result['cycles']} ciclos em {elapsed:.1f}s reais ({self.args.hours}h simuladas), "
+              f"cpu total: {cpu:.2f}s")
+        print("cpu por ciclo (loop do rpc): " + " | ".join(f"{k}: {v:.3f}ms" for k, v in result["cycle_cpu_ms"].items()))
+        print(f"trocas de faixa: {len(self.changes)} ({result['missed_changes']} não detectadas)")
+        print("latência de detecção (s simulados): " + " | ".join(f"{k}: {v:.1f}" for k, v in percentiles(detected).items()))
+        print("latência de detecção (ms reais): " + " | ".join(f"{k}: {v:.1f}" for k, v in percentiles(detected_real).items()))
+        print("latência até o discord (s simulados): " + " | ".join(f"{k}: {v:.1f}" for k, v in percentiles(ipc).items()))
+        print("memória: " + " | ".join(f"{k}: {v / 1024:+.1f}KB/h" for k, v in growth.items())
+              + f" (rss final: {self.memory[-1]['rss'] / 1024 ** 2:.1f}MB)")
+        print(f"scrobbles: {scrobbles} | requisições por scrobble: "
+              + " | ".join(f"{k}: {v:.2f}" for k, v in result["requests_per_scrobble"].items()))
+        print(f"atualizações de atividade por troca de faixa: {result['activity_updates_per_change']:.2f}")
+        print("atraso do event loop (ms reais): " + " | ".join(f"{k}: {v:.1f}" for k, v in loop_lag.items()
+                                                             if k != "samples"))
+
+        return result
+
+
+if __name__ == '__main__':
+
+    if sys.platform == "win32":
+        # o ipc falso usa unix socket (no windows o discord usa named pipes).
+        print("Este teste só pode ser executado no linux/macos.")
+        sys.exit(1)
+
+    parser = argparse.ArgumentParser(description="Benchmark/soak offline do discord_rpc.py (sem discord, last.fm e "
+                                                 "spotify reais).")
+    parser.add_argument("--hours", type=float, default=24, help="Horas de reprodução simuladas.")
+    parser.add_argument("--scale", type=float, default=0.0005,
+                        help="Segundos reais por segundo simulado (padrão: 24h simuladas em ~45s).")
+    parser.add_argument("--tracks", type=int, default=50, help="Quantidade de mp3 gerados.")
+    parser.add_argument("--videos", type=int, default=0, help="Quantidade de mp4 gerados (requer ffmpeg).")
+    parser.add_argument("--seconds", type=float, default=3, help="Duração dos arquivos gerados.")
+    parser.add_argument("--track-seconds", type=float, default=200, help="Tempo simulado de cada faixa.")
+    parser.add_argument("--session-minutes", type=float, default=120, help="Tempo simulado de cada sessão do player.")
+    parser.add_argument("--gap-minutes", type=float, default=10, help="Tempo simulado com o player fechado.")
+    parser.add_argument("--processes", type=int, default=300, help="Quantidade de processos falsos na tabela.")
+    parser.add_argument("--player", default="vlc.exe")
+    parser.add_argument("--tracemalloc", action="store_true", help="Mede também a memória alocada pelo python.")
+    parser.add_argument("--json", metavar="ARQUIVO", help="Salva o resultado em json.")
+    args = parser.parse_args()
+
+    result = asyncio.run(Bench(args).run())
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=4)
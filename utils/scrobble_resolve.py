@@ -0,0 +1,150 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import threading
+import traceback
+from typing import Optional
+
+from utils.spotify import SpotifyClient
+from utils.track_cache import TrackCache
+from utils.track_match import best_match
+
+scrobble_info_file = "scrobble_info.json"
+
+
+def build_query(author: str, track_name: str) -> str:
+    if author.endswith(" - topic") and not author.endswith("Release - topic") and not track_name.startswith(author[:-8]):
+        return f"{author} - {track_name}"
+    return track_name.lower() if len(track_name) > 12 else f"{author} - {track_name}".lower()
+
+
+async def resolve_query(query: str, spotify: SpotifyClient, cache: TrackCache) -> Optional[dict]:
+
+    if (data := cache.get(query)) is not None:
+        return data
+
+    if result := await spotify.track_search(query):
+        data = best_match(query, result) or {}
+    else:
+        data = {}
+
+    cache[query] = data
+    return data
+
+
+async def resolve_tracks(tracks: dict, cache: TrackCache, spotify: SpotifyClient,
+                         semaphore: asyncio.Semaphore) -> dict:
+
+    resolved = {}
+
+    async def resolve(yt_id: str, track: dict):
+        async with semaphore:
+            try:
+                resolved[yt_id] = await resolve_query(build_query(track["uploader"], track["name"]), spotify, cache)
+            except Exception:
+                traceback.print_exc()
+
+    await asyncio.gather(*[resolve(yt_id, t) for yt_id, t in tracks.items()])
+
+    return resolved
+
+
+def load_scrobble_info(synced_dir: str) -> dict:
+    try:
+        with open(f"{synced_dir}/{scrobble_info_file}", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_scrobble_info(synced_dir: str, scrobble_info: dict):
+
+    tmp_file = f"{synced_dir}/{scrobble_info_file}.tmp"
+
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(scrobble_info, f, ensure_ascii=False)
+
+    os.replace(tmp_file, f"{synced_dir}/{scrobble_info_file}")
+
+
+class ScrobbleResolver:
+
+    # um único event loop, client do spotify e limite de consultas simultâneas pra todas as playlists (os limites de
+    # requisições do client valem por credencial, não por playlist).
+    def __init__(self, concurrency: int = 4):
+        self.concurrency = concurrency
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="scrobble_resolver")
+        self.thread.start()
+        self.spotify: Optional[SpotifyClient] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+
+    async def preresolve(self, tracks: dict, synced_dir: str, cache: TrackCache):
+
+        if not self.spotify:
+            self.spotify = SpotifyClient()
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        scrobble_info = await asyncio.to_thread(load_scrobble_info, synced_dir)
+
+        # apenas as músicas encontradas ficam salvas no arquivo: as não encontradas são consultadas novamente em outra
+        # sincronização (o cache evita novas consultas até o fim do intervalo de resultados negativos).
+        pending = {
+            yt_id: t for yt_id, t in tracks.items()
+            if not scrobble_info.get(yt_id) and t.get("uploader") and t.get("name")
+        }
+
+        if not pending:
+            return
+
+        resolved = await resolve_tracks(pending, cache, self.spotify, self.semaphore)
+
+        scrobble_info = {k: v for k, v in scrobble_info.items() if v}
+        scrobble_info.update({k: v for k, v in resolved.items() if v})
+
+        await asyncio.to_thread(save_scrobble_info, synced_dir, scrobble_info)
+
+        found = sum(1 for v in resolved.values() if v)
+
+        print(f"\nScrobble: {found} de {len(pending)} música{'s'[:len(pending) ^ 1]} "
+              f"pré-resolvida{'s'[:len(pending) ^ 1]} em: {synced_dir}")
+
+    async def run(self, tracks: dict, synced_dir: str, cache: TrackCache):
+        try:
+            await self.preresolve(tracks, synced_dir, cache)
+        except Exception:
+            traceback.print_exc()
+
+    def submit(self, tracks: dict, synced_dir: str, cache: TrackCache) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(self.run(tracks, synced_dir, cache), self.loop)
+
+    def close(self):
+        if self.spotify:
+            asyncio.run_coroutine_threadsafe(self.spotify.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+resolver: Optional[ScrobbleResolver] = None
+
+
+def preresolve_playlist_background(tracks: dict, synced_dir: str, cache: TrackCache,
+                                   concurrency: int = 4) -> concurrent.futures.Future:
+
+    global resolver
+
+    if not resolver:
+        resolver = ScrobbleResolver(concurrency)
+
+    return resolver.submit(tracks, synced_dir, cache)
+
+
+def close_resolver():
+
+    global resolver
+
+    if resolver:
+        resolver.close()
+        resolver = None
@@ -0,0 +1,41 @@
+import os
+import time
+from typing import Optional
+
+from utils.library_index import LibraryIndex
+
+
+def search_library(out_dir: str, text: str, limit: int = 50, playlist_ids: Optional[list] = None) -> list:
+
+    library = LibraryIndex(out_dir)
+
+    if not os.path.isfile(library.path):
+        return []
+
+    results = []
+
+    for row in library.search(text, limit, playlist_ids):
+        results.append({
+            "video_id": row["video_id"],
+            "title": row["title"],
+            "uploader": row["uploader"],
+            "duration": row["duration"],
+            "playlist_id": row["playlist_id"],
+            "playlist": row["playlist_title"],
+            "position": row["position"],
+            "file": os.path.abspath(library.abs_path(row["file"])) if row["file"] else None,
+        })
+
+    library.close()
+
+    return results
+
+
+def format_result(result: dict) -> str:
+
+    duration = time.strftime("%M:%S" if (result["duration"] or 0) < 3600 else "%H:%M:%S",
+                             time.gmtime(result["duration"] or 0))
+
+    return (f"{result['title']} - Por: {result['uploader']} ({duration})\n"
+            f"    Playlist: {result['playlist']} ({result['playlist_id']}) #{result['position']}\n"
+            f"    {result['file'] or 'Arquivo não baixado: https://www.youtube.com/watch?v=' + result['video_id']}")
@@ -13,6 +13,14 @@ from aiohttp import ClientSession
 
 class SpotifyClient:
 
+    # limite de requisições simultâneas e intervalo mínimo (em segundos) entre requisições por tipo de credencial.
+    rate_limits = {
+        "visitor": (2, 0.5),
+        "api": (5, 0.1),
+    }
+
+    max_retries = 5
+
     def __init__(self, client_id: Optional[str] = None, client_secret: Optional[str] = None, playlist_extra_page_limit: int = 0):
 
         self.spotify_cache_file = os.path.join(gettempdir(), ".spotify_cache.json")
@@ -20,31 +28,118 @@ class SpotifyClient:
         self.client_id = client_id
         self.client_secret = client_secret
         self.base_url = "https://api.spotify.com/v1"
+        self.visitor_token_url = "https://open.spotify.com/get_access_token?reason=transport&productType=embed"
+        self.api_token_url = "https://accounts.spotify.com/api/token"
         self.spotify_cache = {}
         self.type = "api" if client_id and client_secret else "visitor"
-        self.token_refresh = False
         self.playlist_extra_page_limit = playlist_extra_page_limit
 
+        # os objetos do asyncio são criados sob demanda pois o client pode ser instanciado fora do event loop.
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.session: Optional[ClientSession] = None
+        self.token_lock: Optional[asyncio.Lock] = None
+        self.semaphores: dict = {}
+        self.next_request_at: dict = {}
+        self.rate_locks: dict = {}
+        self.inflight: dict = {}
+
         try:
             with open(self.spotify_cache_file) as f:
                 self.spotify_cache = json.load(f)
-        except FileNotFoundError:
+        except (FileNotFoundError, json.JSONDecodeError):
             pass
 
+    def setup_loop(self):
+
+        loop = asyncio.get_running_loop()
+
+        if self.loop is loop:
+            return
+
+        self.loop = loop
+        self.session = None
+        self.token_lock = asyncio.Lock()
+        self.semaphores = {t: asyncio.Semaphore(c) for t, (c, _) in self.rate_limits.items()}
+        self.rate_locks = {t: asyncio.Lock() for t in self.rate_limits}
+        self.next_request_at = {t: 0.0 for t in self.rate_limits}
+        self.inflight.clear()
+
+    async def get_session(self) -> ClientSession:
+        self.setup_loop()
+        if not self.session or self.session.closed:
+            self.session = ClientSession()
+        return self.session
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def wait_rate_limit(self, token_type: str):
+
+        async with self.rate_locks[token_type]:
+            now = time.monotonic()
+            if (delay := self.next_request_at[token_type] - now) > 0:
+                await asyncio.sleep(delay)
+                now += delay
+            self.next_request_at[token_type] = now + self.rate_limits[token_type][1]
+
+    def pause_requests(self, token_type: str, delay: float):
+        self.next_request_at[token_type] = max(self.next_request_at[token_type], time.monotonic() + delay)
+
     async def request(self, path: str, params: dict = None):
 
-        headers = {'Authorization': f'Bearer {await self.get_valid_access_token()}'}
+        self.setup_loop()
+
+        # requisições idênticas em andamento compartilham a mesma resposta.
+        key = (path, tuple(sorted((params or {}).items())))
+
+        if not (future := self.inflight.get(key)):
+            future = self.loop.create_task(self._request(path, params))
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+        return await asyncio.shield(future)
+
+    async def _request(self, path: str, params: dict = None):
+
+        session = await self.get_session()
+
+        token_refreshed = False
+
+        for _ in range(self.max_retries):
+
+            token = await self.get_valid_access_token()
+            token_type = self.type
+
+            async with self.semaphores[token_type]:
+
+                await self.wait_rate_limit(token_type)
+
+                async with session.get(f"{self.base_url}/{path}", headers={'Authorization': f'Bearer {token}'},
+                                       params=params) as response:
+
+                    if response.status == 200:
+                        return await response.json()
+
+                    if response.status == 401 and not token_refreshed:
+                        token_refreshed = True
+                        await self.get_access_token(expired_token=token)
+                        continue
+
+                    if response.status == 429:
+                        try:
+                            retry_after = float(response.headers.get("Retry-After", 1))
+                        except ValueError:
+                            retry_after = 1
+                        print(f"⚠️ - Spotify: Limite de requisições atingido, aguardando {retry_after} segundo(s).")
+                        self.pause_requests(token_type, retry_after)
+                        continue
 
-        async with ClientSession() as session:
-            async with session.get(f"{self.base_url}/{path}", headers=headers, params=params) as response:
-                if response.status == 200:
-                    return await response.json()
-                elif response.status == 401:
-                    await self.get_access_token()
-                    return await self.request(path=path, params=params)
-                else:
                     response.raise_for_status()
 
+        raise Exception(f"Spotify: número máximo de tentativas excedido: {path}")
+
     async def get_recommendations(self, seed_tracks: Union[list, str], limit=10):
         if isinstance(seed_tracks, str):
             track_ids = seed_tracks
@@ -60,74 +155,69 @@ class SpotifyClient:
         'q': query, 'type': 'track', 'limit': 10
         })
 
-    async def get_access_token(self):
+    async def get_access_token(self, expired_token: Optional[str] = None):
 
-        if self.token_refresh:
-            while self.token_refresh:
-                await asyncio.sleep(1)
-            return
+        self.setup_loop()
 
-        self.token_refresh = True
+        async with self.token_lock:
 
-        try:
-
-            if self.type == "visitor":
+            # outro request já renovou o token enquanto este aguardava.
+            if expired_token and self.spotify_cache.get("access_token") != expired_token:
+                return
 
-                access_token_url = "https://open.spotify.com/get_access_token?reason=transport&productType=embed"
-                async with ClientSession() as session:
-                    async with session.get(access_token_url) as response:
-                        data = await response.json()
-                        self.spotify_cache = {
-                            "access_token": data["accessToken"],
-                            "expires_in": data["accessTokenExpirationTimestampMs"],
-                            "expires_at": time.time() + data["accessTokenExpirationTimestampMs"],
-                            "type": "visitor",
-                        }
-                        self.type = "visitor"
-                        print("🎶 - Access token do spotify obtido com sucesso do tipo: visitante.")
+            if not expired_token and self.token_is_valid():
+                return
 
-            else:
-                token_url = 'https://accounts.spotify.com/api/token'
+            await self.refresh_access_token()
 
-                headers = {
-                    'Authorization': 'Basic ' + base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
-                }
-
-                data = {
-                    'grant_type': 'client_credentials'
-                }
+        async with aiofiles.open(self.spotify_cache_file, "w") as f:
+            await f.write(json.dumps(self.spotify_cache))
 
-                async with ClientSession() as session:
-                    async with session.post(token_url, headers=headers, data=data) as response:
-                        data = await response.json()
+    async def refresh_access_token(self):
 
-                    if data.get("error"):
-                        print(f"⚠️ - Spotify: Ocorreu um erro ao obter token: {data['error_description']}")
-                        self.client_id = None
-                        self.client_secret = None
-                        await self.get_access_token()
-                        return
+        session = await self.get_session()
 
-                    self.spotify_cache = data
+        if self.type == "api":
 
-                    self.type = "api"
+            headers = {
+                'Authorization': 'Basic ' + base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
+            }
 
-                    self.spotify_cache["type"] = "api"
+            data = {
+                'grant_type': 'client_credentials'
+            }
 
-                    self.spotify_cache["expires_at"] = time.time() + self.spotify_cache["expires_in"]
+            async with session.post(self.api_token_url, headers=headers, data=data) as response:
+                data = await response.json()
 
-                    print("🎶 - Access token do spotify obtido com sucesso via API Oficial.")
+            if not data.get("error"):
+                self.spotify_cache = data
+                self.spotify_cache["type"] = "api"
+                self.spotify_cache["expires_at"] = time.time() + self.spotify_cache["expires_in"]
+                print("🎶 - Access token do spotify obtido com sucesso via API Oficial.")
+                return
 
-        except Exception as e:
-            self.token_refresh = False
-            raise e
+            print(f"⚠️ - Spotify: Ocorreu um erro ao obter token: {data['error_description']}")
+            self.client_id = None
+            self.client_secret = None
+            self.type = "visitor"
 
-        self.token_refresh = False
+        async with session.get(self.visitor_token_url) as response:
+            data = await response.json()
+            self.spotify_cache = {
+                "access_token": data["accessToken"],
+                "expires_in": data["accessTokenExpirationTimestampMs"],
+                # o spotify retorna o timestamp (em ms) de expiração e não a duração do token.
+                "expires_at": data["accessTokenExpirationTimestampMs"] / 1000,
+                "type": "visitor",
+            }
+            self.type = "visitor"
+            print("🎶 - Access token do spotify obtido com sucesso do tipo: visitante.")
 
-        async with aiofiles.open(self.spotify_cache_file, "w") as f:
-            await f.write(json.dumps(self.spotify_cache))
+    def token_is_valid(self):
+        return (exp_date := self.spotify_cache.get("expires_at")) and time.time() < exp_date - 10
 
     async def get_valid_access_token(self):
-        if not (exp_date := self.spotify_cache.get("expires_at")) or time.time() >= exp_date:
+        if not self.token_is_valid():
             await self.get_access_token()
         return self.spotify_cache["access_token"]
@@ -0,0 +1,260 @@
+import concurrent.futures
+import hashlib
+import mimetypes
+import os
+import shutil
+from typing import NamedTuple, Optional
+from urllib.parse import quote, urlparse
+
+from utils.library_index import LibraryIndex
+from utils.m3u import index_entries, m3u_name
+
+# tamanho das partes dos uploads multipart (também usado no cálculo do etag local).
+default_part_size = 16 * 1024 * 1024
+
+
+class StoredObject(NamedTuple):
+    size: int
+    etag: Optional[str]
+
+
+def file_etag(path: str, part_size: int = default_part_size) -> str:
+
+    # mesmo cálculo do S3: md5 do arquivo ou, nos uploads multipart, md5 dos md5 das partes + "-quantidade".
+    parts = []
+
+    with open(path, "rb") as f:
+        while chunk := f.read(part_size):
+            parts.append(hashlib.md5(chunk))
+
+    if os.path.getsize(path) < part_size:
+        return parts[0].hexdigest() if parts else hashlib.md5().hexdigest()
+
+    return f"{hashlib.md5(b''.join(p.digest() for p in parts)).hexdigest()}-{len(parts)}"
+
+
+class LocalStorage:
+
+    # outro diretório (ex: compartilhamento de rede montado), opcionalmente servido por http (public_url).
+    scheme = "mtime"
+
+    def __init__(self, root: str, public_url: Optional[str] = None):
+        self.root = root
+        self.public_url = public_url.rstrip("/") if public_url else None
+
+    def __str__(self):
+        return os.path.abspath(self.root)
+
+    def list(self) -> dict:
+
+        objects = {}
+
+        for root, _, files in os.walk(self.root):
+            for f in files:
+                if f.endswith(".tmp"):
+                    continue
+                st = os.stat(path := f"{root}/{f}")
+                key = os.path.relpath(path, self.root).replace("\\", "/")
+                objects[key] = StoredObject(st.st_size, str(int(st.st_mtime)))
+
+        return objects
+
+    def etag(self, path: str) -> str:
+        # o copy2 mantém a data de modificação (comparar o conteúdo exigiria ler os dois arquivos). apenas os
+        # segundos são comparados por causa dos sistemas de arquivos com menos precisão (ex: compartilhamentos smb).
+        return str(int(os.stat(path).st_mtime))
+
+    def put_file(self, path: str, key: str):
+        os.makedirs(os.path.dirname(dst := f"{self.root}/{key}"), exist_ok=True)
+        shutil.copy2(path, f"{dst}.tmp")
+        os.replace(f"{dst}.tmp", dst)
+
+    def put_text(self, key: str, text: str, remote: Optional[StoredObject] = None) -> bool:
+
+        data = text.encode("utf-8")
+
+        if remote and remote.size == len(data):
+            with open(f"{self.root}/{key}", "rb") as f:
+                if f.read() == data:
+                    return False
+
+        os.makedirs(os.path.dirname(dst := f"{self.root}/{key}"), exist_ok=True)
+        with open(f"{dst}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{dst}.tmp", dst)
+
+        return True
+
+    def delete(self, keys: list):
+        for key in keys:
+            try:
+                os.remove(f"{self.root}/{key}")
+            except FileNotFoundError:
+                pass
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{quote(key)}" if self.public_url else f"./{key}"
+
+
+class S3Storage:
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 public_url: Optional[str] = None, part_size: int = default_part_size, workers: int = 8):
+
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError:
+            raise Exception("O armazenamento S3 requer o boto3 (pip install boto3).")
+
+        self.bucket = bucket
+        self.prefix = f"{prefix.strip('/')}/" if prefix.strip("/") else ""
+        self.endpoint_url = endpoint_url.rstrip("/") if endpoint_url else None
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.part_size = part_size
+        self.workers = workers
+        self.scheme = f"md5-{part_size}"
+
+        # as credenciais são obtidas pelo boto3 (variáveis AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY, ~/.aws etc).
+        # até "workers" arquivos são enviados ao mesmo tempo, cada um com até "workers" partes simultâneas (mais as
+        # consultas/envios simples): o pool de conexões precisa comportar todos, senão as conexões extras são descartadas.
+        self.client = boto3.client("s3", endpoint_url=self.endpoint_url,
+                                   config=Config(max_pool_connections=workers * (workers + 1)))
+        self.transfer = TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                                       max_concurrency=workers)
+
+    def __str__(self):
+        return f"s3://{self.bucket}/{self.prefix}"
+
+    def list(self) -> dict:
+
+        objects = {}
+
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                objects[obj["Key"][len(self.prefix):]] = StoredObject(obj["Size"], obj["ETag"].strip('"'))
+
+        return objects
+
+    def etag(self, path: str) -> str:
+        return file_etag(path, self.part_size)
+
+    def put_file(self, path: str, key: str):
+        self.client.upload_file(
+            path, self.bucket, f"{self.prefix}{key}", Config=self.transfer,
+            ExtraArgs={"ContentType": mimetypes.guess_type(key)[0] or "application/octet-stream"}
+        )
+
+    def put_text(self, key: str, text: str, remote: Optional[StoredObject] = None) -> bool:
+
+        data = text.encode("utf-8")
+
+        if remote and remote.etag == hashlib.md5(data).hexdigest():
+            return False
+
+        self.client.put_object(Bucket=self.bucket, Key=f"{self.prefix}{key}", Body=data,
+                               ContentType="audio/x-mpegurl; charset=utf-8")
+
+        return True
+
+    def delete(self, keys: list):
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                "Objects": [{"Key": f"{self.prefix}{k}"} for k in keys[i:i + 1000]], "Quiet": True
+            })
+
+    def url(self, key: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{quote(key)}"
+        if self.endpoint_url:
+            return f"{self.endpoint_url}/{self.bucket}/{quote(self.prefix + key)}"
+        return f"https://{self.bucket}.s3.amazonaws.com/{quote(self.prefix + key)}"
+
+
+def load_storage(lib_type: str):
+
+    # ex: s3://bucket/musicas ou /mnt/servidor/musicas (cada biblioteca fica numa subpasta: audio/ e video/).
+    if not (url := (os.getenv("STORAGE_URL") or "").strip()):
+        return None
+
+    public_url = f"{p.rstrip('/')}/{lib_type}" if (p := os.getenv("STORAGE_PUBLIC_URL")) else None
+
+    if (parsed := urlparse(url)).scheme == "s3":
+        return S3Storage(
+            parsed.netloc, f"{parsed.path.strip('/')}/{lib_type}", endpoint_url=os.getenv("STORAGE_ENDPOINT_URL"),
+            public_url=public_url, part_size=int(float(os.getenv("STORAGE_PART_SIZE") or 16) * 1024 * 1024),
+            workers=int(os.getenv("STORAGE_WORKERS") or 8)
+        )
+
+    return LocalStorage(f"{parsed.path if parsed.scheme == 'file' else url}/{lib_type}", public_url)
+
+
+def publish_library(out_dir: str, storage) -> dict:
+
+    library = LibraryIndex(out_dir)
+
+    if not os.path.isfile(library.path):
+        return {}
+
+    remote = storage.list()
+
+    # as músicas de vídeos deletados podem estar em mais de uma playlist (mesmo arquivo).
+    files = {r["file"] for r in library.tracks(with_file=True)}
+
+    cached = library.storage_etags(storage.scheme)
+    new_etags = []
+
+    stats = {"uploaded": 0, "unchanged": 0, "playlists": 0, "deleted": 0, "bytes": 0}
+
+    def publish_file(file: str):
+
+        try:
+            st = os.stat(path := library.abs_path(file))
+        except FileNotFoundError:
+            return None
+
+        key = f".synced_playlist_data/{file}"
+
+        if (obj := remote.get(key)) and obj.size == st.st_size:
+            # o etag local (md5 no caso do S3) só é calculado novamente quando o arquivo muda.
+            if (row := cached.get(file)) and row["size"] == st.st_size and row["mtime"] == st.st_mtime:
+                etag = row["etag"]
+            else:
+                new_etags.append((file, st.st_size, st.st_mtime, storage.scheme, etag := storage.etag(path)))
+            if etag == obj.etag:
+                return key, False, 0
+
+        storage.put_file(path, key)
+
+        return key, True, st.st_size
+
+    published = set()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=getattr(storage, "workers", 4)) as executor:
+        for result in executor.map(publish_file, sorted(files)):
+            if not result:
+                continue
+            key, uploaded, size = result
+            published.add(key)
+            stats["uploaded" if uploaded else "unchanged"] += 1
+            stats["bytes"] += size
+
+    if new_etags:
+        library.set_storage_etags(new_etags)
+
+    # as playlists apontam pras urls do armazenamento (ou caminhos relativos quando não há url pública).
+    for r in library.execute("SELECT playlist_id, title FROM playlists"):
+        if not (entries := index_entries(library, r["playlist_id"], storage.url)):
+            continue
+        published.add(key := m3u_name(r["title"], r["playlist_id"]))
+        if storage.put_text(key, "\n\n".join(entries), remote.get(key)):
+            stats["playlists"] += 1
+
+    # apenas arquivos gerenciados pela sincronização são removidos (músicas e playlists que não existem mais).
+    if deleted := sorted(k for k in remote if k not in published and
+                         (k.endswith(".m3u") or k.startswith(".synced_playlist_data/"))):
+        storage.delete(deleted)
+        stats["deleted"] = len(deleted)
+
+    return stats
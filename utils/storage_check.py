@@ -0,0 +1,177 @@
+import argparse
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+from utils.library_index import LibraryIndex
+from utils.storage import file_etag, publish_library, S3Storage
+
+# tamanho mínimo das partes aceito pelo S3 (exceto a última).
+min_part_size = 5 * 1024 * 1024
+
+playlist_id = "PLcheck"
+
+
+# etags gerados pelo S3 (moto_server) para o conteúdo de pattern() com partes de 5MB: abaixo, exatamente no limite do
+# multipart e acima dele (inclusive com mais de uma parte).
+etag_vectors = {
+    0: "d41d8cd98f00b204e9800998ecf8427e",
+    1: "93b885adfe0da089cdf634904fd59f71",
+    min_part_size - 1: "ff7aec5a89bdb0fd7d9cf4ff8c484545",
+    min_part_size: "59a976105e80464acdcd6ee2a0678dfd-1",
+    min_part_size + 1: "285c0ca0352736b999524a583a2c9659-2",
+    2 * min_part_size + 1: "b677d8f19ed57bf218653ea38827c920-3",
+}
+
+
+def boundary_sizes(part_size: int) -> list:
+    return [0, 1, part_size - 1, part_size, part_size + 1, 2 * part_size, 2 * part_size + 1]
+
+
+def pattern(size: int) -> bytes:
+    return (bytes(range(251)) * (size // 251 + 1))[:size]
+
+
+def check_file_etag(root: str) -> list:
+
+    errors = []
+
+    # verificação offline do cálculo local (sem servidor), comparado com os etags gerados pelo próprio S3.
+    for size, expected in etag_vectors.items():
+        with open(path := f"{root}/etag_{size}.bin", "wb") as f:
+            f.write(pattern(size))
+        if (etag := file_etag(path, min_part_size)) != expected:
+            errors.append(f"file_etag ({size} bytes): {etag} != {expected}")
+        os.remove(path)
+
+    return errors
+
+
+def build_library(root: str, part_size: int) -> LibraryIndex:
+
+    library = LibraryIndex(f"{root}/lib")
+    library.upsert_playlist(playlist_id, "Playlist de teste")
+
+    os.makedirs(playlist_dir := f"{library.data_dir}/{playlist_id}", exist_ok=True)
+
+    for i, size in enumerate(boundary_sizes(part_size)):
+        with open(path := f"{playlist_dir}/check{i:06d}.mp3", "wb") as f:
+            f.write(os.urandom(size))
+        library.upsert_track(playlist_id, f"check{i:06d}", i + 1, f"Faixa {i}", "Canal", 1, path)
+
+    return library
+
+
+def check_publish(root: str, storage: S3Storage) -> list:
+
+    errors = []
+    out_dir = f"{root}/lib"
+
+    def expect(step: str, stats: dict, **values):
+        for k, v in values.items():
+            if stats.get(k) != v:
+                errors.append(f"{step}: {k} = {stats.get(k)} (esperado: {v})")
+        print(f"{step}: {stats}")
+
+    library = build_library(root, storage.part_size)
+    files = [r["file"] for r in library.tracks(playlist_id, with_file=True)]
+
+    expect("envio inicial", publish_library(out_dir, storage), uploaded=len(files), unchanged=0, playlists=1)
+
+    # o etag calculado localmente precisa ser igual ao do servidor (senão todo arquivo seria enviado de novo).
+    remote = storage.list()
+    for file in files:
+        obj = remote.get(key := f".synced_playlist_data/{file}")
+        if not obj:
+            errors.append(f"objeto não encontrado: {key}")
+        elif obj.etag != (etag := file_etag(library.abs_path(file), storage.part_size)):
+            errors.append(f"etag diferente ({os.path.getsize(library.abs_path(file))} bytes): {obj.etag} != {etag}")
+
+    expect("sem alterações", publish_library(out_dir, storage), uploaded=0, unchanged=len(files), playlists=0,
+           deleted=0)
+
+    # mesmo tamanho com outro conteúdo: apenas o etag identifica a alteração.
+    with open(library.abs_path(files[-1]), "r+b") as f:
+        f.write(b"alterado")
+
+    expect("arquivo alterado", publish_library(out_dir, storage), uploaded=1, unchanged=len(files) - 1)
+
+    library.execute("DELETE FROM tracks WHERE file = ?", (files[0],))
+
+    expect("arquivo removido", publish_library(out_dir, storage), uploaded=0, deleted=1, playlists=1)
+
+    library.close()
+
+    return errors
+
+
+def cleanup(storage: S3Storage):
+    if keys := list(storage.list()):
+        storage.delete(keys)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Teste do armazenamento S3 (etag local x servidor, envio multipart, "
+                                                 "arquivos sem alteração e removidos) usando um servidor compatível "
+                                                 "local, ex: minio ou moto_server.")
+    parser.add_argument("--endpoint", help="Url do servidor (ex: http://127.0.0.1:9000). Sem essa opção o moto é usado "
+                                           "no próprio processo (se instalado) ou apenas o cálculo do etag é testado.")
+    parser.add_argument("--bucket", default="synced-playlists-check")
+    parser.add_argument("--part-size", type=float, default=5, help="Tamanho das partes (em MB, mínimo 5).")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    part_size = max(min_part_size, int(args.part_size * 1024 * 1024))
+
+    root = tempfile.mkdtemp(prefix="storage_check_")
+
+    errors = check_file_etag(root)
+
+    print(f"cálculo do etag local ({len(etag_vectors)} tamanhos): "
+          f"{'ok' if not errors else f'{len(errors)} erro(s)'}")
+
+    server = contextlib.nullcontext()
+
+    if not args.endpoint:
+        try:
+            from moto import mock_aws
+        except ImportError:
+            mock_aws = None
+        if mock_aws:
+            server = mock_aws()
+            os.environ.setdefault("AWS_ACCESS_KEY_ID", "check")
+            os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "check")
+        else:
+            print("Sem servidor (--endpoint) e sem o moto instalado: o envio não foi testado.")
+
+    if args.endpoint or not isinstance(server, contextlib.nullcontext):
+
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+        with server:
+
+            storage = S3Storage(args.bucket, f"check-{uuid.uuid4().hex[:8]}", endpoint_url=args.endpoint,
+                                part_size=part_size, workers=args.workers)
+
+            try:
+                storage.client.head_bucket(Bucket=args.bucket)
+            except Exception:
+                storage.client.create_bucket(Bucket=args.bucket)
+
+            try:
+                errors += check_publish(root, storage)
+            finally:
+                cleanup(storage)
+
+    shutil.rmtree(root, ignore_errors=True)
+
+    for error in errors:
+        print(f"ERRO: {error}")
+
+    print("ok" if not errors else f"{len(errors)} erro{'s'[:len(errors) ^ 1]}.")
+
+    sys.exit(1 if errors else 0)
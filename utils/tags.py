@@ -0,0 +1,123 @@
+import base64
+import os
+from typing import Optional
+
+import mutagen
+from mutagen.flac import Picture
+from mutagen.id3 import APIC, ID3
+from mutagen.mp4 import MP4, MP4Cover
+
+audio_exts = ("mp3", "m4a", "opus", "ogg")
+
+video_exts = ("mp4",)
+
+media_exts = audio_exts + video_exts
+
+
+def media_ext(path: str) -> str:
+    return os.path.splitext(path)[1][1:].lower()
+
+
+def is_video(path: str) -> bool:
+    return media_ext(path) in video_exts
+
+
+def find_media(directory: str, yt_id: str, exts: tuple) -> Optional[str]:
+    for ext in exts:
+        if os.path.isfile(path := f"{directory}/{yt_id}.{ext}"):
+            return path
+
+
+def open_tags(path: str):
+
+    # os vídeos usam as tags nativas do mp4 (ex: ©nam, ©ART e trac), os áudios usam a interface "easy" do mutagen.
+    if is_video(path):
+        return MP4(path)
+
+    if (tags := mutagen.File(path, easy=True)) is None:
+        raise mutagen.MutagenError(f"Formato de arquivo não suportado: {path}")
+
+    if tags.tags is None:
+        tags.add_tags()
+
+    return tags
+
+
+def read_tags(path: str, tags=None) -> dict:
+
+    tags = tags or open_tags(path)
+
+    if is_video(path):
+        keys = ("\xa9nam", "\xa9ART", "trac")
+    else:
+        keys = ("title", "artist", "tracknumber")
+
+    title, artist, track_number = [(tags.get(k) or [None])[0] for k in keys]
+
+    return {
+        "title": title,
+        "artist": artist,
+        "track_number": track_number,
+        "duration": tags.info.length,
+    }
+
+
+def set_track_number(path: str, track_number: str, tags=None):
+
+    tags = tags or open_tags(path)
+
+    key = "trac" if is_video(path) else "tracknumber"
+
+    # evita regravar o arquivo quando não houve alteração.
+    if tags.get(key) == [track_number]:
+        return
+
+    tags[key] = [track_number]
+    tags.save()
+
+
+def update_tags(path: str, title: Optional[str], artist: Optional[str], tags=None) -> list:
+
+    tags = tags or open_tags(path)
+
+    keys = ("\xa9nam", "\xa9ART") if is_video(path) else ("title", "artist")
+
+    # apenas os campos alterados são gravados (o arquivo não é regravado quando nada mudou).
+    changed = [k for k, v in zip(keys, (title, artist)) if v and (tags.get(k) or [None])[0] != v]
+
+    if not changed:
+        return []
+
+    for k, v in zip(keys, (title, artist)):
+        if k in changed:
+            tags[k] = [v]
+
+    tags.save()
+
+    return changed
+
+
+def set_cover(path: str, data: bytes, mime: str = "image/jpeg"):
+
+    ext = media_ext(path)
+
+    if ext in ("mp4", "m4a"):
+        tags = MP4(path)
+        tags["covr"] = [MP4Cover(data, MP4Cover.FORMAT_PNG if mime == "image/png" else MP4Cover.FORMAT_JPEG)]
+        tags.save()
+
+    elif ext == "mp3":
+        tags = ID3(path)
+        tags.delall("APIC")
+        tags.add(APIC(encoding=3, mime=mime, type=3, desc="Cover", data=data))
+        tags.save()
+
+    else:
+        # opus/ogg: a imagem fica num bloco flac em base64 dentro dos comentários.
+        picture = Picture()
+        picture.type = 3
+        picture.mime = mime
+        picture.data = data
+        tags = mutagen.File(path)
+        tags["metadata_block_picture"] = [base64.b64encode(picture.write()).decode("ascii")]
+        tags.save()
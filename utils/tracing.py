@@ -0,0 +1,222 @@
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+# intervalo entre as amostras do profiler (em segundos).
+sample_interval = 0.005
+
+
+class Sampler:
+
+    def __init__(self, stages: set):
+        self.stages = stages
+        self.active = {}
+        self.samples = collections.Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.loop, daemon=True, name="trace-sampler")
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def loop(self):
+
+        while not self.stop_event.wait(sample_interval):
+
+            if not self.active:
+                continue
+
+            frames = sys._current_frames()
+
+            for tid, stage in list(self.active.items()):
+
+                if not (frame := frames.get(tid)):
+                    continue
+
+                stack = []
+
+                while frame:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+
+                self.samples[(stage, ";".join(reversed(stack)))] += 1
+
+    def save(self, path: str):
+
+        # formato "folded" (pode ser aberto no speedscope.app ou convertido pelo flamegraph.pl).
+        stages = collections.defaultdict(list)
+
+        for (stage, stack), count in self.samples.items():
+            stages[stage].append(f"{stack} {count}")
+
+        files = []
+
+        for stage, lines in stages.items():
+            with open(file := f"{os.path.splitext(path)[0]}.{stage.replace(':', '_')}.folded", "w",
+                      encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            files.append(file)
+
+        return files
+
+
+class Tracer:
+
+    def __init__(self):
+        self.enabled = False
+        self.path: Optional[str] = None
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.thread_names = {}
+        self.sampler: Optional[Sampler] = None
+        self.start_time = time.perf_counter()
+        self.pid = os.getpid()
+
+    def enable(self, path: str, profile_stages: Optional[set] = None):
+        self.enabled = True
+        self.path = path
+        self.start_time = time.perf_counter()
+        if profile_stages:
+            self.sampler = Sampler(profile_stages)
+            self.sampler.start()
+
+    def now(self) -> float:
+        return (time.perf_counter() - self.start_time) * 1_000_000
+
+    def emit(self, event: dict):
+
+        tid = threading.get_ident()
+
+        event.update(pid=self.pid, tid=tid)
+
+        with self.lock:
+            if tid not in self.thread_names:
+                self.thread_names[tid] = threading.current_thread().name
+            self.events.append(event)
+
+    def begin(self, name: str, cat: str = "sync", **args):
+
+        if not self.enabled:
+            return
+
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+
+        self.local.stack.append((name, cat, args, self.now()))
+
+        if self.sampler and name in self.sampler.stages:
+            self.sampler.active[threading.get_ident()] = name
+
+    def end(self, name: Optional[str] = None, min_duration: float = 0, **args):
+
+        if not self.enabled or not (stack := getattr(self.local, "stack", None)):
+            return
+
+        if name is not None and all(s[0] != name for s in stack):
+            return
+
+        # fecha também as etapas internas que ficaram abertas (ex: erro durante o download).
+        while self.local.stack:
+
+            stage, cat, stage_args, ts = self.local.stack.pop()
+
+            if self.sampler and self.sampler.active.get(threading.get_ident()) == stage:
+                self.sampler.active.pop(threading.get_ident(), None)
+                for parent in reversed(self.local.stack):
+                    if parent[0] in self.sampler.stages:
+                        self.sampler.active[threading.get_ident()] = parent[0]
+                        break
+
+            if (dur := self.now() - ts) >= min_duration * 1_000_000:
+                self.emit({"name": stage, "cat": cat, "ph": "X", "ts": ts, "dur": dur,
+                           "args": dict(stage_args, **args) if stage == name or name is None else stage_args})
+
+            if name is None or stage == name:
+                break
+
+    def current(self) -> Optional[str]:
+        if stack := getattr(self.local, "stack", None):
+            return stack[-1][0]
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str = "sync", min_duration: float = 0, **args):
+
+        if not self.enabled:
+            yield
+            return
+
+        self.begin(name, cat, **args)
+        try:
+            yield
+        finally:
+            self.end(name, min_duration)
+
+    def instant(self, name: str, cat: str = "sync", **args):
+        if self.enabled:
+            self.emit({"name": name, "cat": cat, "ph": "i", "s": "t", "ts": self.now(), "args": args})
+
+    def save(self):
+
+        if not self.enabled:
+            return
+
+        files = []
+
+        if self.sampler:
+            self.sampler.stop()
+            files = self.sampler.save(self.path)
+
+        with self.lock:
+            events = [
+                {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                for tid, name in self.thread_names.items()
+            ] + self.events
+
+        # formato chrome trace event (pode ser aberto no chrome://tracing ou ui.perfetto.dev).
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+        print(f"\n\nTrace da sincronização salvo em: {os.path.abspath(self.path)}")
+
+        for file in files:
+            print(f"Amostras do profiler salvas em: {os.path.abspath(file)}")
+
+
+class YtdlStageHooks:
+
+    # as etapas internas do yt-dlp (extração, download e pós-processamento) são marcadas pelos hooks de progresso.
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+
+    def progress_hook(self, d: dict):
+        if d["status"] == "downloading" and self.tracer.current() != "download":
+            if self.tracer.current() == "extract":
+                self.tracer.end("extract")
+            self.tracer.begin("download", format_id=d.get("info_dict", {}).get("format_id"))
+        elif d["status"] in ("finished", "error") and self.tracer.current() == "download":
+            self.tracer.end("download", bytes=d.get("downloaded_bytes") or d.get("total_bytes"))
+
+    def postprocessor_hook(self, d: dict):
+        if d["status"] == "started":
+            if self.tracer.current() == "extract":
+                self.tracer.end("extract")
+            self.tracer.begin(f"postprocess:{d.get('postprocessor')}")
+        elif d["status"] == "finished":
+            self.tracer.end(f"postprocess:{d.get('postprocessor')}")
+
+    def add_to(self, args: dict):
+        args.setdefault("progress_hooks", []).append(self.progress_hook)
+        args.setdefault("postprocessor_hooks", []).append(self.postprocessor_hook)
+
+
+tracer = Tracer()
@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class TrackCache:
+
+    # resultados encontrados mudam raramente, já os não encontrados podem aparecer depois no spotify.
+    hit_ttl = 60 * 60 * 24 * 30
+    miss_ttl = 60 * 60 * 24
+
+    def __init__(self, path: str, hit_ttl: Optional[int] = None, miss_ttl: Optional[int] = None):
+        self.path = path
+        self.hit_ttl = hit_ttl or self.hit_ttl
+        self.miss_ttl = miss_ttl or self.miss_ttl
+        self.conn: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+
+        if self.conn:
+            return self.conn
+
+        if dirname := os.path.dirname(self.path):
+            os.makedirs(dirname, exist_ok=True)
+
+        # o arquivo pode ser usado ao mesmo tempo pelo rpc e pelo main.py
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "query TEXT PRIMARY KEY, "
+            "data TEXT, "
+            "expires_at REAL NOT NULL)"
+        )
+        self.conn = conn
+        return conn
+
+    def get(self, query: str, default=None):
+
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT data, expires_at FROM tracks WHERE query = ?", (query,)
+            ).fetchone()
+
+        if not row or row[1] < time.time():
+            return default
+
+        # resultado negativo (nenhuma música correspondente encontrada)
+        if row[0] is None:
+            return {}
+
+        return json.loads(row[0])
+
+    def set(self, query: str, data: Optional[dict]):
+
+        if data:
+            value = json.dumps(data)
+            expires_at = time.time() + self.hit_ttl
+        else:
+            value = None
+            expires_at = time.time() + self.miss_ttl
+
+        with self.lock:
+            self.connect().execute(
+                "INSERT OR REPLACE INTO tracks (query, data, expires_at) VALUES (?, ?, ?)",
+                (query, value, expires_at)
+            )
+
+    def update(self, items: dict):
+
+        now = time.time()
+
+        rows = [
+            (q, json.dumps(d), now + self.hit_ttl) if d else (q, None, now + self.miss_ttl)
+            for q, d in items.items()
+        ]
+
+        with self.lock:
+            conn = self.connect()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany("INSERT OR REPLACE INTO tracks (query, data, expires_at) VALUES (?, ?, ?)", rows)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def purge_expired(self):
+        with self.lock:
+            self.connect().execute("DELETE FROM tracks WHERE expires_at < ?", (time.time(),))
+
+    def close(self):
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
+    def __getitem__(self, query: str):
+        if (data := self.get(query)) is None:
+            raise KeyError(query)
+        return data
+
+    def __setitem__(self, query: str, data: Optional[dict]):
+        self.set(query, data)
+
+    def __contains__(self, query: str):
+        return self.get(query) is not None
@@ -0,0 +1,137 @@
+import random
+import re
+import time
+from typing import List, Optional
+
+from rapidfuzz import fuzz, process
+
+match_tags = ("mix", "remix", "extended")
+
+score_cutoff = 70
+
+tag_regex = re.compile("|".join(match_tags))
+
+
+class Candidates:
+
+    # strings normalizadas uma única vez e mantidas em listas paralelas (comparadas pelo extractOne).
+    __slots__ = ("tracks", "match_strings", "has_tag")
+
+    def __init__(self, tracks: List[dict]):
+        self.tracks = tracks
+        self.match_strings = []
+        self.has_tag = []
+
+        for t in tracks:
+            name = t["name"].lower()
+            self.match_strings.append(name + " - " + ", ".join(
+                a for a in [a["name"].lower() for a in t["artists"]] if a not in name
+            ))
+            self.has_tag.append(tag_regex.search(name) is not None)
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def to_dict(self, index: int) -> dict:
+        return track_to_dict(self.tracks[index])
+
+
+def track_to_dict(track: dict) -> dict:
+    return {
+        "name": track["name"],
+        "artist": track["artists"][0]["name"],
+        "album": track["album"]["name"],
+        "duration": track["duration_ms"] / 1000
+    }
+
+
+def query_has_tag(query: str) -> bool:
+    return tag_regex.search(query) is not None
+
+
+def build_candidates(*sources) -> Candidates:
+
+    # aceita resultados de busca do spotify ou listas de faixas de várias fontes ao mesmo tempo.
+    items = [s["tracks"]["items"] if isinstance(s, dict) else s for s in sources if s]
+
+    if len(items) == 1:
+        return Candidates(items[0])
+
+    tracks = []
+    seen = set()
+
+    for source in items:
+        for t in source:
+            if track_id := t.get("id"):
+                if track_id in seen:
+                    continue
+                seen.add(track_id)
+            tracks.append(t)
+
+    return Candidates(tracks)
+
+
+def best_candidate(query: str, candidates: Candidates) -> Optional[int]:
+
+    choices = candidates.match_strings
+
+    if query_has_tag(query):
+        choices = {i: c for i, c in enumerate(choices) if candidates.has_tag[i]}
+
+    if not choices:
+        return
+
+    result = process.extractOne(query, choices, scorer=fuzz.token_sort_ratio, processor=None, score_cutoff=score_cutoff)
+
+    if result and result[1] > score_cutoff:
+        return result[2]
+
+
+def best_match(query: str, *sources) -> Optional[dict]:
+    if (index := best_candidate(query, candidates := build_candidates(*sources))) is not None:
+        return candidates.to_dict(index)
+
+
+def make_fixture(size: int, seed: int = 0):
+
+    # gera consultas e resultados de busca no formato da api do spotify para testes de desempenho.
+    rnd = random.Random(seed)
+
+    words = ["love", "night", "dance", "heart", "fire", "dream", "light", "rain", "city", "summer", "remix",
+             "blue", "wild", "gold", "shadow", "storm", "extended", "mix", "river", "star"]
+
+    queries = []
+    results = []
+
+    for i in range(size):
+
+        artist = f"{rnd.choice(words)} {rnd.choice(words)}"
+        items = []
+
+        for n in range(10):
+            name = " ".join(rnd.choice(words) for _ in range(rnd.randint(2, 5)))
+            items.append({
+                "id": f"{i}-{n}",
+                "name": name.title(),
+                "artists": [{"name": artist.title()}, {"name": rnd.choice(words).title()}],
+                "album": {"name": rnd.choice(words).title()},
+                "duration_ms": rnd.randint(120000, 360000),
+            })
+
+        target = rnd.choice(items)
+        queries.append(f"{target['name']} - {artist}".lower())
+        results.append({"tracks": {"items": items}})
+
+    return queries, results
+
+
+if __name__ == '__main__':
+
+    queries, results = make_fixture(5000)
+
+    start = time.perf_counter()
+    matches = [best_match(q, r) for q, r in zip(queries, results)]
+    elapsed = time.perf_counter() - start
+
+    print(f"extractOne: {elapsed * 1000:.1f} ms | {len(matches)} consultas | "
+          f"{sum(1 for m in matches if m)} correspondências | {elapsed / len(matches) * 1e6:.1f} µs/consulta")
@@ -0,0 +1,184 @@
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import time
+from typing import Optional
+
+import mutagen
+
+from utils.library_index import LibraryIndex
+from utils.tags import media_exts
+
+quarantine_dirname = "corrompidos"
+
+# diferença máxima aceita entre a duração do arquivo e a duração informada na playlist.
+max_duration_diff = 5
+max_duration_ratio = 0.05
+
+
+def check_fast(path: str, expected_duration: Optional[float]):
+
+    if (size := os.path.getsize(path)) == 0:
+        return "arquivo vazio"
+
+    try:
+        info = mutagen.File(path).info
+    except Exception as e:
+        return f"cabeçalho inválido: {repr(e)}"
+
+    if expected_duration and not duration_matches(info.length, expected_duration):
+        return f"duração incompleta: {int(info.length)}s de {int(expected_duration)}s"
+
+    # a duração do cabeçalho não muda quando o arquivo é cortado, então o tamanho também é comparado com o bitrate.
+    if bitrate := getattr(info, "bitrate", 0):
+        if not duration_matches(size_duration := size * 8 / bitrate, info.length, only_shorter=True):
+            return f"arquivo truncado: {int(size_duration)}s de {int(info.length)}s"
+
+
+def duration_matches(duration: float, expected: float, only_shorter: bool = False):
+    diff = expected - duration if only_shorter else abs(duration - expected)
+    return diff <= max(max_duration_diff, expected * max_duration_ratio)
+
+
+def check_deep(path: str, expected_duration: Optional[float], ffmpeg: str = "ffmpeg"):
+
+    if error := check_fast(path, expected_duration):
+        return error
+
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-nostats", "-v", "error", "-i", path, "-f", "null", "-"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+
+    output = result.stderr.decode(errors="replace").strip()
+
+    if result.returncode != 0 or output:
+        return f"erro na decodificação: {output[:200]}"
+
+
+def unindexed_files(index: LibraryIndex, indexed: set, playlist_ids: Optional[list] = None):
+
+    if not os.path.isdir(index.data_dir):
+        return
+
+    for playlist_dir in sorted(os.listdir(index.data_dir)):
+
+        # pastas internas (área temporária dos downloads, thumbnails e arquivos já separados).
+        if playlist_dir.startswith(".") or playlist_dir == quarantine_dirname:
+            continue
+
+        if playlist_ids and playlist_dir not in playlist_ids:
+            continue
+
+        if not os.path.isdir(f"{index.data_dir}/{playlist_dir}"):
+            continue
+
+        for f in sorted(os.listdir(f"{index.data_dir}/{playlist_dir}")):
+            if f.endswith(tuple(f".{e}" for e in media_exts)) and f"{playlist_dir}/{f}" not in indexed:
+                yield {"playlist_id": playlist_dir, "video_id": os.path.splitext(f)[0], "file": f"{playlist_dir}/{f}",
+                       "title": f, "duration": None}
+
+
+def verify_library(out_dir: str, deep: bool = False, ffmpeg: Optional[str] = None, workers: Optional[int] = None,
+                   playlist_ids: Optional[list] = None):
+
+    index = LibraryIndex(out_dir)
+
+    level = "deep" if deep else "fast"
+
+    pending = []
+    skipped = 0
+
+    for row in index.tracks(with_file=True):
+
+        if playlist_ids and row["playlist_id"] not in playlist_ids:
+            continue
+
+        size, mtime = index.file_stat(row["file"])
+
+        if size is None:
+            continue
+
+        # arquivos sem alterações desde a última verificação são ignorados.
+        if index.get_verify(row["file"], size, mtime, level):
+            skipped += 1
+            continue
+
+        pending.append((row, size, mtime))
+
+    # arquivos ainda não registrados no índice (ex: biblioteca que ainda não foi sincronizada com o índice).
+    indexed = {r["file"] for r in index.execute("SELECT DISTINCT file FROM tracks WHERE file IS NOT NULL")}
+
+    for row in unindexed_files(index, indexed, playlist_ids):
+
+        size, mtime = index.file_stat(row["file"])
+
+        if index.get_verify(row["file"], size, mtime, level):
+            skipped += 1
+            continue
+
+        pending.append((row, size, mtime))
+
+    if not pending:
+        print(f"\n\nVerificação ({level}): nenhum arquivo novo ou alterado em: {out_dir}")
+        return []
+
+    print(f"\n\nVerificando ({level}) {len(pending)} arquivo{'s'[:len(pending) ^ 1]} em: {out_dir} "
+          f"({skipped} sem alteração)")
+
+    failed = []
+    results = []
+
+    # a leitura do cabeçalho (mutagen) e a decodificação usam cpu: processos separados, sem disputar o GIL.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+
+        futures = {}
+
+        for row, size, mtime in pending:
+            path = index.abs_path(row["file"])
+            if deep:
+                future = executor.submit(check_deep, path, row["duration"], ffmpeg or "ffmpeg")
+            else:
+                future = executor.submit(check_fast, path, row["duration"])
+            futures[future] = (row, size, mtime)
+
+        for future in concurrent.futures.as_completed(futures):
+
+            row, size, mtime = futures[future]
+
+            try:
+                error = future.result()
+            except Exception as e:
+                error = repr(e)
+
+            results.append((row["file"], size, mtime, level, int(not error), error, time.time()))
+
+            if error:
+                failed.append((row, error))
+
+    index.set_verify(results)
+
+    quarantine_dir = f"{index.data_dir}/{quarantine_dirname}"
+
+    # vídeos deletados/privados (na pasta deleted ou marcados no índice) não podem ser baixados novamente.
+    unavailable = index.unavailable_files()
+    kept = 0
+
+    # os arquivos com problema são movidos pra outra pasta e serão baixados novamente na sincronização.
+    for row, error in failed:
+        print(f"Arquivo com problema: {row['file']} ({row['title']}) -> {error}")
+        if row["file"] in unavailable:
+            kept += 1
+            continue
+        os.makedirs(quarantine_dir, exist_ok=True)
+        shutil.move(index.abs_path(row["file"]), f"{quarantine_dir}/{row['file'].replace('/', '_')}")
+        index.set_file(row["playlist_id"], row["video_id"], None)
+
+    if failed:
+        print(f"{len(failed)} arquivo{'s'[:len(failed) ^ 1]} com problema. Os que ainda estão disponíveis no youtube "
+              f"foram movidos para: {quarantine_dir} (e serão baixados novamente)")
+    if kept:
+        print(f"{kept} arquivo{'s'[:kept ^ 1]} de vídeos deletados/privados mantido{'s'[:kept ^ 1]} (única cópia).")
+
+    return failed
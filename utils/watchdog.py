@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from typing import Optional
+
+import psutil
+
+# intervalo entre as verificações dos downloads em andamento.
+check_interval = 2
+
+
+class DownloadStalled(Exception):
+    pass
+
+
+def ffmpeg_children(yt_id: str) -> list:
+
+    # processos do ffmpeg (conversão ou download) do vídeo, identificados pelo id no nome dos arquivos temporários.
+    procs = []
+
+    try:
+        children = psutil.Process().children(recursive=True)
+    except psutil.Error:
+        return procs
+
+    for proc in children:
+        try:
+            if "ffmpeg" in proc.name().lower() and any(yt_id in arg for arg in proc.cmdline()):
+                procs.append(proc)
+        except psutil.Error:
+            continue
+
+    return procs
+
+
+def cpu_time(procs: list) -> float:
+    total = 0.0
+    for proc in procs:
+        try:
+            total += sum(proc.cpu_times()[:2])
+        except psutil.Error:
+            continue
+    return total
+
+
+class DownloadJob:
+
+    def __init__(self, yt_id: str, deadline: float, stall_timeout: float):
+        self.yt_id = yt_id
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + deadline
+        self.stall_timeout = stall_timeout
+        # a extração não chama os hooks do yt-dlp: até o primeiro progresso vale apenas o tempo máximo.
+        self.last_progress: Optional[float] = None
+        self.downloaded_bytes = 0
+        self.stage = "extract"
+        self.ffmpeg_cpu = 0.0
+        self.cancelled: Optional[str] = None
+
+    def progress_hook(self, d: dict):
+
+        if self.cancelled:
+            raise DownloadStalled(self.cancelled)
+
+        if d["status"] == "downloading":
+            self.stage = "download"
+            if (downloaded := d.get("downloaded_bytes") or 0) != self.downloaded_bytes or self.last_progress is None:
+                self.downloaded_bytes = downloaded
+                self.last_progress = time.monotonic()
+
+        elif d["status"] == "finished":
+            self.stage = "postprocess"
+            self.last_progress = time.monotonic()
+
+    def postprocessor_hook(self, d: dict):
+
+        if self.cancelled:
+            raise DownloadStalled(self.cancelled)
+
+        self.stage = "postprocess"
+        self.last_progress = time.monotonic()
+
+    def restart(self):
+        # nova tentativa (ex: em outra saída de rede): a extração começa de novo, sem os hooks.
+        self.stage = "extract"
+        self.last_progress = None
+        self.downloaded_bytes = 0
+
+    def add_to(self, args: dict):
+        args.setdefault("progress_hooks", []).append(self.progress_hook)
+        args.setdefault("postprocessor_hooks", []).append(self.postprocessor_hook)
+
+    def check(self, now: float) -> Optional[str]:
+
+        # o ffmpeg não informa o progresso, então o tempo de cpu dele é usado pra saber se ainda está trabalhando.
+        if self.stage == "postprocess" or self.stage == "download":
+            if (cpu := cpu_time(ffmpeg_children(self.yt_id))) != self.ffmpeg_cpu:
+                self.ffmpeg_cpu = cpu
+                self.last_progress = now
+
+        if now > self.deadline:
+            return f"Download travado: tempo máximo excedido ({int(now - self.started_at)}s, etapa: {self.stage})"
+
+        if self.last_progress is not None and now - self.last_progress > self.stall_timeout:
+            return f"Download travado: sem progresso por {int(now - self.last_progress)}s (etapa: {self.stage})"
+
+    def cancel(self, reason: str):
+
+        self.cancelled = reason
+
+        for proc in ffmpeg_children(self.yt_id):
+            try:
+                proc.kill()
+            except psutil.Error:
+                pass
+
+
+class DownloadWatchdog:
+
+    def __init__(self, stall_timeout: float = 120, base_timeout: float = 600, duration_factor: float = 2,
+                 max_retries: int = 2, retry_base_delay: float = 30):
+        self.stall_timeout = stall_timeout
+        self.base_timeout = base_timeout
+        self.duration_factor = duration_factor
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.cancelled = 0
+
+    @classmethod
+    def load(cls) -> "DownloadWatchdog":
+        return cls(
+            stall_timeout=float(os.getenv("DOWNLOAD_STALL_TIMEOUT") or 120),
+            base_timeout=float(os.getenv("DOWNLOAD_TIMEOUT") or 600),
+            max_retries=int(os.getenv("DOWNLOAD_STALL_RETRIES") or 2),
+        )
+
+    def retry_delay(self, stalls: int) -> float:
+        return self.retry_base_delay * 2 ** (max(stalls, 1) - 1)
+
+    def watch(self, yt_id: str, duration: Optional[float] = None) -> DownloadJob:
+
+        # vídeos longos demoram mais pra converter, por isso o tempo máximo também depende da duração.
+        job = DownloadJob(yt_id, self.base_timeout + (duration or 0) * self.duration_factor, self.stall_timeout)
+
+        with self.lock:
+            self.jobs[id(job)] = job
+            if not self.thread or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True, name="download_watchdog")
+                self.thread.start()
+
+        return job
+
+    def done(self, job: DownloadJob):
+        with self.lock:
+            self.jobs.pop(id(job), None)
+
+    def run(self):
+
+        while True:
+
+            time.sleep(check_interval)
+
+            with self.lock:
+                if not self.jobs:
+                    self.thread = None
+                    return
+                jobs = list(self.jobs.values())
+
+            now = time.monotonic()
+
+            for job in jobs:
+
+                if job.cancelled or not (reason := job.check(now)):
+                    continue
+
+                print(f"{reason}: https://www.youtube.com/watch?v={job.yt_id}")
+                job.cancel(reason)
+                self.cancelled += 1
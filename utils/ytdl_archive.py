@@ -0,0 +1,134 @@
+import os
+import re
+import shutil
+from typing import Iterable, Optional
+
+from utils.library_index import LibraryIndex
+from utils.tags import media_ext, media_exts
+
+# linha do arquivo do --download-archive do yt-dlp: "<extractor> <id>"
+archive_line_regex = re.compile(r"^\s*(\S+)\s+(\S+)\s*$")
+
+# nome padrão do yt-dlp: "%(title)s [%(id)s].%(ext)s"
+bracket_id_regex = re.compile(r"\[([-a-zA-Z0-9_]{11})]")
+loose_id_regex = re.compile(r"(?<![-\w])[-a-zA-Z0-9_]{11}(?![-\w])")
+
+
+def read_archive(path: str) -> set:
+    ids = set()
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if (m := archive_line_regex.match(line)) and m.group(1).lower() == "youtube":
+                ids.add(m.group(2))
+    return ids
+
+
+def write_archive(path: str, video_ids: Iterable[str]) -> int:
+
+    # as entradas já existentes (inclusive de outros sites) são mantidas.
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            lines = [l.rstrip("\n") for l in f if l.strip()]
+    except FileNotFoundError:
+        lines = []
+
+    known = {(m.group(1).lower(), m.group(2)) for l in lines if (m := archive_line_regex.match(l))}
+
+    new_lines = [f"youtube {v}" for v in sorted(set(video_ids)) if ("youtube", v) not in known]
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        f.write("".join(f"{l}\n" for l in lines + new_lines))
+    os.replace(f"{path}.tmp", path)
+
+    return len(new_lines)
+
+
+def export_archive(path: str, out_dirs: list) -> int:
+
+    video_ids = set()
+
+    for out_dir in out_dirs:
+        library = LibraryIndex(out_dir)
+        if not os.path.isfile(library.path):
+            continue
+        video_ids.update(r["video_id"] for r in library.tracks(with_file=True))
+        library.close()
+
+    return write_archive(path, video_ids)
+
+
+class YtdlImport:
+
+    def __init__(self, mode: str = "link"):
+        self.mode = mode
+        self.archive_ids = set()
+        self.files = {}
+        self.moved = set()
+        self.imported = 0
+
+    def load(self, paths: list):
+
+        dirs = []
+
+        for path in paths:
+            if os.path.isdir(path):
+                dirs.append(path)
+            elif os.path.isfile(path):
+                self.archive_ids.update(read_archive(path))
+            else:
+                print(f"Caminho para importação não encontrado: {path}")
+
+        # os ids do archive são usados para reconhecer arquivos salvos com outros padrões de nome.
+        for directory in dirs:
+            self.scan(directory)
+
+        return self
+
+    def match_id(self, filename: str) -> Optional[str]:
+
+        stem = os.path.splitext(filename)[0]
+
+        if m := bracket_id_regex.findall(stem):
+            return m[-1]
+
+        if loose_id_regex.fullmatch(stem):
+            return stem
+
+        for candidate in reversed(loose_id_regex.findall(stem)):
+            if candidate in self.archive_ids:
+                return candidate
+
+    def scan(self, directory: str):
+        for root, _, files in os.walk(directory):
+            for f in files:
+                if media_ext(f) not in media_exts:
+                    continue
+                if (yt_id := self.match_id(f)) and yt_id not in self.files:
+                    self.files[yt_id] = f"{root}/{f}"
+
+    def take(self, yt_id: str, exts: tuple, dest_dir: str) -> Optional[str]:
+
+        if not (src := self.files.get(yt_id)) or media_ext(src) not in exts or not os.path.isfile(src):
+            return None
+
+        dst = f"{dest_dir}/{yt_id}.{media_ext(src)}"
+
+        if self.mode == "move" and yt_id not in self.moved:
+            shutil.move(src, dst)
+            # o mesmo vídeo em outras playlists recebe um hardlink/cópia do arquivo já movido (que continua na
+            # primeira playlist).
+            self.files[yt_id] = dst
+            self.moved.add(yt_id)
+        else:
+            try:
+                os.link(src, dst)
+            except OSError:
+                # outro disco (ou sistema de arquivos sem suporte a hardlink).
+                shutil.copy2(src, dst)
+
+        self.imported += 1
+
+        return dst
@@ -0,0 +1,176 @@
+import json
+import multiprocessing
+import os
+import queue
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import yt_dlp
+from yt_dlp.utils import DownloadError
+
+from utils.watchdog import DownloadStalled
+
+# intervalo mínimo entre as mensagens de progresso enviadas por cada processo.
+progress_interval = 0.5
+
+# instâncias do YoutubeDL mantidas por processo (uma por perfil/saída de rede).
+max_instances = 8
+
+hook_keys = ("progress_hooks", "postprocessor_hooks")
+
+
+def worker_main(conn):
+
+    instances = OrderedDict()
+    last_progress = [0.0]
+
+    def progress_hook(d: dict):
+        now = time.monotonic()
+        if d["status"] == "downloading" and now - last_progress[0] < progress_interval:
+            return
+        last_progress[0] = now
+        conn.send(("progress", d["status"], d.get("downloaded_bytes"), d.get("total_bytes"), d.get("elapsed"),
+                   d.get("info_dict", {}).get("format_id")))
+
+    def postprocessor_hook(d: dict):
+        conn.send(("postprocess", d["status"], d.get("postprocessor")))
+
+    while True:
+
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        if job is None:
+            break
+
+        yt_id, params = job
+
+        # o YoutubeDL (extratores, postprocessors e cache do player) é reaproveitado entre os downloads.
+        if (ydl := instances.get(key := json.dumps(params, sort_keys=True, default=str))) is None:
+            ydl = instances[key] = yt_dlp.YoutubeDL(params)
+            ydl.add_progress_hook(progress_hook)
+            ydl.add_postprocessor_hook(postprocessor_hook)
+            if len(instances) > max_instances:
+                instances.popitem(last=False)[1].close()
+        else:
+            instances.move_to_end(key)
+
+        try:
+            r = ydl.extract_info(url=f"https://www.youtube.com/watch?v={yt_id}")
+            # apenas o necessário pra sincronização (o info_dict completo tem centenas de KB).
+            conn.send(("done", {
+                "requested_downloads": [{"filepath": r["requested_downloads"][0]["filepath"]}],
+                "duration": r.get("duration"),
+                "title": r.get("title"),
+                "uploader": r.get("uploader"),
+            }))
+        except Exception as e:
+            conn.send(("error", type(e).__name__, str(e)))
+
+    for ydl in instances.values():
+        ydl.close()
+
+
+class YtdlWorker:
+
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=worker_main, args=(child_conn,), daemon=True, name="ytdl_worker")
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class YtdlWorkerPool:
+
+    def __init__(self, size: int):
+        self.size = size
+        self.ctx = multiprocessing.get_context("spawn")
+        self.idle = queue.Queue()
+        self.workers = []
+        for _ in range(size):
+            self.workers.append(worker := YtdlWorker(self.ctx))
+            self.idle.put(worker)
+
+    @classmethod
+    def load(cls) -> Optional["YtdlWorkerPool"]:
+        if not (value := (os.getenv("YTDL_PROCESS_WORKERS") or "").strip().lower()) or value == "0":
+            return None
+        return cls((os.cpu_count() or 1) if value == "auto" else int(value))
+
+    def replace(self, worker: YtdlWorker) -> YtdlWorker:
+        worker.kill()
+        self.workers.remove(worker)
+        self.workers.append(new_worker := YtdlWorker(self.ctx))
+        return new_worker
+
+    def run(self, yt_id: str, params: dict, job=None) -> dict:
+
+        hooks = {k: params.get(k) or [] for k in hook_keys}
+
+        worker = self.idle.get()
+
+        finished = False
+
+        try:
+            worker.conn.send((yt_id, {k: v for k, v in params.items() if k not in hook_keys}))
+
+            while True:
+
+                # o download cancelado pelo watchdog finaliza o processo inteiro (inclusive o ffmpeg).
+                if job and job.cancelled:
+                    raise DownloadStalled(job.cancelled)
+
+                if not worker.conn.poll(1):
+                    if not worker.process.is_alive():
+                        raise Exception(f"O processo do download foi finalizado (código: {worker.process.exitcode})")
+                    continue
+
+                msg = worker.conn.recv()
+
+                if msg[0] == "progress":
+                    _, status, downloaded_bytes, total_bytes, elapsed, format_id = msg
+                    for hook in hooks["progress_hooks"]:
+                        hook({"status": status, "downloaded_bytes": downloaded_bytes, "total_bytes": total_bytes,
+                              "elapsed": elapsed, "info_dict": {"id": yt_id, "format_id": format_id}})
+
+                elif msg[0] == "postprocess":
+                    for hook in hooks["postprocessor_hooks"]:
+                        hook({"status": msg[1], "postprocessor": msg[2], "info_dict": {"id": yt_id}})
+
+                elif msg[0] == "done":
+                    finished = True
+                    return msg[1]
+
+                else:
+                    finished = True
+                    _, error_type, message = msg
+                    raise DownloadError(message) if error_type == "DownloadError" else Exception(message)
+
+        finally:
+            # interrompido no meio do download (cancelado, erro num hook ou processo finalizado): o processo é trocado.
+            if not finished:
+                worker = self.replace(worker)
+            self.idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers.clear()